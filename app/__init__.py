@@ -10,6 +10,108 @@ def create_app(test_config=None):
     app.config.from_mapping(
         SECRET_KEY=os.environ.get('SECRET_KEY', 'dev'),
         DATABASE=os.path.join(app.instance_path, 'mindsight.db'),
+        ENTRIES_PAGE_SIZE=20,
+        # Prometheus /metrics endpoint and Server-Timing response headers
+        METRICS_ENABLED=False,
+        METRICS_TOKEN=None,
+        SERVER_TIMING=False,
+        # Response compression and browser caching of static files
+        HTTP_COMPRESSION=True,
+        COMPRESS_MIN_SIZE=500,
+        COMPRESS_LEVEL=6,
+        STATIC_MAX_AGE=365 * 24 * 3600,
+        EXPORT_CHUNK_SIZE=1000,
+        # `flask compact-entries`: compress entries older than CODEC_MIN_AGE_DAYS
+        # or larger than CODEC_MIN_SIZE bytes with a dictionary trained on the
+        # journal
+        CODEC_MIN_AGE_DAYS=180,
+        CODEC_MIN_SIZE=2048,
+        CODEC_LEVEL=9,
+        CODEC_DICTIONARY_SIZE=32 * 1024,
+        CODEC_TRAIN_SAMPLE=2000,
+        CODEC_BATCH_SIZE=500,
+        IMPORT_CHUNK_SIZE=1000,
+        # Bulk deletes and `flask apply-retention` remove entries
+        # DELETE_CHUNK_SIZE at a time, each chunk its own transaction, and
+        # return free pages to the file system VACUUM_STEP_PAGES at a time
+        DELETE_CHUNK_SIZE=500,
+        DELETE_CHUNK_PAUSE=0.02,
+        # Most entries one delete request removes; larger ranges take
+        # several submissions or `flask apply-retention`
+        DELETE_REQUEST_LIMIT=2000,
+        VACUUM_STEP_PAGES=256,
+        VACUUM_STEP_PAUSE=0.05,
+        # Rendered entry cards: an in-process LRU of FRAGMENT_CACHE_SIZE cards
+        # and, with FRAGMENT_CACHE_PATH set, an SQLite file shared by every
+        # worker process (it holds entry text, so keep it as private as the
+        # database)
+        FRAGMENT_CACHE_SIZE=4096,
+        FRAGMENT_CACHE_PATH=None,
+        FRAGMENT_CACHE_MAX_ROWS=100_000,
+        # Logged-in user lookup
+        USER_CACHE_TTL=60,
+        USER_CACHE_SIZE=10_000,
+        # Trust the identity in the signed session cookie without checking
+        # the user still exists, e.g. after `flask init-db` or a restore
+        SESSION_USER_IDENTITY=False,
+        # Password hashing, run in worker processes
+        PASSWORD_HASH_METHOD='scrypt:32768:8:1',
+        PASSWORD_SALT_LENGTH=16,
+        PASSWORD_HASH_WORKERS=2,
+        PASSWORD_HASH_QUEUE_DEPTH=8,
+        PASSWORD_HASH_QUEUE_TIMEOUT=0.5,
+        # Register/login attempts allowed per client IP and per username
+        LOGIN_RATE_LIMIT=10,
+        LOGIN_RATE_WINDOW=60,
+        # SQLite connection pooling and tuning
+        DATABASE_POOL=True,
+        SQLITE_AUTO_VACUUM='INCREMENTAL',
+        SQLITE_JOURNAL_MODE='WAL',
+        SQLITE_SYNCHRONOUS='NORMAL',
+        SQLITE_BUSY_TIMEOUT=5000,
+        SQLITE_MMAP_SIZE=64 * 1024 * 1024,
+        SQLITE_CACHE_SIZE=-16000,
+        # Spread users' entries over this many SQLite files (0: one file).
+        # DATABASE then only holds users and shared tables; shard files are
+        # named after it unless DATABASE_SHARD_PATH (with {n}) is set
+        DATABASE_SHARDS=0,
+        DATABASE_SHARD_PATH=None,
+        # Background analysis queue
+        ANALYSIS_WORKERS=2,
+        ANALYSIS_MAX_ATTEMPTS=5,
+        ANALYSIS_BACKOFF=2.0,
+        ANALYSIS_BACKOFF_MAX=600.0,
+        ANALYSIS_LEASE=300.0,
+        ANALYSIS_POLL_INTERVAL=1.0,
+        ANALYSIS_BATCH_SIZE=10,
+        # Stream new entries' analyses to the list page as they are written;
+        # their jobs wait ANALYSIS_STREAM_GRACE seconds for the page to claim them
+        ANALYSIS_STREAMING=False,
+        ANALYSIS_STREAM_GRACE=10.0,
+        ANALYSIS_STREAM_WAIT=60.0,
+        # Analyzer backend: 'gemini', 'lexicon' (offline, in-process) or
+        # 'tiered' (lexicon first, Gemini for unclear moods or reflections)
+        ANALYZER='gemini',
+        ANALYZER_CONFIDENCE=0.6,
+        ANALYZER_LLM_REFLECTIONS=False,
+        # Multi-entry Gemini requests
+        GEMINI_BATCH_SIZE=10,
+        GEMINI_BATCH_TOKEN_BUDGET=6000,
+        # Gemini call deadline, circuit breaker and adaptive concurrency
+        GEMINI_TIMEOUT=20.0,
+        GEMINI_MAX_RETRIES=0,
+        GEMINI_BREAKER_THRESHOLD=5,
+        GEMINI_BREAKER_COOLDOWN=30.0,
+        GEMINI_CONCURRENCY_MIN=1,
+        GEMINI_CONCURRENCY_MAX=8,
+        GEMINI_LATENCY_TARGET=10.0,
+        # Import the Gemini SDK at startup instead of on the first analysis
+        GEMINI_PREWARM=False,
+        # Analysis result cache (in-process LRU + SQLite table)
+        ANALYSIS_CACHE_SIZE=1024,
+        ANALYSIS_CACHE_TTL=30 * 24 * 3600,
+        ANALYSIS_CACHE_MAX_ROWS=100_000,
+        ANALYSIS_CACHE_PERSIST=True,
     )
     
     if test_config is None:
@@ -28,9 +130,67 @@ def create_app(test_config=None):
     # Register database functions
     from . import db
     db.init_app(app)
+
+    # Register request timing hooks and /metrics, first so they time the rest
+    from . import metrics
+    metrics.init_app(app)
+
+    # Register response compression and fingerprinted static URLs
+    from . import httpcache
+    httpcache.init_app(app)
+
+    # Register the rendered entry card cache
+    from . import fragments
+    fragments.init_app(app)
+
+    # Register the Gemini analysis cache
+    from . import gemini
+    gemini.init_app(app)
+
+    # Register the analyzer backend
+    from . import analyzers
+    analyzers.init_app(app)
+
+    # Register full-text search commands
+    from . import search
+    search.init_app(app)
+
+    # Register mood insights commands
+    from . import insights
+    insights.init_app(app)
+
+    # Register export commands
+    from . import export
+    export.init_app(app)
+
+    # Register import commands
+    from . import importer
+    importer.init_app(app)
+
+    # Register background analysis workers
+    from . import analysis
+    analysis.init_app(app)
+
+    # Register the reanalyze command
+    from . import reanalysis
+    reanalysis.init_app(app)
+
+    # Register the entry compaction command
+    from . import compaction
+    compaction.init_app(app)
+
+    # Register the retention and vacuum commands
+    from . import retention
+    retention.init_app(app)
+
+    # Register the shard rebalancing command
+    from . import shards
+    shards.init_app(app)
     
     # Register authentication blueprint
-    from . import auth
+    from . import auth, passwords
+    passwords.init_app(app)
+    auth.init_app(app)
     app.register_blueprint(auth.bp)
     
     # Register entries blueprint
@@ -0,0 +1,359 @@
+import os
+import threading
+import time
+
+import click
+from flask import current_app
+
+from app import analyzers, gemini
+from app.db import get_db, get_shard, shards
+from app.moods import categorize_mood
+
+
+def enqueue(db, entry_id, delay=0.0):
+    """Queue an entry for background analysis. The caller commits.
+
+    With a ``delay`` the workers leave the job alone for that many seconds.
+    """
+    db.execute(
+        'INSERT OR IGNORE INTO analysis_jobs (entry_id, run_after) VALUES (?, ?)',
+        (entry_id, time.time() + delay if delay else 0)
+    )
+
+
+def submit(db, entry_id, text, delay=0.0):
+    """Analyze a new entry as far as the analyzer can right away. The caller commits.
+
+    An instant local result is stored at once; the entry is queued for the
+    background workers unless that result is final. Returns True if a job
+    was queued.
+    """
+    quick = analyzers.current_analyzer().quick(text)
+    if quick is not None:
+        result, source, final = quick
+        store_analysis(db, entry_id, result, source)
+        if final:
+            return False
+    enqueue(db, entry_id, delay)
+    return True
+
+
+def analyze_texts(texts):
+    """Analyze a list of entry texts with the configured analyzer.
+
+    Returns one ``(analysis, (model, version))`` pair per text.
+    """
+    return analyzers.current_analyzer().analyze(texts)
+
+
+def store_analysis(db, entry_id, analysis, source=None):
+    """Write an analysis result onto its entry. The caller commits.
+
+    ``source`` is the (model, version) that produced it, the current Gemini
+    model and prompt by default. Fallback placeholders are stored with
+    status 'failed' so they can be told apart from real analyses and
+    redone later.
+    """
+    model, version = source or (gemini.current_model(), gemini.PROMPT_VERSION)
+    db.execute(
+        'UPDATE entries SET mood = ?, reflection = ?, mood_category = ?,'
+        ' analysis_status = ?, analysis_model = ?, analysis_prompt_version = ?'
+        ' WHERE id = ?',
+        (analysis['mood'], analysis['reflection'],
+         categorize_mood(analysis['mood']),
+         'failed' if gemini.is_fallback(analysis) else 'ok',
+         model, version, entry_id)
+    )
+
+
+def claim_jobs(db, limit=1):
+    """Lock up to ``limit`` due jobs for this worker and return them.
+
+    Jobs whose lock is older than ``ANALYSIS_LEASE`` seconds belong to a worker
+    that died mid-job, so they are claimed again.
+    """
+    now = time.time()
+    lease = current_app.config['ANALYSIS_LEASE']
+
+    db.execute('BEGIN IMMEDIATE')
+    try:
+        jobs = db.execute(
+            'SELECT j.id, j.entry_id, j.attempts + 1 AS attempts,'
+            ' codec_decode(e.text) AS text'
+            ' FROM analysis_jobs j JOIN entries e ON e.id = j.entry_id'
+            ' WHERE j.run_after <= ?'
+            ' AND (j.locked_at IS NULL OR j.locked_at < ?)'
+            ' ORDER BY j.run_after, j.id LIMIT ?',
+            (now, now - lease, limit)
+        ).fetchall()
+        db.executemany(
+            'UPDATE analysis_jobs SET locked_at = ?, attempts = attempts + 1'
+            ' WHERE id = ?',
+            [(now, job['id']) for job in jobs]
+        )
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    return jobs
+
+
+def _retry(db, job, error):
+    """Release a job so it runs again after an exponential backoff."""
+    config = current_app.config
+    delay = min(
+        config['ANALYSIS_BACKOFF'] * 2 ** (job['attempts'] - 1),
+        config['ANALYSIS_BACKOFF_MAX']
+    )
+    db.execute(
+        'UPDATE analysis_jobs SET locked_at = NULL, run_after = ?, last_error = ?'
+        ' WHERE id = ?',
+        (time.time() + delay, error, job['id'])
+    )
+
+
+def _defer(db, job, until, reason='circuit open'):
+    """Release a job until ``until`` without counting this attempt against it."""
+    db.execute(
+        'UPDATE analysis_jobs SET locked_at = NULL, run_after = ?,'
+        ' attempts = attempts - 1, last_error = COALESCE(?, last_error)'
+        ' WHERE id = ?',
+        (until, reason, job['id'])
+    )
+
+
+def _record(db, job, analysis, source, resume_at):
+    """Store a claimed job's result, or put the job back to try again later."""
+    if gemini.is_fallback(analysis) and resume_at is not None:
+        # While Gemini is known to be down, waiting is not the entry's fault
+        _defer(db, job, resume_at)
+    elif (gemini.is_fallback(analysis)
+            and job['attempts'] < current_app.config['ANALYSIS_MAX_ATTEMPTS']):
+        _retry(db, job, 'analysis unavailable')
+    else:
+        store_analysis(db, job['entry_id'], analysis, source)
+        db.execute('DELETE FROM analysis_jobs WHERE id = ?', (job['id'],))
+
+
+def process_jobs(db, jobs):
+    """Analyze claimed jobs and record the outcome of each one."""
+    try:
+        results = analyze_texts([job['text'] for job in jobs])
+    except Exception as e:
+        current_app.logger.error(f'Analysis failed: {e}')
+        results = [(gemini.essential_fallback, None)] * len(jobs)
+
+    resume_at = analyzers.current_analyzer().unavailable_until()
+    for job, (analysis, source) in zip(jobs, results):
+        _record(db, job, analysis, source, resume_at)
+    db.commit()
+
+
+def claim_entry(db, entry_id):
+    """Lock the queued job of one entry, as ``claim_jobs`` does for due jobs.
+
+    Returns the job, or None if the entry has no job or a worker holds it.
+    """
+    now = time.time()
+    lease = current_app.config['ANALYSIS_LEASE']
+
+    db.execute('BEGIN IMMEDIATE')
+    try:
+        job = db.execute(
+            'SELECT id, entry_id, attempts + 1 AS attempts FROM analysis_jobs'
+            ' WHERE entry_id = ? AND (locked_at IS NULL OR locked_at < ?)',
+            (entry_id, now - lease)
+        ).fetchone()
+        if job is not None:
+            db.execute(
+                'UPDATE analysis_jobs SET locked_at = ?, attempts = attempts + 1'
+                ' WHERE id = ?',
+                (now, job['id'])
+            )
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    return job
+
+
+def _entry_state(db, entry_id):
+    row = db.execute(
+        'SELECT e.mood, codec_decode(e.reflection) AS reflection, e.analysis_status,'
+        ' j.id IS NOT NULL AS pending'
+        ' FROM entries e LEFT JOIN analysis_jobs j ON j.entry_id = e.id'
+        ' WHERE e.id = ?', (entry_id,)
+    ).fetchone()
+    return {
+        'mood': row['mood'], 'reflection': row['reflection'],
+        'status': row['analysis_status'], 'pending': bool(row['pending']),
+    }
+
+
+def stream_entry(user_id, entry_id, text):
+    """Analyze one entry for someone watching, yielding events as they come.
+
+    Yields ``('mood', mood)`` and ``('reflection', text)`` while the analyzer
+    streams, then ``('done', state)`` with what is stored for the entry.
+    The entry's job is claimed first so no worker analyzes it twice; if a
+    worker already has it, this waits for the worker instead, sending
+    ``('ping', None)`` now and then. An entry without a job is only replayed.
+    """
+    db = get_db(user_id)
+    job = claim_entry(db, entry_id)
+    if job is None:
+        interval = current_app.config['ANALYSIS_POLL_INTERVAL']
+        deadline = time.monotonic() + current_app.config['ANALYSIS_STREAM_WAIT']
+        state = _entry_state(db, entry_id)
+        while state['pending'] and time.monotonic() < deadline:
+            yield 'ping', None
+            time.sleep(interval)
+            state = _entry_state(db, entry_id)
+        yield 'done', state
+        return
+
+    analyzer = analyzers.current_analyzer()
+    recorded = False
+    try:
+        for event, value in analyzer.stream(text):
+            if event == 'done':
+                analysis, source = value
+                _record(db, job, analysis, source, analyzer.unavailable_until())
+                db.commit()
+                recorded = True
+            else:
+                yield event, value
+    finally:
+        if not recorded:
+            # The viewer left mid-stream; hand the job back to the workers
+            _defer(db, job, time.time(), None)
+            db.commit()
+    yield 'done', _entry_state(db, entry_id)
+
+
+def run_pending(limit=None):
+    """Process due jobs in the current app context until none are left.
+
+    With ``DATABASE_SHARDS`` set, each pass takes a batch from every shard
+    in turn. Returns the number of jobs processed.
+    """
+    batch_size = current_app.config['ANALYSIS_BATCH_SIZE']
+    analyzer = analyzers.current_analyzer()
+    databases = [get_shard(index) for index in shards()]
+    processed = 0
+
+    while databases and (limit is None or processed < limit):
+        for db in list(databases):
+            if analyzer.unavailable_until() is not None:
+                return processed
+            if limit is not None and processed >= limit:
+                break
+            size = batch_size if limit is None else min(batch_size, limit - processed)
+            jobs = claim_jobs(db, size)
+            if not jobs:
+                databases.remove(db)
+                continue
+            process_jobs(db, jobs)
+            processed += len(jobs)
+
+    return processed
+
+
+class AnalysisWorkerPool:
+    """Threads that drain ``analysis_jobs`` in the background.
+
+    Workers are started lazily on the first notification, and again after a
+    fork since threads do not survive into the child process.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+        self._pid = None
+
+    def start(self):
+        """Start the worker threads if they are not running in this process."""
+        size = self.app.config['ANALYSIS_WORKERS']
+
+        with self._lock:
+            if size <= 0 or (self._pid == os.getpid() and self._threads):
+                return
+
+            self._pid = os.getpid()
+            self._stop.clear()
+            self._threads = [
+                threading.Thread(
+                    target=self._run, name=f'analysis-worker-{i}', daemon=True
+                )
+                for i in range(size)
+            ]
+            for thread in self._threads:
+                thread.start()
+
+    def notify(self):
+        """Wake the workers because new jobs were queued."""
+        self.start()
+        self._wakeup.set()
+
+    def stop(self, timeout=None):
+        """Ask the workers to exit after their current job and wait for them."""
+        with self._lock:
+            threads, self._threads = self._threads, []
+            self._stop.set()
+            self._wakeup.set()
+
+        for thread in threads:
+            thread.join(timeout)
+
+    def _run(self):
+        poll_interval = self.app.config['ANALYSIS_POLL_INTERVAL']
+
+        while not self._stop.is_set():
+            self._wakeup.clear()
+            with self.app.app_context():
+                try:
+                    processed = run_pending(
+                        limit=self.app.config['ANALYSIS_BATCH_SIZE']
+                    )
+                except Exception as e:
+                    current_app.logger.error(f'Analysis worker error: {e}')
+                    processed = 0
+
+            if not processed:
+                self._wakeup.wait(poll_interval)
+
+
+def notify():
+    """Wake the current app's analysis workers."""
+    current_app.extensions['analysis'].notify()
+
+
+@click.command('analysis-worker')
+@click.option('--drain', is_flag=True, help='Process due jobs once and exit.')
+def analysis_worker_command(drain):
+    """Run the analysis queue in the foreground."""
+    if drain:
+        click.echo(f'Processed {run_pending()} analysis jobs.')
+        return
+
+    app = current_app._get_current_object()
+    app.config['ANALYSIS_WORKERS'] = max(app.config['ANALYSIS_WORKERS'], 1)
+    pool = app.extensions['analysis']
+    pool.start()
+    click.echo('Analysis worker running, press CTRL+C to quit.')
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pool.stop()
+
+
+def init_app(app):
+    """Register the analysis worker pool and CLI command with the Flask app."""
+    app.extensions['analysis'] = AnalysisWorkerPool(app)
+    app.cli.add_command(analysis_worker_command)
@@ -0,0 +1,206 @@
+from flask import current_app
+from app import gemini
+from app.moods import mood_counts
+
+# Bump whenever the lexicon or its reflections change meaningfully, so
+# `flask reanalyze` can find analyses made with an older version
+LEXICON_VERSION = 1
+
+LEXICON_MODEL = 'lexicon'
+
+# How the lexicon words each category as a mood
+CATEGORY_MOODS = {
+    'joyful': 'happy',
+    'calm': 'calm',
+    'sad': 'sad',
+    'anxious': 'anxious',
+    'angry': 'frustrated',
+    'tired': 'tired',
+}
+
+REFLECTIONS = {
+    'joyful': 'It sounds like a good day. Note what made it so, to come back to later.',
+    'calm': 'A settled moment is worth noticing. What helped you get here?',
+    'sad': 'That sounds heavy. Be gentle with yourself, and consider reaching out to someone you trust.',
+    'anxious': 'A lot seems to be pressing on you. Try naming the one thing you can act on next.',
+    'angry': 'Frustration often points at something that matters to you. A short walk can help before you respond.',
+    'tired': 'You sound worn out. Rest is part of the work, not a break from it.',
+    'neutral': 'Keep writing to track your journey.',
+}
+
+
+def _replay(result, source):
+    """Stream events for a result that is already complete."""
+    yield 'mood', result['mood']
+    yield 'reflection', result['reflection']
+    yield 'done', (result, source)
+
+
+class GeminiAnalyzer:
+    """Send every entry to Gemini, packed into batch requests."""
+
+    name = 'gemini'
+
+    def sources(self):
+        """(model, version) pairs this analyzer currently produces."""
+        return [(gemini.current_model(), gemini.PROMPT_VERSION)]
+
+    def quick(self, text):
+        """Gemini has no instant answer; entries wait for the queue."""
+        return None
+
+    def analyze(self, texts):
+        source = self.sources()[0]
+        return [(result, source) for result in gemini.call_gemini_api_batch(texts)]
+
+    def stream(self, text):
+        """Yield the mood and reflection as Gemini writes them.
+
+        Ends with ``('done', (analysis, source))``; see
+        ``gemini.stream_gemini_api`` for the other events.
+        """
+        source = self.sources()[0]
+        for event, value in gemini.stream_gemini_api(text):
+            yield event, (value, source) if event == 'done' else value
+
+    def unavailable_until(self):
+        return gemini.unavailable_until()
+
+
+class LexiconAnalyzer:
+    """Offline mood detection from the mood words in the entry itself.
+
+    Runs in-process in well under a millisecond, costs no quota and never
+    fails, but only recognises the stems in ``app.moods`` and answers with
+    a canned reflection per mood.
+    """
+
+    name = 'lexicon'
+    source = (LEXICON_MODEL, LEXICON_VERSION)
+
+    def sources(self):
+        return [self.source]
+
+    def classify(self, text):
+        """Return an analysis of ``text`` and a confidence between 0 and 1.
+
+        Confidence is the dominant category's share of the mood words,
+        scaled down when there are fewer than three of them.
+        """
+        counts = mood_counts(text)
+        if not counts:
+            return {'mood': 'neutral', 'reflection': REFLECTIONS['neutral']}, 0.0
+
+        ranked = sorted(counts.items(), key=lambda item: -item[1])
+        top, hits = ranked[0]
+        total = sum(counts.values())
+        mood = CATEGORY_MOODS[top]
+        if len(ranked) > 1 and ranked[1][1] * 2 >= hits:
+            mood = f'{mood} and {CATEGORY_MOODS[ranked[1][0]]}'
+
+        confidence = hits / total * min(1.0, total / 3)
+        return {'mood': mood, 'reflection': REFLECTIONS[top]}, round(confidence, 3)
+
+    def quick(self, text):
+        return self.classify(text)[0], self.source, True
+
+    def analyze(self, texts):
+        return [(self.classify(text)[0], self.source) for text in texts]
+
+    def stream(self, text):
+        return _replay(self.classify(text)[0], self.source)
+
+    def unavailable_until(self):
+        return None
+
+
+class TieredAnalyzer:
+    """Lexicon mood straight away; Gemini only where it adds something.
+
+    Entries the lexicon is at least ``confidence`` sure about are done
+    locally. The rest go to Gemini, and so does every entry when
+    ``llm_reflections`` is set, since only Gemini writes a personal
+    reflection. Either way the lexicon mood is shown until Gemini answers.
+    """
+
+    name = 'tiered'
+
+    def __init__(self, local, remote, confidence=0.6, llm_reflections=False):
+        self.local = local
+        self.remote = remote
+        self.confidence = confidence
+        self.llm_reflections = llm_reflections
+
+    def sources(self):
+        return self.local.sources() + self.remote.sources()
+
+    def _final(self, confidence):
+        return not self.llm_reflections and confidence >= self.confidence
+
+    def quick(self, text):
+        result, confidence = self.local.classify(text)
+        return result, self.local.source, self._final(confidence)
+
+    def analyze(self, texts):
+        results = [None] * len(texts)
+        escalate = []
+        for position, text in enumerate(texts):
+            result, confidence = self.local.classify(text)
+            if self._final(confidence):
+                results[position] = (result, self.local.source)
+            else:
+                escalate.append(position)
+
+        if escalate:
+            remote = self.remote.analyze([texts[position] for position in escalate])
+            for position, pair in zip(escalate, remote):
+                results[position] = pair
+        return results
+
+    def stream(self, text):
+        result, confidence = self.local.classify(text)
+        if self._final(confidence):
+            return _replay(result, self.local.source)
+        return self.remote.stream(text)
+
+    def unavailable_until(self):
+        return self.remote.unavailable_until()
+
+
+def _tiered(config):
+    return TieredAnalyzer(
+        LexiconAnalyzer(), GeminiAnalyzer(),
+        confidence=config['ANALYZER_CONFIDENCE'],
+        llm_reflections=config['ANALYZER_LLM_REFLECTIONS'],
+    )
+
+
+def backend_of(model):
+    """Name of the backend that makes analyses with ``model``.
+
+    The lexicon has a model name of its own; any other is a Gemini model.
+    """
+    return LexiconAnalyzer.name if model == LEXICON_MODEL else GeminiAnalyzer.name
+
+
+# Backends selectable with the ANALYZER setting
+BACKENDS = {
+    'gemini': lambda config: GeminiAnalyzer(),
+    'lexicon': lambda config: LexiconAnalyzer(),
+    'tiered': _tiered,
+}
+
+
+def current_analyzer():
+    """The analyzer backend configured for the current app."""
+    return current_app.extensions['analyzer']
+
+
+def init_app(app):
+    """Create the analyzer backend named by ANALYZER."""
+    name = app.config['ANALYZER']
+    if name not in BACKENDS:
+        raise ValueError(
+            f"Unknown ANALYZER {name!r}, expected one of {', '.join(BACKENDS)}"
+        )
+    app.extensions['analyzer'] = BACKENDS[name](app.config)
@@ -1,32 +1,107 @@
 import functools
+import threading
+import time
+from collections import OrderedDict
 from flask import (
-    Blueprint, flash, g, redirect, render_template, request, session, url_for
+    Blueprint, current_app, flash, g, redirect, render_template, request,
+    session, url_for
 )
-from werkzeug.security import check_password_hash, generate_password_hash
-from app.db import get_db
+from app.db import get_db, place_user
+from app.passwords import HashingBusy
 
 bp = Blueprint('auth', __name__, url_prefix='/auth')
 
+class UserCache:
+    """Short-lived per-process cache of user identities by id.
+
+    Keeps the ``max_entries`` most recently used users; expired ones are
+    dropped when looked up.
+    """
+
+    def __init__(self, ttl, max_entries=10_000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._users = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            item = self._users.get(user_id)
+            if item is None:
+                return None
+            if item[0] <= time.monotonic():
+                del self._users[user_id]
+                return None
+            self._users.move_to_end(user_id)
+            return item[1]
+
+    def put(self, user):
+        if self.ttl > 0 and self.max_entries > 0:
+            with self._lock:
+                self._users[user['id']] = (time.monotonic() + self.ttl, user)
+                self._users.move_to_end(user['id'])
+                while len(self._users) > self.max_entries:
+                    self._users.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._users.pop(user_id, None)
+
+RATE_LIMITED = 'Too many attempts. Please try again later.'
+HASHING_BUSY = 'The server is busy. Please try again in a moment.'
+
+def _rate_limited(*keys):
+    """Count an attempt against each key; True if the request should be refused."""
+    return not current_app.extensions['login_rate_limiter'].hit(*keys)
+
+def get_user(user_id):
+    """Return the identity (id and username) of a user, or None."""
+    cache = current_app.extensions['user_cache']
+    user = cache.get(user_id)
+    if user is None:
+        row = get_db().execute(
+            'SELECT id, username FROM users WHERE id = ?', (user_id,)
+        ).fetchone()
+        if row is not None:
+            user = {'id': row['id'], 'username': row['username']}
+            cache.put(user)
+    return user
+
+def invalidate_user(user_id):
+    """Forget a cached user, e.g. after logout or a password change."""
+    current_app.extensions['user_cache'].invalidate(user_id)
+
 @bp.route('/register', methods=('GET', 'POST'))
 def register():
     """Register a new user."""
+    status = 200
     if request.method == 'POST':
         username = request.form['username']
         password = request.form['password']
-        db = get_db()
+        hasher = current_app.extensions['password_hasher']
         error = None
 
         if not username:
             error = 'Username is required.'
         elif not password:
             error = 'Password is required.'
+        elif _rate_limited(('ip', request.remote_addr)):
+            error, status = RATE_LIMITED, 429
+
+        if error is None:
+            try:
+                password_hash = hasher.hash(password)
+            except HashingBusy:
+                error, status = HASHING_BUSY, 503
 
         if error is None:
+            db = get_db()
             try:
-                db.execute(
+                cursor = db.execute(
                     "INSERT INTO users (username, password_hash) VALUES (?, ?)",
-                    (username, generate_password_hash(password)),
+                    (username, password_hash),
                 )
+                place_user(db, cursor.lastrowid)
                 db.commit()
             except db.IntegrityError:
                 error = f"User {username} is already registered."
@@ -35,33 +110,55 @@ def register():
 
         flash(error)
 
-    return render_template('auth/register.html')
+    return render_template('auth/register.html'), status
 
 @bp.route('/login', methods=('GET', 'POST'))
 def login():
     """Log in a registered user."""
+    status = 200
     if request.method == 'POST':
         username = request.form['username']
         password = request.form['password']
-        db = get_db()
+        hasher = current_app.extensions['password_hasher']
         error = None
-        user = db.execute(
-            'SELECT * FROM users WHERE username = ?', (username,)
-        ).fetchone()
 
-        if user is None:
-            error = 'Incorrect username.'
-        elif not check_password_hash(user['password_hash'], password):
-            error = 'Incorrect password.'
+        # Refuse floods before touching the database or hashing anything
+        if _rate_limited(('ip', request.remote_addr), ('user', username)):
+            error, status = RATE_LIMITED, 429
+        else:
+            db = get_db()
+            user = db.execute(
+                'SELECT * FROM users WHERE username = ?', (username,)
+            ).fetchone()
+
+            try:
+                if user is None:
+                    error = 'Incorrect username.'
+                elif not hasher.verify(user['password_hash'], password):
+                    error = 'Incorrect password.'
+                elif hasher.needs_rehash(user['password_hash']):
+                    # Hash parameters changed since this password was set
+                    db.execute(
+                        'UPDATE users SET password_hash = ? WHERE id = ?',
+                        (hasher.hash(password), user['id'])
+                    )
+                    db.commit()
+                    invalidate_user(user['id'])
+            except HashingBusy:
+                error, status = HASHING_BUSY, 503
 
         if error is None:
             session.clear()
             session['user_id'] = user['id']
+            if current_app.config['SESSION_USER_IDENTITY']:
+                # Ids and usernames never change, so the signed session can
+                # carry them and spare a query on every request
+                session['username'] = user['username']
             return redirect(url_for('index'))
 
         flash(error)
 
-    return render_template('auth/login.html')
+    return render_template('auth/login.html'), status
 
 @bp.before_app_request
 def load_logged_in_user():
@@ -70,14 +167,17 @@ def load_logged_in_user():
 
     if user_id is None:
         g.user = None
+    elif current_app.config['SESSION_USER_IDENTITY'] and 'username' in session:
+        g.user = {'id': user_id, 'username': session['username']}
     else:
-        g.user = get_db().execute(
-            'SELECT * FROM users WHERE id = ?', (user_id,)
-        ).fetchone()
+        g.user = get_user(user_id)
 
 @bp.route('/logout')
 def logout():
     """Clear the current session and log out."""
+    user_id = session.get('user_id')
+    if user_id is not None:
+        invalidate_user(user_id)
     session.clear()
     return redirect(url_for('index'))
 
@@ -90,4 +190,10 @@ def login_required(view):
 
         return view(**kwargs)
 
-    return wrapped_view
\ No newline at end of file
+    return wrapped_view
+
+def init_app(app):
+    """Attach the logged-in user cache to the Flask app."""
+    app.extensions['user_cache'] = UserCache(
+        app.config['USER_CACHE_TTL'], app.config['USER_CACHE_SIZE']
+    )
\ No newline at end of file
@@ -0,0 +1,129 @@
+import collections
+import hashlib
+import sqlite3
+import threading
+import zlib
+
+# Compressed values are stored as BLOBs: a format byte, the 4-byte id of the
+# preset dictionary they were compressed with (zeros for none) and a raw
+# deflate stream. Plain TEXT values are left as they are, so compressed and
+# uncompressed rows mix freely in the same column.
+FORMAT = 1
+NO_DICTIONARY = bytes(4)
+HEADER_SIZE = 1 + len(NO_DICTIONARY)
+
+# Preset dictionaries by id, shared by every connection in the process.
+# Ids are content hashes, so the same dictionary has the same id everywhere.
+_dictionaries = {}
+_lock = threading.Lock()
+
+
+def dictionary_id(dictionary):
+    return hashlib.sha256(dictionary).digest()[:4]
+
+
+def remember(dictionary):
+    """Make ``dictionary`` available for decoding in this process. Returns its id."""
+    key = dictionary_id(dictionary)
+    with _lock:
+        _dictionaries[key] = dictionary
+    return key
+
+
+def _load(database, key):
+    # Read with a connection of our own: this runs inside a query on another
+    with _lock:
+        if key in _dictionaries:
+            return _dictionaries[key]
+    if database is None:
+        raise LookupError(f'unknown compression dictionary {key.hex()}')
+    db = sqlite3.connect(database)
+    try:
+        row = db.execute(
+            'SELECT data FROM codec_dictionaries WHERE id = ?', (key,)
+        ).fetchone()
+    finally:
+        db.close()
+    if row is None:
+        raise LookupError(f'unknown compression dictionary {key.hex()}')
+    remember(row[0])
+    return row[0]
+
+
+def encode(text, dictionary=None, level=9):
+    """Compress ``text`` into the stored BLOB format."""
+    if dictionary:
+        key = remember(dictionary)
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15, zdict=dictionary)
+    else:
+        key = NO_DICTIONARY
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    data = compressor.compress(text.encode()) + compressor.flush()
+    return bytes([FORMAT]) + key + data
+
+
+def encoded_with(value):
+    """Id of the dictionary a stored value was compressed with, None if plain."""
+    if isinstance(value, bytes) and value[:1] == bytes([FORMAT]):
+        return value[1:HEADER_SIZE]
+    return None
+
+
+def decode(value, database=None):
+    """Text of a stored value, whether it is plain or compressed.
+
+    Dictionaries not seen yet in this process are read from ``database``.
+    """
+    if not isinstance(value, bytes):
+        return value
+    if value[:1] != bytes([FORMAT]):
+        raise ValueError(f'unknown stored format {value[:1]!r}')
+
+    key = value[1:HEADER_SIZE]
+    if key == NO_DICTIONARY:
+        decompressor = zlib.decompressobj(-15)
+    else:
+        with _lock:
+            dictionary = _dictionaries.get(key)
+        if dictionary is None:
+            dictionary = _load(database, key)
+        decompressor = zlib.decompressobj(-15, zdict=dictionary)
+    data = decompressor.decompress(value[HEADER_SIZE:]) + decompressor.flush()
+    return data.decode()
+
+
+def train_dictionary(samples, size=32 * 1024):
+    """Build a preset dictionary of ``size`` bytes at most from sample texts.
+
+    Words and word pairs are ranked by how many bytes they account for in
+    the samples. The best ones go last, where deflate reaches them with the
+    shortest back-references.
+    """
+    counts = collections.Counter()
+    for text in samples:
+        words = text.split()
+        counts.update(words)
+        counts.update(' '.join(pair) for pair in zip(words, words[1:]))
+
+    pieces = []
+    total = 0
+    ranked = sorted(counts.items(), key=lambda item: -item[1] * len(item[0]))
+    for piece, count in ranked:
+        data = (piece + ' ').encode()
+        if count < 2 or total + len(data) > size:
+            continue
+        pieces.append(data)
+        total += len(data)
+    return b''.join(reversed(pieces))
+
+
+def register(db, database):
+    """Make ``codec_decode(value)`` available in SQL on a connection.
+
+    The ``entry_texts`` view search reads text through needs it, so every
+    app connection to the database has it. The schema's triggers do not,
+    so other tools can still write entries.
+    """
+    db.create_function(
+        'codec_decode', 1, lambda value: decode(value, database), deterministic=True
+    )
@@ -0,0 +1,154 @@
+import time
+import click
+from flask import current_app
+from app import codec
+from app.db import get_shard, shards
+
+# Columns the codec may compress
+COLUMNS = ('text', 'reflection')
+
+
+def current_dictionary(db):
+    """The newest trained dictionary of a database, or None."""
+    row = db.execute(
+        'SELECT data FROM codec_dictionaries ORDER BY created_at DESC LIMIT 1'
+    ).fetchone()
+    if row is None:
+        return None
+    codec.remember(row['data'])
+    return row['data']
+
+
+def train(db, sample_size, size):
+    """Train a dictionary on a random sample of entries and store it.
+
+    Returns the dictionary, or None if there was no repeated text to learn
+    from. The caller commits.
+    """
+    rows = db.execute(
+        'SELECT codec_decode(text) AS text, codec_decode(reflection) AS reflection'
+        ' FROM entries ORDER BY random() LIMIT ?', (sample_size,)
+    ).fetchall()
+    samples = [row[column] for row in rows for column in COLUMNS if row[column]]
+    dictionary = codec.train_dictionary(samples, size)
+    if not dictionary:
+        return None
+
+    db.execute(
+        'INSERT OR REPLACE INTO codec_dictionaries (id, data, created_at)'
+        ' VALUES (?, ?, ?)',
+        (codec.remember(dictionary), dictionary, time.time())
+    )
+    return dictionary
+
+
+def _compacted(value, text, dictionary, level):
+    # New stored value for a column holding ``text``, or None to leave it alone
+    if value is None:
+        return None
+    key = codec.dictionary_id(dictionary) if dictionary else codec.NO_DICTIONARY
+    if codec.encoded_with(value) == key:
+        return None
+
+    encoded = codec.encode(text, dictionary, level)
+    if len(encoded) < len(text.encode()):
+        return encoded
+    # Not worth compressing; a value compressed before is stored plain again
+    return text if isinstance(value, bytes) else None
+
+
+def compact(db, min_age_days, min_size, level=9, batch_size=500, dictionary=None):
+    """Compress old and large entries, and recompress ones using another dictionary.
+
+    An entry qualifies if it was written more than ``min_age_days`` ago or
+    its text is at least ``min_size`` bytes. Rows are rewritten in batches
+    of ``batch_size``, each its own transaction, so readers and writers are
+    only held up briefly. Returns counts of ``rows`` rewritten and the
+    stored ``before`` and ``after`` sizes of those rows' columns in bytes.
+    """
+    key = codec.dictionary_id(dictionary) if dictionary else codec.NO_DICTIONARY
+    cutoff = f'-{min_age_days:d} days'
+    result = {'rows': 0, 'before': 0, 'after': 0}
+    last_id = 0
+
+    while True:
+        rows = db.execute(
+            'SELECT id, text, reflection, codec_decode(text) AS plain_text,'
+            ' codec_decode(reflection) AS plain_reflection FROM entries WHERE id > ?'
+            " AND (timestamp < datetime('now', ?) OR length(text) >= ?"
+            "  OR (typeof(text) = 'blob' AND substr(text, 2, 4) != ?)"
+            "  OR (typeof(reflection) = 'blob' AND substr(reflection, 2, 4) != ?))"
+            # Done already: not worth decoding just to skip
+            " AND NOT (typeof(text) = 'blob' AND substr(text, 2, 4) = ?"
+            "  AND (reflection IS NULL"
+            "   OR (typeof(reflection) = 'blob' AND substr(reflection, 2, 4) = ?)))"
+            ' ORDER BY id LIMIT ?',
+            (last_id, cutoff, min_size, key, key, key, key, batch_size)
+        ).fetchall()
+        if not rows:
+            break
+        last_id = rows[-1]['id']
+
+        updates = []
+        for row in rows:
+            values = [
+                _compacted(row[column], row[f'plain_{column}'], dictionary, level)
+                for column in COLUMNS
+            ]
+            if all(value is None for value in values):
+                continue
+            stored = [row[column] if value is None else value
+                      for column, value in zip(COLUMNS, values)]
+            updates.append(stored + [row['id']])
+            result['rows'] += 1
+            for old, new in zip((row[column] for column in COLUMNS), stored):
+                result['before'] += _size(old)
+                result['after'] += _size(new)
+
+        if updates:
+            db.executemany(
+                'UPDATE entries SET text = ?, reflection = ? WHERE id = ?', updates
+            )
+            db.commit()
+
+    return result
+
+
+def _size(value):
+    if value is None:
+        return 0
+    return len(value) if isinstance(value, bytes) else len(value.encode())
+
+
+@click.command('compact-entries')
+@click.option('--train', 'retrain', is_flag=True,
+              help='Train a new dictionary first and recompress everything with it.')
+@click.option('--min-age', type=int, help='Compress entries older than this many days.')
+@click.option('--min-size', type=int, help='Compress entries with at least this many bytes.')
+def compact_command(retrain, min_age, min_size):
+    """Compress old and large journal entries to save space."""
+    config = current_app.config
+    min_age = config['CODEC_MIN_AGE_DAYS'] if min_age is None else min_age
+    min_size = config['CODEC_MIN_SIZE'] if min_size is None else min_size
+
+    for index in shards():
+        db = get_shard(index)
+        dictionary = None if retrain else current_dictionary(db)
+        if dictionary is None:
+            dictionary = train(db, config['CODEC_TRAIN_SAMPLE'], config['CODEC_DICTIONARY_SIZE'])
+            db.commit()
+        result = compact(
+            db, min_age, min_size, config['CODEC_LEVEL'], config['CODEC_BATCH_SIZE'],
+            dictionary,
+        )
+        name = 'database' if index is None else f'shard {index}'
+        click.echo(
+            f"Compacted {result['rows']} entries in the {name}:"
+            f" {result['before']:,} -> {result['after']:,} bytes."
+        )
+    click.echo('Run `flask vacuum-db` to return the freed space to the file system.')
+
+
+def init_app(app):
+    """Register the compaction command with the Flask app."""
+    app.cli.add_command(compact_command)
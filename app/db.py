@@ -1,31 +1,345 @@
+import contextvars
+import os
+import re
 import sqlite3
+import threading
+import time
+import weakref
 import click
 from flask import current_app, g
+from app import codec
 
-def get_db():
-    """Get database connection for current request."""
-    if 'db' not in g:
-        g.db = sqlite3.connect(
-            current_app.config['DATABASE'],
-            detect_types=sqlite3.PARSE_DECLTYPES
+# Pooled connections are reused across requests by the thread that opened
+# them, and closed when that thread exits. Every pooled connection is also
+# tracked here so dispose_pool() can close them all, e.g. on shutdown or
+# when a test database goes away.
+_local = threading.local()
+_pool_lock = threading.Lock()
+_pooled = {}
+# Connections inherited across fork() must not be used or closed by the child;
+# they are parked here so garbage collection never finalizes them either.
+_inherited = []
+
+# Statistics object for the request being timed, if any. Set by app.metrics;
+# anything with an add_query(seconds) method will do.
+query_stats = contextvars.ContextVar('query_stats', default=None)
+
+class TimedConnection(sqlite3.Connection):
+    """Connection that reports statement count and time to ``query_stats``.
+
+    When no request is being timed this costs one context variable lookup
+    per statement.
+    """
+
+    def execute(self, sql, parameters=()):
+        stats = query_stats.get()
+        if stats is None:
+            return super().execute(sql, parameters)
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            stats.add_query(time.perf_counter() - start)
+
+    def executemany(self, sql, parameters):
+        stats = query_stats.get()
+        if stats is None:
+            return super().executemany(sql, parameters)
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, parameters)
+        finally:
+            stats.add_query(time.perf_counter() - start)
+
+def _pragmas(config):
+    """PRAGMA statements for a new connection, built from app config."""
+    auto_vacuum = config['SQLITE_AUTO_VACUUM']
+    journal_mode = config['SQLITE_JOURNAL_MODE']
+    synchronous = config['SQLITE_SYNCHRONOUS']
+    for value in (auto_vacuum, journal_mode, synchronous):
+        if not re.fullmatch(r'[A-Za-z]+', value):
+            raise ValueError(f'Invalid SQLite pragma value: {value!r}')
+
+    return [
+        # Only takes effect on a new file, so it must come before journal_mode
+        # writes the header; existing files switch over on their next VACUUM
+        f'PRAGMA auto_vacuum = {auto_vacuum}',
+        f'PRAGMA journal_mode = {journal_mode}',
+        f'PRAGMA synchronous = {synchronous}',
+        f'PRAGMA busy_timeout = {int(config["SQLITE_BUSY_TIMEOUT"]):d}',
+        f'PRAGMA mmap_size = {int(config["SQLITE_MMAP_SIZE"]):d}',
+        f'PRAGMA cache_size = {int(config["SQLITE_CACHE_SIZE"]):d}',
+    ]
+
+def shard_path(config, index):
+    """File of shard ``index``, or of the main database for None."""
+    if index is None:
+        return config['DATABASE']
+    template = config['DATABASE_SHARD_PATH']
+    if template is None:
+        root, ext = os.path.splitext(config['DATABASE'])
+        template = root + '.shard{n}' + (ext or '.db')
+    return template.format(n=index)
+
+def connect(config, check_same_thread=True, database=None):
+    """Open a new connection to the configured database, or to ``database``."""
+    database = database or config['DATABASE']
+    db = sqlite3.connect(
+        database,
+        detect_types=sqlite3.PARSE_DECLTYPES,
+        timeout=config['SQLITE_BUSY_TIMEOUT'] / 1000,
+        check_same_thread=check_same_thread,
+        factory=TimedConnection,
+    )
+    db.row_factory = sqlite3.Row
+    codec.register(db, database)
+    for pragma in _pragmas(config):
+        db.execute(pragma)
+
+    return db
+
+def _is_healthy(db):
+    """Cheap liveness check for a pooled connection."""
+    try:
+        db.execute('SELECT 1').fetchone()
+    except sqlite3.Error:
+        return False
+    return True
+
+class _ThreadConnections:
+    """A thread's pooled connections by database.
+
+    Only the thread's local storage refers to it, so it is collected when
+    the thread exits, and its connections are closed with it.
+    """
+
+    def __init__(self, pid):
+        self.connections = {}
+        weakref.finalize(self, _release, pid, self.connections)
+
+def _release(pid, connections):
+    # A forked child must leave the parent's connections alone
+    if os.getpid() != pid:
+        return
+    with _pool_lock:
+        for database, db in connections.items():
+            items = [item for item in _pooled.get(database, []) if item[1] is not db]
+            if items:
+                _pooled[database] = items
+            else:
+                _pooled.pop(database, None)
+    for db in connections.values():
+        try:
+            db.close()
+        except sqlite3.Error:
+            pass
+
+def _thread_connections():
+    pid = os.getpid()
+    holder = getattr(_local, 'holder', None)
+    if holder is None or _local.pid != pid:
+        # First use in this thread, or we are a forked child
+        if holder is not None:
+            _inherited.extend(holder.connections.values())
+        holder = _local.holder = _ThreadConnections(pid)
+        _local.pid = pid
+    return holder.connections
+
+def _pooled_connection(config, database=None):
+    """Return this thread's pooled connection to a database, opening it if needed."""
+    pid = os.getpid()
+    connections = _thread_connections()
+
+    database = database or config['DATABASE']
+    db = connections.get(database)
+    if db is not None and not _is_healthy(db):
+        _discard(database, db)
+        db = None
+
+    if db is None:
+        db = connect(config, check_same_thread=False, database=database)
+        connections[database] = db
+        with _pool_lock:
+            _pooled.setdefault(database, []).append((pid, db))
+
+    return db
+
+def _discard(database, db):
+    _thread_connections().pop(database, None)
+    with _pool_lock:
+        _pooled[database] = [
+            item for item in _pooled.get(database, []) if item[1] is not db
+        ]
+    try:
+        db.close()
+    except sqlite3.Error:
+        pass
+
+def dispose_pool(database=None):
+    """Close pooled connections to ``database`` (or all databases) in this process."""
+    pid = os.getpid()
+    with _pool_lock:
+        names = [database] if database is not None else list(_pooled)
+        connections = []
+        for name in names:
+            items = _pooled.pop(name, [])
+            connections += [db for owner, db in items if owner == pid]
+            others = [item for item in items if item[0] != pid]
+            if others:
+                _pooled[name] = others
+
+    for db in connections:
+        try:
+            db.close()
+        except sqlite3.Error:
+            pass
+
+def _open(database):
+    config = current_app.config
+    if config['DATABASE_POOL']:
+        return _pooled_connection(config, database), True
+    return connect(config, database=database), False
+
+def get_shard(index):
+    """Connection to shard ``index``; None is the main database."""
+    if index is None:
+        if 'db' not in g:
+            g.db, g.db_pooled = _open(None)
+        return g.db
+
+    shards = g.setdefault('db_shards', {})
+    if index not in shards:
+        shards[index] = _open(shard_path(current_app.config, index))
+    return shards[index][0]
+
+def shards():
+    """Indexes of the databases holding entries: each shard, or [None] unsharded."""
+    return list(range(current_app.config['DATABASE_SHARDS'])) or [None]
+
+def shard_of(user_id):
+    """Index of the shard holding ``user_id``'s entries, None when unsharded.
+
+    Users without a recorded placement live on ``user_id % DATABASE_SHARDS``.
+    """
+    count = current_app.config['DATABASE_SHARDS']
+    if not count:
+        return None
+    # Not cached, so a rebalance takes effect on the next lookup everywhere
+    row = get_db().execute(
+        'SELECT shard FROM user_shards WHERE user_id = ?', (user_id,)
+    ).fetchone()
+    return row['shard'] if row is not None else user_id % count
+
+def place_user(db, user_id):
+    """Record where a new user's entries go. The caller commits."""
+    count = current_app.config['DATABASE_SHARDS']
+    if count:
+        db.execute(
+            'INSERT OR IGNORE INTO user_shards (user_id, shard) VALUES (?, ?)',
+            (user_id, user_id % count)
         )
-        g.db.row_factory = sqlite3.Row
-    
-    return g.db
+
+def get_db(user_id=None):
+    """Get a database connection for the current request.
+
+    With ``user_id`` this is the connection holding that user's entries and
+    everything derived from them (jobs, rollups, search). Without it, it is
+    the main database with users and shared tables. Both are the same
+    connection unless ``DATABASE_SHARDS`` is set.
+    """
+    if user_id is None:
+        return get_shard(None)
+    return get_shard(shard_of(user_id))
 
 def close_db(e=None):
-    """Close database connection."""
-    db = g.pop('db', None)
-    
-    if db is not None:
-        db.close()
+    """Close the database connections, or hand pooled ones back to their thread."""
+    connections = list(g.pop('db_shards', {}).values())
+    if 'db' in g:
+        connections.append((g.pop('db'), g.pop('db_pooled', False)))
+
+    for db, pooled in connections:
+        if not pooled:
+            db.close()
+        elif db.in_transaction:
+            # Never leave a half-finished transaction for the next request
+            db.rollback()
+
+def list_migrations():
+    """Return (version, filename) for every script in migrations/, in order.
+
+    Scripts are named ``NNNN_description.sql``; the number is the schema
+    version the database is at once the script has run.
+    """
+    folder = os.path.join(current_app.root_path, 'migrations')
+    migrations = []
+    for name in os.listdir(folder):
+        match = re.match(r'(\d+)_\w+\.sql$', name)
+        if match:
+            migrations.append((int(match.group(1)), name))
+    return sorted(migrations)
+
+def get_schema_version(db):
+    """Return the schema version recorded in the database."""
+    return db.execute('PRAGMA user_version').fetchone()[0]
+
+def _databases():
+    # The main database, then each shard; every file has the same schema
+    indexes = [None] + list(range(current_app.config['DATABASE_SHARDS']))
+    return [get_shard(index) for index in indexes]
 
 def init_db():
-    """Initialize the database with schema.sql."""
-    db = get_db()
-    
+    """Initialize the database, and any shards, with schema.sql."""
     with current_app.open_resource('schema.sql') as f:
-        db.executescript(f.read().decode('utf8'))
+        schema = f.read().decode('utf8')
+
+    # schema.sql is always the latest schema
+    migrations = list_migrations()
+    latest = migrations[-1][0] if migrations else 0
+    for db in _databases():
+        db.executescript(schema)
+        db.execute(f'PRAGMA user_version = {latest:d}')
+
+    # Entry ids start over, so cached cards would show the wrong entries
+    cache = current_app.extensions.get('fragment_cache')
+    if cache is not None:
+        cache.clear()
+
+def upgrade_db():
+    """Apply pending migrations to the database and any shards.
+
+    Returns the versions that were applied to the main database.
+    """
+    applied = []
+    for db in reversed(_databases()):
+        # Shards first, so the main database only records a version once
+        # every shard has it
+        applied = _upgrade(db)
+    return applied
+
+def _upgrade(db):
+    """Apply pending migrations to one database file in order.
+
+    Each script runs in its own transaction together with the version bump,
+    so a failed migration leaves the database at the previous version.
+    """
+    current = get_schema_version(db)
+    applied = []
+
+    for version, name in list_migrations():
+        if version <= current:
+            continue
+        with current_app.open_resource(f'migrations/{name}') as f:
+            script = f.read().decode('utf8')
+        try:
+            db.executescript(
+                f'BEGIN;\n{script}\nPRAGMA user_version = {version:d};\nCOMMIT;'
+            )
+        except sqlite3.Error:
+            db.rollback()
+            raise
+        applied.append(version)
+
+    return applied
 
 @click.command('init-db')
 def init_db_command():
@@ -33,7 +347,18 @@ def init_db_command():
     init_db()
     click.echo('Initialized the database.')
 
+@click.command('db-upgrade')
+def upgrade_db_command():
+    """Apply pending schema migrations, keeping existing data."""
+    applied = upgrade_db()
+    version = get_schema_version(get_db())
+    if applied:
+        click.echo(f'Upgraded the database to version {version}.')
+    else:
+        click.echo(f'The database is up to date (version {version}).')
+
 def init_app(app):
     """Register database functions with the Flask app."""
     app.teardown_appcontext(close_db)
-    app.cli.add_command(init_db_command)
\ No newline at end of file
+    app.cli.add_command(init_db_command)
+    app.cli.add_command(upgrade_db_command)
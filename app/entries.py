@@ -1,10 +1,17 @@
+import base64
+import json
+from datetime import date, timedelta
 from flask import (
-    Blueprint, flash, g, redirect, render_template, request, url_for
+    Blueprint, Response, current_app, flash, g, jsonify, redirect,
+    render_template, request, session, stream_with_context, url_for
 )
 from werkzeug.exceptions import abort
 from app.auth import login_required
+from app import (
+    analysis, fragments, httpcache, export as journal_export,
+    importer as journal_import, insights as mood_insights, retention, search as fts
+)
 from app.db import get_db
-from app.gemini import call_gemini_api
 
 bp = Blueprint('entries', __name__, url_prefix='/entries')
 
@@ -22,40 +29,235 @@ def add():
         if error is not None:
             flash(error)
         else:
-            # Call Gemini API to analyze entry
-            analysis = call_gemini_api(text)
-            
-            db = get_db()
-            db.execute(
-                'INSERT INTO entries (user_id, text, mood, reflection) VALUES (?, ?, ?, ?)',
-                (g.user['id'], text, analysis['mood'], analysis['reflection'])
+            # Save now and let the analysis workers fill in mood and reflection
+            db = get_db(g.user['id'])
+            cursor = db.execute(
+                'INSERT INTO entries (user_id, text) VALUES (?, ?)',
+                (g.user['id'], text)
             )
+            # With streaming on, the job waits a moment for the list page to
+            # pick it up and stream the analysis live
+            delay = (current_app.config['ANALYSIS_STREAM_GRACE']
+                     if current_app.config['ANALYSIS_STREAMING'] else 0)
+            queued = analysis.submit(db, cursor.lastrowid, text, delay)
             db.commit()
+            if queued:
+                analysis.notify()
+                if delay:
+                    # Only this entry is streamed; older pending ones are
+                    # left to the workers, which batch them
+                    session['stream_entry'] = cursor.lastrowid
             flash('Entry saved successfully!', 'success')
             return redirect(url_for('entries.list'))
 
     return render_template('entries/add_entry.html')
 
+def encode_cursor(entry):
+    """Opaque cursor pointing just past ``entry`` in list order."""
+    raw = f"{entry['timestamp']}|{entry['id']}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor):
+    """Turn a cursor back into its (timestamp, id) key, or abort with 400."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+        timestamp, entry_id = raw.rsplit('|', 1)
+        return timestamp, int(entry_id)
+    except (ValueError, UnicodeError):
+        abort(400, 'Invalid cursor.')
+
+def fetch_page(user_id, cursor=None, page_size=None):
+    """Fetch one page of a user's entries, newest first.
+
+    Uses keyset pagination on (timestamp, id) so every page costs the same no
+    matter how deep into the journal it is. Returns the entries and the cursor
+    for the next page, or None on the last page.
+    """
+    if page_size is None:
+        page_size = current_app.config['ENTRIES_PAGE_SIZE']
+
+    query = (
+        'SELECT e.id, codec_decode(e.text) AS text, e.mood,'
+        ' codec_decode(e.reflection) AS reflection, e.timestamp,'
+        ' e.analysis_status, e.revision, j.id IS NOT NULL AS pending'
+        ' FROM entries e LEFT JOIN analysis_jobs j ON j.entry_id = e.id'
+        ' WHERE e.user_id = ?'
+    )
+    params = [user_id]
+    if cursor is not None:
+        timestamp, entry_id = decode_cursor(cursor)
+        query += ' AND (e.timestamp, e.id) < (?, ?)'
+        params += [timestamp, entry_id]
+    query += ' ORDER BY e.timestamp DESC, e.id DESC LIMIT ?'
+    params.append(page_size + 1)
+
+    entries = get_db(user_id).execute(query, params).fetchall()
+    next_cursor = None
+    if len(entries) > page_size:
+        entries = entries[:page_size]
+        next_cursor = encode_cursor(entries[-1])
+
+    return entries, next_cursor
+
 @bp.route('/list')
 @login_required
+@httpcache.conditional
 def list():
-    """Display all journal entries for the logged-in user."""
-    db = get_db()
-    entries = db.execute(
-        'SELECT id, text, mood, reflection, timestamp'
-        ' FROM entries'
-        ' WHERE user_id = ?'
-        ' ORDER BY timestamp DESC',
-        (g.user['id'],)
-    ).fetchall()
+    """Display the logged-in user's journal entries, one page at a time."""
+    entries, next_cursor = fetch_page(g.user['id'], request.args.get('cursor'))
+    stream_id = session.pop('stream_entry', None)
+    stream_url = None
+    if current_app.config['ANALYSIS_STREAMING'] and any(
+        entry['id'] == stream_id and entry['pending'] for entry in entries
+    ):
+        stream_url = url_for('entries.analysis_stream', id=stream_id)
     
-    return render_template('entries/list.html', entries=entries)
+    return render_template(
+        'entries/list.html', entries=entries, next_cursor=next_cursor,
+        cards=fragments.render_cards(g.user['id'], entries),
+        stream_id=stream_id, stream_url=stream_url,
+    )
+
+@bp.route('/list.json')
+@login_required
+@httpcache.conditional
+def list_page():
+    """Return the next page of entries as an HTML fragment for infinite scroll."""
+    entries, next_cursor = fetch_page(g.user['id'], request.args.get('cursor'))
+    
+    return jsonify(
+        html=str(fragments.render_cards(g.user['id'], entries)),
+        next_cursor=next_cursor,
+    )
+
+@bp.route('/search')
+@login_required
+def search():
+    """Full-text search over the logged-in user's entries."""
+    terms = request.args.get('q', '').strip()
+    page = request.args.get('page', 1, type=int)
+    if page < 1:
+        abort(400, 'Invalid page.')
+
+    results, has_next = fts.search_entries(
+        g.user['id'], terms, page, current_app.config['ENTRIES_PAGE_SIZE']
+    )
+    
+    return render_template(
+        'entries/search.html',
+        terms=terms, results=results, page=page, has_next=has_next
+    )
+
+def _insights_for_request():
+    days = request.args.get('days', 30, type=int)
+    weeks = request.args.get('weeks', 12, type=int)
+    if not (1 <= days <= 366 and 1 <= weeks <= 104):
+        abort(400, 'Invalid range.')
+    return mood_insights.mood_insights(g.user['id'], days, weeks)
+
+@bp.route('/insights')
+@login_required
+def insights():
+    """Show mood frequency and trends for the logged-in user."""
+    return render_template('entries/insights.html', insights=_insights_for_request())
+
+@bp.route('/insights.json')
+@login_required
+def insights_data():
+    """Mood frequency and trend series as JSON."""
+    return jsonify(_insights_for_request())
+
+@bp.route('/export')
+@login_required
+def export():
+    """Download the logged-in user's whole journal as JSONL or CSV."""
+    fmt = request.args.get('format', 'jsonl')
+    compress = request.args.get('gzip', '0') == '1'
+    if fmt not in journal_export.FORMATS:
+        abort(400, 'Unsupported export format.')
+
+    mimetype = 'application/gzip' if compress else journal_export.FORMATS[fmt][0]
+    filename = journal_export.export_filename(fmt, compress)
+    return Response(
+        stream_with_context(journal_export.generate_export(g.user['id'], fmt, compress)),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'},
+    )
+
+@bp.route('/import', methods=('GET', 'POST'))
+@login_required
+def import_():
+    """Import entries from a JSONL or CSV file exported by another journal."""
+    if request.method == 'POST':
+        upload = request.files.get('file')
+        error = None
+
+        if upload is None or not upload.filename:
+            error = 'Choose a file to import.'
+        else:
+            fmt = journal_import.detect_format(upload.filename)
+            if fmt is None:
+                error = 'Upload a .jsonl or .csv file.'
+
+        if error is None:
+            try:
+                result = journal_import.import_entries(
+                    g.user['id'], upload.stream, fmt,
+                    compressed=upload.filename.lower().endswith('.gz')
+                )
+            except journal_import.ImportFailed as e:
+                error = f'Import stopped, {e}.'
+
+        if error is not None:
+            flash(error)
+        else:
+            analysis.notify()
+            flash(f"Imported {result['imported']} entries.", 'success')
+            for line_no, message in result['errors']:
+                flash(f'Skipped line {line_no}: {message}.', 'warning')
+            if result['skipped'] > len(result['errors']):
+                flash(f"Skipped {result['skipped']} lines in total.", 'warning')
+            return redirect(url_for('entries.list'))
+
+    return render_template('entries/import.html')
+
+def _sse(event, value):
+    if event == 'ping':
+        return ': ping\n\n'
+    if event == 'mood':
+        value = {'mood': value}
+    elif event == 'reflection':
+        value = {'text': value}
+    return f'event: {event}\ndata: {json.dumps(value)}\n\n'
+
+@bp.route('/<int:id>/analysis/stream')
+@login_required
+def analysis_stream(id):
+    """Stream an entry's analysis to the browser as Server-Sent Events."""
+    entry = get_db(g.user['id']).execute(
+        'SELECT id, user_id, codec_decode(text) AS text FROM entries WHERE id = ?',
+        (id,)
+    ).fetchone()
+
+    if entry is None:
+        abort(404, f"Entry id {id} doesn't exist.")
+
+    if entry['user_id'] != g.user['id']:
+        abort(403)
+
+    events = analysis.stream_entry(g.user['id'], entry['id'], entry['text'])
+    return Response(
+        stream_with_context(_sse(event, value) for event, value in events),
+        mimetype='text/event-stream',
+        # Proxies must pass events through as they are written
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
 
 @bp.route('/<int:id>/delete', methods=('POST',))
 @login_required
 def delete(id):
     """Delete a journal entry."""
-    db = get_db()
+    db = get_db(g.user['id'])
     
     # Check if entry exists and belongs to current user
     entry = db.execute(
@@ -68,9 +270,85 @@ def delete(id):
     if entry['user_id'] != g.user['id']:
         abort(403)
     
-    # Delete the entry
+    # Delete the entry and any analysis still queued for it
+    db.execute('DELETE FROM analysis_jobs WHERE entry_id = ?', (id,))
+    fts.unindex_compressed(db, g.user['id'], [id])
     db.execute('DELETE FROM entries WHERE id = ?', (id,))
     db.commit()
+    fragments.discard(g.user['id'], [id])
     
     flash('Entry deleted successfully!', 'success')
-    return redirect(url_for('entries.list'))
\ No newline at end of file
+    return redirect(url_for('entries.list'))
+
+def _form_date(name):
+    value = request.form.get(name, '').strip()
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        abort(400, 'Invalid date.')
+
+@bp.route('/delete', methods=('POST',))
+@login_required
+def bulk_delete():
+    """Delete the selected entries, or every entry in a date range."""
+    ids = request.form.getlist('ids', type=int)
+    first, last = _form_date('from'), _form_date('to')
+    if not ids and first is None and last is None:
+        flash('Select entries or a date range to delete.')
+        return redirect(url_for('entries.list'))
+
+    # Dates are inclusive; timestamps are compared as stored (UTC)
+    start = first.isoformat() if first and not ids else None
+    end = (last + timedelta(days=1)).isoformat() if last and not ids else None
+    limit = current_app.config['DELETE_REQUEST_LIMIT']
+    if len(ids) > limit:
+        flash(f'Select at most {limit} entries to delete at a time.')
+        return redirect(url_for('entries.list'))
+
+    # No pause between chunks here: the request would only be held open
+    # longer. A range past the limit is deleted over several submissions.
+    db = get_db(g.user['id'])
+    deleted = retention.delete_entries(
+        db, g.user['id'], ids=ids or None, start=start, end=end,
+        chunk_size=current_app.config['DELETE_CHUNK_SIZE'], limit=limit,
+    )
+    # Hand back a little of the freed space now; `flask apply-retention`
+    # or `flask vacuum-db` returns the rest
+    retention.vacuum_step(db)
+
+    if not ids and deleted == limit and retention.has_entries(db, g.user['id'], start, end):
+        flash(f'Deleted {deleted} entries. More remain in that range; '
+              'delete it again to continue.', 'success')
+    else:
+        flash(f'Deleted {deleted} entries.', 'success')
+    return redirect(url_for('entries.list'))
+
+@bp.route('/cleanup', methods=('GET', 'POST'))
+@login_required
+def cleanup():
+    """Delete entries by date and choose how long entries are kept."""
+    if request.method == 'POST':
+        value = request.form.get('keep_days', '').strip()
+        keep_days = None
+        error = None
+
+        if value:
+            keep_days = int(value) if value.isdigit() else 0
+            if not 1 <= keep_days <= 36500:
+                error = 'Keep entries for 1 to 36500 days, or leave it empty to keep them forever.'
+
+        if error is not None:
+            flash(error)
+        else:
+            retention.set_rule(g.user['id'], keep_days)
+            if keep_days is None:
+                flash('Entries will be kept forever.', 'success')
+            else:
+                flash(f'Entries older than {keep_days} days will be deleted.', 'success')
+            return redirect(url_for('entries.cleanup'))
+
+    return render_template(
+        'entries/cleanup.html', keep_days=retention.get_rule(g.user['id'])
+    )
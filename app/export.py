@@ -0,0 +1,113 @@
+import csv
+import io
+import json
+import sys
+import zlib
+import click
+from flask import current_app
+from app.db import get_db
+
+EXPORT_FIELDS = ('id', 'timestamp', 'mood', 'mood_category', 'reflection', 'text')
+
+FORMATS = {
+    'jsonl': ('application/x-ndjson', 'jsonl'),
+    'csv': ('text/csv', 'csv'),
+}
+
+def iter_entry_chunks(db, user_id, chunk_size):
+    """Yield a user's entries, oldest first, in lists of up to ``chunk_size`` rows.
+
+    Rows are pulled from a single cursor with fetchmany(), so only one chunk
+    is ever held in memory.
+    """
+    # CAST keeps timestamps as stored text instead of parsing each into a datetime
+    cursor = db.execute(
+        'SELECT id, CAST(timestamp AS TEXT), mood, mood_category,'
+        ' codec_decode(reflection), codec_decode(text)'
+        ' FROM entries WHERE user_id = ?'
+        ' ORDER BY timestamp, id',
+        (user_id,)
+    )
+    try:
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield rows
+    finally:
+        cursor.close()
+
+_encode_json = json.JSONEncoder(ensure_ascii=False).encode
+
+def _row_values(row):
+    return dict(zip(EXPORT_FIELDS, row))
+
+def _encode_jsonl(chunks):
+    for rows in chunks:
+        yield ''.join(
+            _encode_json(_row_values(row)) + '\n' for row in rows
+        ).encode('utf-8')
+
+def _encode_csv(chunks):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS)
+    writer.writeheader()
+    for rows in chunks:
+        for row in rows:
+            writer.writerow(_row_values(row))
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+
+def _gzip(parts):
+    compressor = zlib.compressobj(wbits=31)  # 31 = gzip container
+    for part in parts:
+        data = compressor.compress(part)
+        if data:
+            yield data
+    yield compressor.flush()
+
+def generate_export(user_id, fmt='jsonl', compress=False, chunk_size=None):
+    """Stream a user's journal as JSONL or CSV bytes, optionally gzipped.
+
+    Memory use stays constant however large the journal is.
+    """
+    if chunk_size is None:
+        chunk_size = current_app.config['EXPORT_CHUNK_SIZE']
+
+    chunks = iter_entry_chunks(get_db(user_id), user_id, chunk_size)
+    parts = _encode_jsonl(chunks) if fmt == 'jsonl' else _encode_csv(chunks)
+    return _gzip(parts) if compress else parts
+
+def export_filename(fmt, compress):
+    """Download name for an export in ``fmt``."""
+    name = f'mindsight-export.{FORMATS[fmt][1]}'
+    return name + '.gz' if compress else name
+
+@click.command('export-entries')
+@click.argument('username')
+@click.option('--format', 'fmt', type=click.Choice(sorted(FORMATS)), default='jsonl')
+@click.option('--gzip', 'compress', is_flag=True, help='Gzip the output.')
+@click.option('--output', type=click.Path(dir_okay=False, writable=True),
+              help='File to write to instead of standard output.')
+def export_entries_command(username, fmt, compress, output):
+    """Export a user's journal entries."""
+    user = get_db().execute(
+        'SELECT id FROM users WHERE username = ?', (username,)
+    ).fetchone()
+    if user is None:
+        raise click.ClickException(f'User {username} does not exist.')
+
+    out = open(output, 'wb') if output else sys.stdout.buffer
+    try:
+        for part in generate_export(user['id'], fmt, compress):
+            out.write(part)
+    finally:
+        if output:
+            out.close()
+        else:
+            out.flush()
+
+def init_app(app):
+    """Register export CLI commands with the Flask app."""
+    app.cli.add_command(export_entries_command)
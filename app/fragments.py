@@ -0,0 +1,234 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app, request
+from markupsafe import Markup
+from app.db import shard_of
+
+CARD_TEMPLATE = 'entries/_entry.html'
+
+
+class FragmentCache:
+    """Rendered entry cards by (user id, entry id).
+
+    Each card is stored with the version it was rendered at, and a lookup
+    with another version is a miss, so a changed entry is never served
+    stale and only its newest card is kept. Lookups go to an in-process
+    LRU first and then, if ``path`` is set, to an SQLite file shared by
+    every worker process, which is trimmed to ``max_rows``.
+    """
+
+    # How many file writes happen between trims of excess rows
+    trim_every = 100
+
+    def __init__(self, max_entries=4096, path=None, max_rows=100_000, busy_timeout=5.0):
+        self.max_entries = max_entries
+        self.path = path
+        self.max_rows = max_rows
+        self.busy_timeout = busy_timeout
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._writes = 0
+        self.stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'stores': 0}
+
+    def _connection(self):
+        # One connection per thread to the shared file, made on first use
+        # and again in a forked child
+        pid, db = getattr(self._local, 'connection', (None, None))
+        if pid != os.getpid():
+            db = sqlite3.connect(self.path, timeout=self.busy_timeout)
+            db.execute('PRAGMA journal_mode = WAL')
+            db.execute('PRAGMA synchronous = OFF')
+            db.execute(
+                'CREATE TABLE IF NOT EXISTS fragments ('
+                ' user_id INTEGER NOT NULL, entry_id INTEGER NOT NULL,'
+                ' version TEXT NOT NULL, html TEXT NOT NULL, stored_at REAL NOT NULL,'
+                ' PRIMARY KEY (user_id, entry_id))'
+            )
+            self._local.connection = (os.getpid(), db)
+        return db
+
+    def _remember(self, items):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            for key, version, html in items:
+                self._entries[key] = (version, html)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_many(self, user_id, versions):
+        """Cached cards for ``versions``, a {entry id: version} dict.
+
+        Returns {entry id: html} for the entries found at that version.
+        """
+        found = {}
+        with self._lock:
+            for entry_id, version in versions.items():
+                item = self._entries.get((user_id, entry_id))
+                if item is not None and item[0] == version:
+                    self._entries.move_to_end((user_id, entry_id))
+                    found[entry_id] = item[1]
+            self.stats['memory_hits'] += len(found)
+
+        missing = [entry_id for entry_id in versions if entry_id not in found]
+        if self.path and missing:
+            rows = self._connection().execute(
+                'SELECT entry_id, version, html FROM fragments WHERE user_id = ?'
+                f" AND entry_id IN ({', '.join('?' * len(missing))})",
+                [user_id] + missing
+            ).fetchall()
+            loaded = [((user_id, entry_id), version, html) for entry_id, version, html in rows
+                      if versions[entry_id] == version]
+            self._remember(loaded)
+            for (_, entry_id), _, html in loaded:
+                found[entry_id] = html
+            with self._lock:
+                self.stats['disk_hits'] += len(loaded)
+
+        with self._lock:
+            self.stats['misses'] += len(versions) - len(found)
+        return found
+
+    def put_many(self, user_id, cards):
+        """Cache cards given as (entry id, version, html) tuples."""
+        if not cards:
+            return
+        self._remember([((user_id, entry_id), version, html)
+                        for entry_id, version, html in cards])
+        with self._lock:
+            self.stats['stores'] += len(cards)
+            self._writes += 1
+            trim = self._writes % self.trim_every == 0
+
+        if self.path:
+            db = self._connection()
+            now = time.time()
+            db.executemany(
+                'INSERT OR REPLACE INTO fragments (user_id, entry_id, version, html, stored_at)'
+                ' VALUES (?, ?, ?, ?, ?)',
+                [(user_id, entry_id, version, html, now) for entry_id, version, html in cards]
+            )
+            if trim:
+                db.execute(
+                    'DELETE FROM fragments WHERE rowid IN ('
+                    ' SELECT rowid FROM fragments ORDER BY stored_at DESC LIMIT -1 OFFSET ?'
+                    ')',
+                    (self.max_rows,)
+                )
+            db.commit()
+
+    def discard(self, user_id, entry_ids=None):
+        """Forget the cards of deleted entries, or all of a user's cards for None."""
+        with self._lock:
+            if entry_ids is None:
+                for key in [key for key in self._entries if key[0] == user_id]:
+                    del self._entries[key]
+            else:
+                for entry_id in entry_ids:
+                    self._entries.pop((user_id, entry_id), None)
+
+        if self.path:
+            db = self._connection()
+            if entry_ids is None:
+                db.execute('DELETE FROM fragments WHERE user_id = ?', (user_id,))
+            else:
+                entry_ids = list(entry_ids)
+                for i in range(0, len(entry_ids), 500):
+                    chunk = entry_ids[i:i + 500]
+                    db.execute(
+                        'DELETE FROM fragments WHERE user_id = ?'
+                        f" AND entry_id IN ({', '.join('?' * len(chunk))})",
+                        [user_id] + chunk
+                    )
+            db.commit()
+
+    def clear(self):
+        """Empty both tiers and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            for name in self.stats:
+                self.stats[name] = 0
+        if self.path:
+            db = self._connection()
+            db.execute('DELETE FROM fragments')
+            db.commit()
+
+    @property
+    def hit_rate(self):
+        hits = self.stats['memory_hits'] + self.stats['disk_hits']
+        total = hits + self.stats['misses']
+        return hits / total if total else 0.0
+
+
+def discard(user_id, entry_ids=None):
+    """Drop cached cards of ``user_id``'s deleted entries (all cards for None)."""
+    cache = current_app.extensions.get('fragment_cache')
+    if cache is not None:
+        cache.discard(user_id, entry_ids)
+
+
+def _namespace(user_id):
+    # Everything outside the entry row that the card's HTML depends on. A
+    # user moved to another shard gets new entry ids, which may be ids of
+    # their other entries before; ids are never reused within one shard.
+    raw = (f"{current_app.extensions['deploy_fingerprint']}|{request.script_root}"
+           f"|{shard_of(user_id)}")
+    return hashlib.sha256(raw.encode()).hexdigest()[:12]
+
+
+def card_version(entry, namespace):
+    """What a rendered card of ``entry`` depends on, as a string."""
+    return f"{namespace}|{entry['revision']}|{entry['pending']}|{entry['timestamp']}"
+
+
+def _renderer():
+    # Renders one card with the same context the list page would give it
+    template = current_app.jinja_env.get_template(CARD_TEMPLATE)
+    context = {}
+    current_app.update_template_context(context)
+    return lambda entry: template.render(context, entry=entry)
+
+
+def render_cards(user_id, entries):
+    """HTML of the entry cards for ``entries``, rendered or from the cache.
+
+    Entries must carry the columns ``fetch_page`` selects, including
+    ``revision`` and ``pending``.
+    """
+    cache = current_app.extensions.get('fragment_cache')
+    if cache is None:
+        render = _renderer()
+        return Markup(''.join(render(entry) for entry in entries))
+
+    namespace = _namespace(user_id)
+    versions = {entry['id']: card_version(entry, namespace) for entry in entries}
+    cards = cache.get_many(user_id, versions)
+
+    if len(cards) < len(entries):
+        render = _renderer()
+        rendered = []
+        for entry in entries:
+            if entry['id'] not in cards:
+                cards[entry['id']] = render(entry)
+                rendered.append((entry['id'], versions[entry['id']], cards[entry['id']]))
+        cache.put_many(user_id, rendered)
+
+    return Markup(''.join(cards[entry['id']] for entry in entries))
+
+
+def init_app(app):
+    """Attach the rendered entry card cache to the Flask app."""
+    if app.config['FRAGMENT_CACHE_SIZE'] <= 0 and not app.config['FRAGMENT_CACHE_PATH']:
+        return
+    app.extensions['fragment_cache'] = FragmentCache(
+        max_entries=app.config['FRAGMENT_CACHE_SIZE'],
+        path=app.config['FRAGMENT_CACHE_PATH'],
+        max_rows=app.config['FRAGMENT_CACHE_MAX_ROWS'],
+        busy_timeout=app.config['SQLITE_BUSY_TIMEOUT'] / 1000,
+    )
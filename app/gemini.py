@@ -1,11 +1,139 @@
+import atexit
+import hashlib
 import os
+import re
+import threading
+import time
+import weakref
+from collections import OrderedDict
 from flask import current_app
+from app import metrics, resilience
+from app.db import get_db
 
-try:
-    # LangChain + Google Generative AI integration
-    from langchain_google_genai import ChatGoogleGenerativeAI
-except Exception:  # pragma: no cover
-    ChatGoogleGenerativeAI = None
+# LangChain + Google Generative AI integration. The SDK takes seconds to
+# import and most processes (CLI commands, tests, idle workers) never call
+# it, so it is imported on first use; see _chat_model_class and prewarm.
+ChatGoogleGenerativeAI = None
+_sdk_imported = False
+_sdk_lock = threading.Lock()
+
+
+def _chat_model_class():
+    """Return ChatGoogleGenerativeAI, importing it the first time.
+
+    Returns None if langchain-google-genai is not installed.
+    """
+    global ChatGoogleGenerativeAI, _sdk_imported
+    if ChatGoogleGenerativeAI is None and not _sdk_imported:
+        with _sdk_lock:
+            if not _sdk_imported:
+                try:
+                    from langchain_google_genai import ChatGoogleGenerativeAI as cls
+                except Exception:  # pragma: no cover
+                    cls = None
+                # Tests and benchmarks may have installed a stand-in already
+                if ChatGoogleGenerativeAI is None:
+                    ChatGoogleGenerativeAI = cls
+                _sdk_imported = True
+    return ChatGoogleGenerativeAI
+
+
+def prewarm():
+    """Import the Gemini SDK now rather than on the first analysis.
+
+    Call it from a server's post-fork hook, or set GEMINI_PREWARM to have
+    the app do it in the background at startup. Returns True if the SDK
+    is available.
+    """
+    return _chat_model_class() is not None
+
+
+# Shared chat models keyed by (model, api key, temperature). Each one holds its
+# own connection to the API, so reusing it keeps that connection alive across
+# calls instead of paying client and TLS setup per entry.
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_chat_model(model_name, api_key, temperature=0.3, **options):
+    """Return the process-wide chat model for these settings, creating it lazily.
+
+    Extra ``options`` (e.g. ``timeout``, ``max_retries``) go to the SDK client.
+    """
+    key = (model_name, api_key, temperature, tuple(sorted(options.items())))
+    llm = _clients.get(key)
+    if llm is None:
+        with _clients_lock:
+            llm = _clients.get(key)
+            if llm is None:
+                llm = _chat_model_class()(
+                    model=model_name, api_key=api_key, temperature=temperature,
+                    **options
+                )
+                _clients[key] = llm
+    return llm
+
+
+def _close_chat_model(llm):
+    """Close the transport behind a chat model if the SDK exposes one."""
+    transport = getattr(getattr(llm, 'client', None), 'transport', None)
+    close = getattr(transport, 'close', None)
+    if close is not None:
+        try:
+            close()
+        except Exception:  # pragma: no cover
+            pass
+
+
+def close_clients():
+    """Close and forget every shared chat model."""
+    with _clients_lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for llm in clients:
+        _close_chat_model(llm)
+
+
+def _forget_clients_after_fork():
+    # Connections inherited from the parent are not safe to use or close in a
+    # forked worker, so the child simply starts with an empty registry.
+    global _clients_lock
+    _clients_lock = threading.Lock()
+    _clients.clear()
+
+
+atexit.register(close_clients)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_forget_clients_after_fork)
+
+
+# Bump whenever _build_prompt or _build_batch_prompt changes meaningfully, so
+# `flask reanalyze` can find analyses made with an older prompt
+PROMPT_VERSION = 1
+
+DEFAULT_MODEL = 'gemini-2.5-flash'
+
+
+def current_model():
+    """Name of the Gemini model new analyses are made with."""
+    return os.environ.get('GEMINI_MODEL', DEFAULT_MODEL)
+
+
+def _build_batch_prompt(texts) -> str:
+    entries = '\n\n'.join(
+        f'[{i}] {text}' for i, text in enumerate(texts, 1)
+    )
+    return (
+        f"Analyze each of these {len(texts)} journal entries and provide for each one:\n"
+        "1. Mood: Describe the emotional state in 2-3 words (e.g., \"stressed but hopeful\", \"happy and excited\")\n"
+        "2. Reflection: Brief supportive reflection and recommendation if applicable (1-2 sentences maximum)\n\n"
+        f"Journal entries:\n{entries}\n\n"
+        "Format your response exactly as, with the entry number on every line:\n"
+        "[1] MOOD: <mood here>\n"
+        "[1] REFLECTION: <reflection here>\n"
+        "[2] MOOD: <mood here>\n"
+        "[2] REFLECTION: <reflection here>"
+    )
 
 
 def _build_prompt(text: str) -> str:
@@ -25,6 +153,326 @@ essential_fallback = {
     'reflection': 'Unable to generate reflection at this time.'
 }
 
+missing_key_fallback = {
+    'mood': 'neutral',
+    'reflection': 'Unable to generate reflection (API key missing)'
+}
+
+
+def is_fallback(analysis):
+    """Return True if ``analysis`` is a placeholder rather than a real result."""
+    return analysis == essential_fallback or analysis == missing_key_fallback
+
+
+def _normalize(text):
+    """Collapse whitespace so trivially different submissions share a cache key."""
+    return ' '.join(text.split())
+
+
+def cache_key(text, model_name):
+    """Content address of an analysis: the model plus the exact prompt it would see."""
+    payload = f'{model_name}\0{_build_prompt(_normalize(text))}'
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class AnalysisCache:
+    """Analysis results by content address.
+
+    Lookups go to an in-process LRU first and then to the ``analysis_cache``
+    table, which is shared by every worker and survives restarts. Entries
+    expire after ``ttl`` seconds; the table is trimmed to ``max_rows``.
+    """
+
+    # How many table writes happen between trims of expired/excess rows
+    trim_every = 100
+
+    def __init__(self, max_entries=1024, ttl=30 * 24 * 3600,
+                 max_rows=100_000, persist=True):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_rows = max_rows
+        self.persist = persist
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'stores': 0}
+
+    def _remember(self, key, analysis, expires_at):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (expires_at, analysis)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, key):
+        """Return a cached analysis for ``key`` or None."""
+        now = time.time()
+
+        with self._lock:
+            item = self._entries.get(key)
+            if item is not None:
+                if item[0] > now:
+                    self._entries.move_to_end(key)
+                    self.stats['memory_hits'] += 1
+                    return dict(item[1])
+                del self._entries[key]
+
+        if self.persist:
+            row = get_db().execute(
+                'SELECT mood, reflection, created_at FROM analysis_cache WHERE key = ?',
+                (key,)
+            ).fetchone()
+            if row is not None and row['created_at'] + self.ttl > now:
+                analysis = {'mood': row['mood'], 'reflection': row['reflection']}
+                self._remember(key, analysis, row['created_at'] + self.ttl)
+                with self._lock:
+                    self.stats['disk_hits'] += 1
+                return dict(analysis)
+
+        with self._lock:
+            self.stats['misses'] += 1
+        return None
+
+    def put(self, key, analysis):
+        """Cache a real analysis. Fallback placeholders are never stored."""
+        if is_fallback(analysis):
+            return
+
+        now = time.time()
+        self._remember(key, dict(analysis), now + self.ttl)
+        with self._lock:
+            self.stats['stores'] += 1
+            self._writes += 1
+            trim = self._writes % self.trim_every == 0
+
+        if self.persist:
+            db = get_db()
+            db.execute(
+                'INSERT OR REPLACE INTO analysis_cache (key, mood, reflection, created_at)'
+                ' VALUES (?, ?, ?, ?)',
+                (key, analysis['mood'], analysis['reflection'], now)
+            )
+            if trim:
+                self._trim(db, now)
+            db.commit()
+
+    def _trim(self, db, now):
+        db.execute('DELETE FROM analysis_cache WHERE created_at <= ?', (now - self.ttl,))
+        db.execute(
+            'DELETE FROM analysis_cache WHERE key IN ('
+            ' SELECT key FROM analysis_cache ORDER BY created_at DESC LIMIT -1 OFFSET ?'
+            ')',
+            (self.max_rows,)
+        )
+
+    def clear(self):
+        """Empty the in-process tier and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            for name in self.stats:
+                self.stats[name] = 0
+
+    @property
+    def hit_rate(self):
+        hits = self.stats['memory_hits'] + self.stats['disk_hits']
+        total = hits + self.stats['misses']
+        return hits / total if total else 0.0
+
+
+def _parse_response(generated_text):
+    """Pull MOOD/REFLECTION out of a model response.
+
+    Returns the analysis and whether a MOOD line was actually found.
+    """
+    mood = 'neutral'
+    reflection = 'Keep writing to track your journey.'
+    found = False
+    for line in (generated_text or '').splitlines():
+        if line.strip().upper().startswith('MOOD:'):
+            mood = line.split(':', 1)[1].strip() if ':' in line else mood
+            found = True
+        elif line.strip().upper().startswith('REFLECTION:'):
+            reflection = line.split(':', 1)[1].strip() if ':' in line else reflection
+
+    return {'mood': mood, 'reflection': reflection}, found
+
+
+class StreamParser:
+    """Incremental version of ``_parse_response`` for a streamed response.
+
+    ``feed`` takes each chunk of text as it arrives and returns the events
+    it completes: ``('mood', mood)`` once the MOOD line has ended, and
+    ``('reflection', text)`` for every new piece of the REFLECTION line.
+    """
+
+    def __init__(self):
+        self.mood = None
+        self.reflection = None
+        self._line = ''
+        self._reflecting = False
+        self._sent = 0
+
+    def feed(self, chunk):
+        events = []
+        for i, piece in enumerate(chunk.split('\n')):
+            if i:
+                events.extend(self._end_line())
+            self._line += piece
+            events.extend(self._reflection_progress())
+        return events
+
+    def finish(self):
+        """Flush the last line. Returns (events, analysis, parsed)."""
+        events = self._end_line()
+        analysis = {
+            'mood': self.mood or 'neutral',
+            'reflection': self.reflection or 'Keep writing to track your journey.',
+        }
+        return events, analysis, self.mood is not None
+
+    def _reflection_progress(self):
+        head = self._line.lstrip()
+        if not self._reflecting:
+            # Only the first REFLECTION line counts, as it is streamed as it comes
+            if self.reflection is not None or not head.upper().startswith('REFLECTION:'):
+                return []
+            self._reflecting = True
+        value = head.split(':', 1)[1].lstrip()
+        new = value[self._sent:]
+        self._sent = len(value)
+        return [('reflection', new)] if new else []
+
+    def _end_line(self):
+        line = self._line.strip()
+        self._line = ''
+        if self._reflecting:
+            self.reflection = line.split(':', 1)[1].strip()
+            self._reflecting = False
+            self._sent = 0
+        elif self.mood is None and line.upper().startswith('MOOD:'):
+            self.mood = line.split(':', 1)[1].strip()
+            return [('mood', self.mood)]
+        return []
+
+
+_BATCH_LINE = re.compile(r'^\[(\d+)\]\s*(MOOD|REFLECTION)\s*:\s*(.*)$', re.IGNORECASE)
+
+
+def _parse_batch_response(generated_text, count):
+    """Map an indexed batch response back to its entries.
+
+    Returns ``{position: analysis}`` for the entries that came back with both
+    a mood and a reflection; anything missing or malformed is left out.
+    """
+    fields = {}
+    for line in (generated_text or '').splitlines():
+        # Tolerate markdown decoration such as "**[1] MOOD:** ..." or "- [1] ..."
+        line = line.strip().lstrip('*-# ').replace('**', '')
+        match = _BATCH_LINE.match(line)
+        if match is None:
+            continue
+        index = int(match.group(1))
+        value = match.group(3).strip()
+        if 1 <= index <= count and value:
+            fields.setdefault(index - 1, {})[match.group(2).lower()] = value
+
+    return {
+        position: {'mood': found['mood'], 'reflection': found['reflection']}
+        for position, found in fields.items()
+        if 'mood' in found and 'reflection' in found
+    }
+
+
+def _estimate_tokens(text):
+    # Roughly four characters per token for English prose
+    return len(text) // 4 + 1
+
+
+def _plan_batches(texts, batch_size, token_budget):
+    """Group positions of ``texts`` into batches within the size and token limits."""
+    batches = []
+    batch, tokens = [], 0
+    for position, text in enumerate(texts):
+        cost = _estimate_tokens(text)
+        if batch and (len(batch) >= batch_size or tokens + cost > token_budget):
+            batches.append(batch)
+            batch, tokens = [], 0
+        batch.append(position)
+        tokens += cost
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def _chat_model(model_name, api_key):
+    config = current_app.config
+    # The SDK's own timeout and retries would hold a worker far past our
+    # deadline; failed analyses are retried by the job queue instead
+    return get_chat_model(
+        model_name, api_key, temperature=0.3,
+        timeout=config['GEMINI_TIMEOUT'],
+        max_retries=config['GEMINI_MAX_RETRIES'],
+    )
+
+
+def _invoke(llm, prompt):
+    """Send a prompt through the app's call guard and return the response text.
+
+    Raises ``resilience.Unavailable`` when the circuit is open, no
+    concurrency slot frees up, or Gemini misses the deadline.
+    """
+    start = time.perf_counter()
+    outcome = 'error'
+    try:
+        res = current_app.extensions['gemini_guard'].call(llm.invoke, prompt)
+        outcome = 'ok'
+    except resilience.CircuitOpen:
+        outcome = 'circuit_open'
+        raise
+    except resilience.Overloaded:
+        outcome = 'overloaded'
+        raise
+    except resilience.DeadlineExceeded:
+        outcome = 'timeout'
+        raise
+    finally:
+        metrics.observe('llm', time.perf_counter() - start, outcome)
+    # res.content is a string response for Chat models in LangChain
+    return getattr(res, 'content', None) or str(res)
+
+
+def _chunks(llm, prompt):
+    for chunk in llm.stream(prompt):
+        yield getattr(chunk, 'content', None) or ''
+
+
+def _stream(llm, prompt):
+    """Like ``_invoke`` but yields the response text as it is generated."""
+    start = time.perf_counter()
+    outcome = 'error'
+    try:
+        yield from current_app.extensions['gemini_guard'].stream(_chunks, llm, prompt)
+        outcome = 'ok'
+    except resilience.CircuitOpen:
+        outcome = 'circuit_open'
+        raise
+    except resilience.Overloaded:
+        outcome = 'overloaded'
+        raise
+    except resilience.DeadlineExceeded:
+        outcome = 'timeout'
+        raise
+    finally:
+        metrics.observe('llm', time.perf_counter() - start, outcome)
+
+
+def unavailable_until():
+    """Wall-clock time the circuit to Gemini reopens, or None if it is not open."""
+    breaker = current_app.extensions['gemini_guard'].breaker
+    return breaker.retry_at() if breaker.state == 'open' else None
+
 
 def call_gemini_api(text):
     """
@@ -32,39 +480,199 @@ def call_gemini_api(text):
     Returns dict with 'mood' and 'reflection' keys and never raises in normal flow.
     """
     api_key = os.environ.get('GEMINI_API_KEY')
-    model_name = os.environ.get('GEMINI_MODEL', 'gemini-2.5-flash')
+    model_name = current_model()
+
+    cache = current_app.extensions.get('analysis_cache')
+    key = cache_key(text, model_name)
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
 
     if not api_key:
         current_app.logger.warning('GEMINI_API_KEY not found')
-        return {
-            'mood': 'neutral',
-            'reflection': 'Unable to generate reflection (API key missing)'
-        }
+        return missing_key_fallback
 
-    if ChatGoogleGenerativeAI is None:
+    if _chat_model_class() is None:
         current_app.logger.error('langchain-google-genai is not installed')
         return essential_fallback
 
     try:
-        llm = ChatGoogleGenerativeAI(model=model_name, api_key=api_key, temperature=0.3)
+        llm = _chat_model(model_name, api_key)
         prompt = _build_prompt(text)
-        res = llm.invoke(prompt)
-        # res.content is a string response for Chat models in LangChain
-        generated_text = getattr(res, 'content', None) or str(res)
+        generated_text = _invoke(llm, prompt)
 
         # Extract mood and reflection with simple parsing
-        mood = 'neutral'
-        reflection = 'Keep writing to track your journey.'
-        for line in (generated_text or '').splitlines():
-            if line.strip().upper().startswith('MOOD:'):
-                mood = line.split(':', 1)[1].strip() if ':' in line else mood
-            elif line.strip().upper().startswith('REFLECTION:'):
-                reflection = line.split(':', 1)[1].strip() if ':' in line else reflection
-
-        return {
-            'mood': mood,
-            'reflection': reflection
-        }
+        analysis, parsed = _parse_response(generated_text)
+    except resilience.Unavailable as e:
+        current_app.logger.warning(f'Gemini unavailable: {e}')
+        return essential_fallback
     except Exception as e:  # catch SDK/network/model errors
         current_app.logger.error(f'Gemini API error via LangChain: {e}')
         return essential_fallback
+
+    if cache is not None and parsed:
+        cache.put(key, analysis)
+    return analysis
+
+
+def stream_gemini_api(text):
+    """
+    Analyze one journal entry, yielding events while Gemini's answer streams in:
+    ('mood', mood) once the mood line is complete, ('reflection', text) for
+    each new piece of the reflection, and finally ('done', analysis) with the
+    result call_gemini_api would have returned. Never raises in normal flow.
+    """
+    api_key = os.environ.get('GEMINI_API_KEY')
+    model_name = current_model()
+
+    cache = current_app.extensions.get('analysis_cache')
+    key = cache_key(text, model_name)
+    cached = cache.get(key) if cache is not None else None
+    if cached is not None:
+        yield 'mood', cached['mood']
+        yield 'reflection', cached['reflection']
+        yield 'done', cached
+        return
+
+    if not api_key:
+        current_app.logger.warning('GEMINI_API_KEY not found')
+        yield 'done', missing_key_fallback
+        return
+
+    if _chat_model_class() is None:
+        current_app.logger.error('langchain-google-genai is not installed')
+        yield 'done', essential_fallback
+        return
+
+    parser = StreamParser()
+    try:
+        llm = _chat_model(model_name, api_key)
+        for chunk in _stream(llm, _build_prompt(text)):
+            yield from parser.feed(chunk)
+        events, analysis, parsed = parser.finish()
+        yield from events
+    except resilience.Unavailable as e:
+        current_app.logger.warning(f'Gemini unavailable: {e}')
+        yield 'done', essential_fallback
+        return
+    except Exception as e:  # catch SDK/network/model errors
+        current_app.logger.error(f'Gemini streaming error via LangChain: {e}')
+        yield 'done', essential_fallback
+        return
+
+    if cache is not None and parsed:
+        cache.put(key, analysis)
+    yield 'done', analysis
+
+
+def call_gemini_api_batch(texts):
+    """
+    Analyze several journal entries with as few Gemini requests as possible.
+    Entries are packed into prompts of up to GEMINI_BATCH_SIZE entries and
+    GEMINI_BATCH_TOKEN_BUDGET estimated tokens; any entry the batch response
+    does not cover is analyzed on its own. Returns one result per text, in order.
+    """
+    if len(texts) <= 1:
+        return [call_gemini_api(text) for text in texts]
+
+    api_key = os.environ.get('GEMINI_API_KEY')
+    model_name = current_model()
+    if not api_key or _chat_model_class() is None:
+        return [call_gemini_api(text) for text in texts]
+
+    cache = current_app.extensions.get('analysis_cache')
+    results = [None] * len(texts)
+
+    # Serve what we can from the cache and analyze each distinct text once
+    positions_by_key = {}
+    for position, text in enumerate(texts):
+        key = cache_key(text, model_name)
+        cached = cache.get(key) if cache is not None and key not in positions_by_key else None
+        if cached is not None:
+            results[position] = cached
+        else:
+            positions_by_key.setdefault(key, []).append(position)
+
+    keys = list(positions_by_key)
+    unique_texts = [texts[positions_by_key[key][0]] for key in keys]
+    batches = _plan_batches(
+        unique_texts,
+        current_app.config['GEMINI_BATCH_SIZE'],
+        current_app.config['GEMINI_BATCH_TOKEN_BUDGET'],
+    )
+
+    for batch in batches:
+        parsed = {}
+        unavailable = False
+        if len(batch) > 1:
+            try:
+                llm = _chat_model(model_name, api_key)
+                generated_text = _invoke(
+                    llm, _build_batch_prompt([unique_texts[i] for i in batch])
+                )
+                parsed = _parse_batch_response(generated_text, len(batch))
+            except resilience.Unavailable as e:
+                # Retrying entry by entry would only wait out more deadlines
+                current_app.logger.warning(f'Gemini unavailable: {e}')
+                unavailable = True
+            except Exception as e:  # catch SDK/network/model errors
+                current_app.logger.error(f'Gemini batch error via LangChain: {e}')
+
+        for offset, unique in enumerate(batch):
+            key = keys[unique]
+            if offset in parsed:
+                analysis = parsed[offset]
+                if cache is not None:
+                    cache.put(key, analysis)
+            elif unavailable:
+                analysis = essential_fallback
+            else:
+                analysis = call_gemini_api(unique_texts[unique])
+            for position in positions_by_key[key]:
+                results[position] = dict(analysis)
+
+    return results
+
+
+# Call guards of the apps in this process, stopped at exit. Held weakly so
+# a discarded app's guard, and its pool threads, can go away with it.
+_guards = weakref.WeakSet()
+
+
+def _shutdown_guards():
+    for guard in list(_guards):
+        guard.shutdown()
+
+
+atexit.register(_shutdown_guards)
+
+
+def init_app(app):
+    """Attach the analysis result cache and the Gemini call guard to the Flask app.
+
+    With GEMINI_PREWARM the SDK is imported in a background thread too.
+    """
+    app.extensions['analysis_cache'] = AnalysisCache(
+        max_entries=app.config['ANALYSIS_CACHE_SIZE'],
+        ttl=app.config['ANALYSIS_CACHE_TTL'],
+        max_rows=app.config['ANALYSIS_CACHE_MAX_ROWS'],
+        persist=app.config['ANALYSIS_CACHE_PERSIST'],
+    )
+    guard = resilience.CallGuard(
+        timeout=app.config['GEMINI_TIMEOUT'],
+        breaker=resilience.CircuitBreaker(
+            threshold=app.config['GEMINI_BREAKER_THRESHOLD'],
+            cooldown=app.config['GEMINI_BREAKER_COOLDOWN'],
+        ),
+        limiter=resilience.AdaptiveLimiter(
+            min_limit=app.config['GEMINI_CONCURRENCY_MIN'],
+            max_limit=app.config['GEMINI_CONCURRENCY_MAX'],
+            latency_target=app.config['GEMINI_LATENCY_TARGET'],
+        ),
+    )
+    app.extensions['gemini_guard'] = guard
+    _guards.add(guard)
+
+    if app.config['GEMINI_PREWARM']:
+        threading.Thread(target=prewarm, name='gemini-prewarm', daemon=True).start()
@@ -0,0 +1,187 @@
+import functools
+import gzip
+import hashlib
+import os
+from flask import current_app, g, make_response, request, session
+from werkzeug.security import safe_join
+from app.db import get_db
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+# Text responses worth compressing; images are compressed already
+COMPRESSIBLE = {
+    'text/html', 'text/css', 'text/plain', 'text/csv', 'application/json',
+    'application/javascript', 'text/javascript', 'image/svg+xml',
+}
+
+# Larger static files are sent as they are rather than read into memory
+STATIC_COMPRESS_MAX = 1024 * 1024
+
+# Encodings we can produce, in order of preference, with their ETag suffixes
+ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def _encoded_etag(etag, encoding):
+    return f'{etag}-{encoding}'
+
+
+def _deploy_fingerprint(app):
+    """Hash of the templates and static files, so a deploy changes every ETag."""
+    digest = hashlib.sha256()
+    for folder in (app.template_folder, app.static_folder):
+        root = os.path.join(app.root_path, folder)
+        for dirpath, dirnames, filenames in sorted(os.walk(root)):
+            dirnames.sort()
+            for name in sorted(filenames):
+                with open(os.path.join(dirpath, name), 'rb') as f:
+                    digest.update(name.encode())
+                    digest.update(f.read())
+    return digest.hexdigest()[:12]
+
+
+def user_version(db, user_id):
+    """The change counter of ``user_id``'s entries, 0 if they never wrote one."""
+    row = db.execute(
+        'SELECT version FROM user_versions WHERE user_id = ?', (user_id,)
+    ).fetchone()
+    return row['version'] if row is not None else 0
+
+
+def entries_etag(user_id):
+    """Strong ETag for a page built from the user's entries and the request URL."""
+    version = user_version(get_db(user_id), user_id)
+    raw = f"{current_app.extensions['deploy_fingerprint']}|{user_id}|{version}|{request.full_path}"
+    return hashlib.sha256(raw.encode()).hexdigest()[:32]
+
+
+def conditional(view):
+    """Answer repeat GETs of a per-user entries page with 304 Not Modified.
+
+    The ETag changes whenever one of the user's entries is written (see
+    ``user_versions``), so an unchanged page is never queried or rendered
+    twice. Pages about to show a flashed message are always rendered.
+    """
+    @functools.wraps(view)
+    def wrapped_view(**kwargs):
+        if request.method != 'GET' or session.get('_flashes'):
+            return view(**kwargs)
+
+        etag = entries_etag(g.user['id'])
+        for tag in [etag] + [_encoded_etag(etag, e) for e in ENCODINGS]:
+            if request.if_none_match.contains(tag):
+                response = current_app.response_class(status=304)
+                response.set_etag(tag)
+                break
+        else:
+            response = make_response(view(**kwargs))
+            response.set_etag(etag)
+
+        # Browsers may keep the page but must check it is current before use
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        response.vary.add('Cookie')
+        return response
+
+    return wrapped_view
+
+
+# Content hashes of static files, by filename: (mtime, fingerprint)
+_static_hashes = {}
+
+
+def static_fingerprint(filename):
+    """Short content hash of a file in static/, or None if there is no such file."""
+    path = safe_join(current_app.static_folder, filename)
+    if path is None:
+        return None
+    try:
+        mtime = os.stat(path).st_mtime
+    except OSError:
+        return None
+    cached = _static_hashes.get(filename)
+    if cached is None or cached[0] != mtime:
+        with open(path, 'rb') as f:
+            cached = (mtime, hashlib.sha256(f.read()).hexdigest()[:12])
+        _static_hashes[filename] = cached
+    return cached[1]
+
+
+def _fingerprint_static_urls(endpoint, values):
+    # url_for('static', filename=...) gains ?v=<content hash>
+    if endpoint == 'static' and 'filename' in values and 'v' not in values:
+        fingerprint = static_fingerprint(values['filename'])
+        if fingerprint is not None:
+            values['v'] = fingerprint
+
+
+def _accepted_encoding():
+    accepted = request.accept_encodings
+    for encoding in ENCODINGS:
+        if accepted[encoding]:
+            return encoding
+    return None
+
+
+def _compress(data, encoding, level):
+    if encoding == 'br':
+        return brotli.compress(data, quality=min(level, 11))
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+def _after_request(response):
+    config = current_app.config
+
+    # Fingerprinted static URLs never change content, so cache them for good
+    if (request.endpoint == 'static' and response.status_code == 200
+            and request.args.get('v') == static_fingerprint(request.view_args['filename'])):
+        response.cache_control.no_cache = False
+        response.cache_control.public = True
+        response.cache_control.max_age = config['STATIC_MAX_AGE']
+        response.cache_control.immutable = True
+
+    if not config['HTTP_COMPRESSION']:
+        return response
+
+    response.vary.add('Accept-Encoding')
+    if (response.status_code != 200 or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE):
+        return response
+    if response.direct_passthrough:
+        # Static files arrive as file wrappers of known size; small ones are read
+        size = response.content_length
+        if size is None or not config['COMPRESS_MIN_SIZE'] <= size <= STATIC_COMPRESS_MAX:
+            return response
+        response.direct_passthrough = False
+    elif response.is_streamed:
+        # Streamed bodies (exports, event streams) go out as they are produced
+        return response
+    encoding = _accepted_encoding()
+    if encoding is None:
+        return response
+
+    data = response.get_data()
+    if len(data) < config['COMPRESS_MIN_SIZE']:
+        return response
+
+    response.set_data(_compress(data, encoding, config['COMPRESS_LEVEL']))
+    response.headers['Content-Encoding'] = encoding
+    etag, weak = response.get_etag()
+    if etag is not None:
+        # A strong ETag names the exact bytes, so each encoding gets its own
+        encoded = _encoded_etag(etag, encoding) if not weak else etag
+        response.set_etag(encoded, weak)
+        if request.if_none_match.contains(encoded):
+            response.status_code = 304
+            response.set_data(b'')
+            del response.headers['Content-Encoding']
+    return response
+
+
+def init_app(app):
+    """Install response compression and fingerprinted static URLs."""
+    app.extensions['deploy_fingerprint'] = _deploy_fingerprint(app)
+    app.url_defaults(_fingerprint_static_urls)
+    app.after_request(_after_request)
@@ -0,0 +1,215 @@
+import csv
+import gzip
+import io
+import json
+import time
+from datetime import datetime, timezone
+import click
+from flask import current_app
+from app import analysis, gemini
+from app.db import get_db
+from app.moods import categorize_mood
+
+FORMATS = ('jsonl', 'csv')
+
+# Errors reported back to the user; the rest are only counted
+MAX_REPORTED_ERRORS = 10
+
+
+class ImportFailed(ValueError):
+    """Raised for a row, or a whole file, that cannot be imported."""
+
+
+def detect_format(filename):
+    """Guess the import format from a file name, or None."""
+    name = (filename or '').lower()
+    if name.endswith('.gz'):
+        name = name[:-3]
+    for fmt in FORMATS:
+        if name.endswith('.' + fmt):
+            return fmt
+    if name.endswith('.json') or name.endswith('.ndjson'):
+        return 'jsonl'
+    return None
+
+
+def parse_timestamp(value):
+    """Normalize an ISO 8601 timestamp to SQLite's UTC 'YYYY-MM-DD HH:MM:SS'.
+
+    Returns None when no timestamp was given, so the import time is used.
+    """
+    if value is None or value == '':
+        return None
+    try:
+        moment = datetime.fromisoformat(str(value).strip())
+    except ValueError:
+        raise ImportFailed(f'invalid timestamp {value!r}')
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _open_text(stream, compressed):
+    if compressed:
+        stream = gzip.GzipFile(fileobj=stream, mode='rb')
+    # utf-8-sig drops the byte order mark spreadsheet programs like to add
+    return io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+
+
+def _read_jsonl(text):
+    for line_no, line in enumerate(text, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            yield line_no, None
+            continue
+        yield line_no, record if isinstance(record, dict) else None
+
+
+def _read_csv(text):
+    reader = csv.DictReader(text)
+    for record in reader:
+        yield reader.line_num, record
+
+
+def _to_row(user_id, record):
+    if record is None:
+        raise ImportFailed('not a JSON object')
+
+    text = record.get('text')
+    if not isinstance(text, str) or not text.strip():
+        raise ImportFailed('missing text')
+
+    # Entries exported from Mindsight keep their analysis
+    mood = record.get('mood') or None
+    reflection = record.get('reflection') or None
+    if mood is None or reflection is None:
+        mood = reflection = None
+        status = 'pending'
+    elif gemini.is_fallback({'mood': mood, 'reflection': reflection}):
+        status = 'failed'
+    else:
+        # Model and prompt are unknown, so reanalyze leaves these alone
+        status = 'ok'
+
+    return (
+        user_id, text, mood, reflection,
+        categorize_mood(mood) if mood else None, status,
+        parse_timestamp(record.get('timestamp')),
+    )
+
+
+def _insert_chunk(db, rows, queued_at):
+    """Insert one chunk of entries and queue analysis for those without any."""
+    db.execute('BEGIN IMMEDIATE')
+    try:
+        # Holding the write lock, nobody else can take ids past this one
+        last_id = db.execute('SELECT COALESCE(MAX(id), 0) FROM entries').fetchone()[0]
+        db.executemany(
+            'INSERT INTO entries'
+            ' (user_id, text, mood, reflection, mood_category, analysis_status,'
+            ' timestamp)'
+            ' VALUES (?, ?, ?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))',
+            rows
+        )
+        # Imported jobs run after anything queued by the live app
+        db.execute(
+            'INSERT OR IGNORE INTO analysis_jobs (entry_id, run_after)'
+            ' SELECT id, ? FROM entries WHERE id > ? AND mood IS NULL',
+            (queued_at, last_id)
+        )
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+
+def import_entries(user_id, stream, fmt='jsonl', compressed=False, chunk_size=None):
+    """Stream JSONL or CSV entries from a binary file into a user's journal.
+
+    Rows are parsed one at a time and written with executemany() in
+    transactions of ``chunk_size`` rows. Original timestamps are kept, and
+    entries without a mood and reflection are queued for background
+    analysis. Rows that cannot be imported are skipped.
+
+    Returns a dict with the ``imported`` and ``skipped`` counts and the first
+    few ``errors`` as (line, message) pairs.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f'Unsupported import format: {fmt}')
+    if chunk_size is None:
+        chunk_size = current_app.config['IMPORT_CHUNK_SIZE']
+
+    db = get_db(user_id)
+    queued_at = time.time()
+    result = {'imported': 0, 'skipped': 0, 'errors': []}
+    text = _open_text(stream, compressed)
+    records = _read_jsonl(text) if fmt == 'jsonl' else _read_csv(text)
+
+    rows = []
+    try:
+        for line_no, record in records:
+            try:
+                rows.append(_to_row(user_id, record))
+            except ImportFailed as e:
+                result['skipped'] += 1
+                if len(result['errors']) < MAX_REPORTED_ERRORS:
+                    result['errors'].append((line_no, str(e)))
+                continue
+
+            if len(rows) >= chunk_size:
+                _insert_chunk(db, rows, queued_at)
+                result['imported'] += len(rows)
+                rows = []
+    except (UnicodeError, csv.Error, OSError, EOFError) as e:
+        # A corrupt file stops the import; chunks already written are kept
+        raise ImportFailed(f'could not read file: {e}')
+
+    if rows:
+        _insert_chunk(db, rows, queued_at)
+        result['imported'] += len(rows)
+
+    return result
+
+
+@click.command('import-entries')
+@click.argument('username')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(FORMATS),
+              help='File format; guessed from the file name by default.')
+def import_entries_command(username, path, fmt):
+    """Import journal entries from a JSONL or CSV file."""
+    user = get_db().execute(
+        'SELECT id FROM users WHERE username = ?', (username,)
+    ).fetchone()
+    if user is None:
+        raise click.ClickException(f'User {username} does not exist.')
+
+    fmt = fmt or detect_format(path)
+    if fmt is None:
+        raise click.ClickException('Cannot tell the file format, use --format.')
+
+    start = time.perf_counter()
+    with open(path, 'rb') as f:
+        try:
+            result = import_entries(
+                user['id'], f, fmt, compressed=path.lower().endswith('.gz')
+            )
+        except ImportFailed as e:
+            raise click.ClickException(str(e))
+    elapsed = time.perf_counter() - start
+
+    for line_no, message in result['errors']:
+        click.echo(f'Line {line_no}: {message}', err=True)
+    click.echo(
+        f"Imported {result['imported']} entries, skipped {result['skipped']}"
+        f' in {elapsed:.1f}s.'
+    )
+    analysis.notify()
+
+
+def init_app(app):
+    """Register import CLI commands with the Flask app."""
+    app.cli.add_command(import_entries_command)
@@ -0,0 +1,80 @@
+import click
+from app.db import get_db, get_shard, shards
+from app.moods import CATEGORIES, categorize_mood
+
+def _series(rows, key):
+    """Group (period, category, count) rows into one point per period."""
+    series = []
+    for row in rows:
+        if not series or series[-1][key] != row[key]:
+            series.append({key: row[key], 'counts': {}})
+        series[-1]['counts'][row['category']] = row['count']
+    return series
+
+def mood_insights(user_id, days=30, weeks=12):
+    """Mood frequency and trends for a user, read from the rollup tables.
+
+    Cost grows with the number of days and weeks asked for, not with the
+    number of entries.
+    """
+    db = get_db(user_id)
+    daily = db.execute(
+        'SELECT day, category, count FROM mood_daily'
+        " WHERE user_id = ? AND day > date('now', ?)"
+        ' ORDER BY day, category',
+        (user_id, f'-{days:d} days')
+    ).fetchall()
+    weekly = db.execute(
+        'SELECT week, category, count FROM mood_weekly'
+        " WHERE user_id = ? AND week >= date('now', 'weekday 0', ?)"
+        ' ORDER BY week, category',
+        (user_id, f'-{weeks * 7 - 1:d} days')
+    ).fetchall()
+
+    frequency = dict.fromkeys(CATEGORIES, 0)
+    for row in daily:
+        frequency[row['category']] = frequency.get(row['category'], 0) + row['count']
+
+    return {
+        'days': days,
+        'weeks': weeks,
+        'categories': list(CATEGORIES),
+        'frequency': frequency,
+        'daily': _series(daily, 'day'),
+        'weekly': _series(weekly, 'week'),
+    }
+
+def rebuild_insights():
+    """Recategorize every entry's mood and rebuild the rollups from scratch."""
+    for index in shards():
+        _rebuild(get_shard(index))
+
+def _rebuild(db):
+    db.create_function('categorize_mood', 1, categorize_mood, deterministic=True)
+    db.execute(
+        'UPDATE entries SET mood_category = categorize_mood(mood)'
+        ' WHERE mood_category IS NOT categorize_mood(mood)'
+    )
+    db.execute('DELETE FROM mood_daily')
+    db.execute('DELETE FROM mood_weekly')
+    db.execute(
+        'INSERT INTO mood_daily (user_id, day, category, count)'
+        ' SELECT user_id, date(timestamp), mood_category, COUNT(*) FROM entries'
+        ' WHERE mood_category IS NOT NULL GROUP BY 1, 2, 3'
+    )
+    db.execute(
+        'INSERT INTO mood_weekly (user_id, week, category, count)'
+        " SELECT user_id, date(timestamp, 'weekday 0', '-6 days'), mood_category, COUNT(*)"
+        ' FROM entries WHERE mood_category IS NOT NULL GROUP BY 1, 2, 3'
+    )
+    db.commit()
+
+@click.command('rebuild-insights')
+def rebuild_insights_command():
+    """Recategorize moods and rebuild the mood rollup tables."""
+    rebuild_insights()
+    click.echo('Rebuilt mood insights.')
+
+def init_app(app):
+    """Register insights CLI commands with the Flask app."""
+    app.cli.add_command(rebuild_insights_command)
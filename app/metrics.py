@@ -0,0 +1,351 @@
+import contextvars
+import hmac
+import threading
+import time
+from flask import (
+    Response, before_render_template, current_app, g, has_app_context,
+    request, template_rendered
+)
+from werkzeug.exceptions import abort
+from app import db
+
+# Latency buckets in seconds
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CALL_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0)
+
+# Timings of the request being handled, if metrics are enabled
+_current = contextvars.ContextVar('request_timings', default=None)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic counter with optional labels."""
+
+    type = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        return self._values.get(labels, 0)
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            yield f'{self.name}{_labels(self.labels, labels)} {_number(value)}'
+
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels."""
+
+    type = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=REQUEST_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                # Per-bucket counts, then sum and count
+                series = self._series[labels] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def count(self, *labels):
+        series = self._series.get(labels)
+        return series[-1] if series else 0
+
+    def samples(self):
+        with self._lock:
+            items = sorted((labels, list(series)) for labels, series in self._series.items())
+        for labels, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                le = _labels(self.labels, labels, f'le="{bound}"')
+                yield f'{self.name}_bucket{le} {cumulative}'
+            inf = _labels(self.labels, labels, 'le="+Inf"')
+            yield f'{self.name}_bucket{inf} {series[-1]}'
+            yield f'{self.name}_sum{_labels(self.labels, labels)} {_number(series[-2])}'
+            yield f'{self.name}_count{_labels(self.labels, labels)} {series[-1]}'
+
+
+class Gauge:
+    """Value read from ``fn`` at scrape time; ``fn`` returns {labels: value}."""
+
+    type = 'gauge'
+
+    def __init__(self, name, help, fn, labels=()):
+        self.name = name
+        self.help = help
+        self.fn = fn
+        self.labels = labels
+
+    def samples(self):
+        for labels, value in sorted(self.fn().items()):
+            yield f'{self.name}{_labels(self.labels, labels)} {_number(value)}'
+
+
+class CounterFunc(Gauge):
+    """Counter read from ``fn`` at scrape time, for totals kept elsewhere."""
+
+    type = 'counter'
+
+
+class RequestTimings:
+    """Where one request spent its time, for metrics and Server-Timing."""
+
+    __slots__ = ('start', 'db_count', 'db', 'llm_count', 'llm', 'hash',
+                 'render', 'render_start')
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.db_count = 0
+        self.db = 0.0
+        self.llm_count = 0
+        self.llm = 0.0
+        self.hash = 0.0
+        self.render = 0.0
+        self.render_start = None
+
+    def add_query(self, seconds):
+        self.db_count += 1
+        self.db += seconds
+
+
+class Metrics:
+    """Process-wide metrics for one app, rendered in Prometheus text format.
+
+    Values are per process; with several server processes each one is
+    scraped separately.
+    """
+
+    def __init__(self):
+        self.requests = Histogram(
+            'mindsight_http_request_duration_seconds',
+            'Time to produce a response, by endpoint.',
+            ('endpoint', 'method', 'status'),
+        )
+        self.db_queries = Counter(
+            'mindsight_db_queries_total',
+            'SQL statements executed while handling requests.', ('endpoint',),
+        )
+        self.db_seconds = Counter(
+            'mindsight_db_query_seconds_total',
+            'Time spent executing SQL statements while handling requests.',
+            ('endpoint',),
+        )
+        self.render_seconds = Counter(
+            'mindsight_template_render_seconds_total',
+            'Time spent rendering templates.', ('template',),
+        )
+        self.llm_calls = Histogram(
+            'mindsight_llm_call_duration_seconds',
+            'Gemini call latency, by outcome.', ('outcome',), CALL_BUCKETS,
+        )
+        self.password_hashes = Histogram(
+            'mindsight_password_hash_duration_seconds',
+            'Password hashing and verification latency.', (), CALL_BUCKETS,
+        )
+        self.collectors = [
+            self.requests, self.db_queries, self.db_seconds,
+            self.render_seconds, self.llm_calls, self.password_hashes,
+        ]
+
+    def register(self, collector):
+        self.collectors.append(collector)
+        return collector
+
+    def render(self):
+        lines = []
+        for collector in self.collectors:
+            lines.append(f'# HELP {collector.name} {collector.help}')
+            lines.append(f'# TYPE {collector.name} {collector.type}')
+            lines.extend(collector.samples())
+        return '\n'.join(lines) + '\n'
+
+
+def observe(kind, seconds, outcome='ok'):
+    """Record a Gemini call (``kind='llm'``) or password hash (``'hash'``).
+
+    Does nothing unless metrics are enabled for the current app.
+    """
+    timings = _current.get()
+    if timings is not None:
+        if kind == 'llm':
+            timings.llm_count += 1
+            timings.llm += seconds
+        else:
+            timings.hash += seconds
+
+    metrics = current_app.extensions.get('metrics') if has_app_context() else None
+    if metrics is not None:
+        if kind == 'llm':
+            metrics.llm_calls.observe(seconds, outcome)
+        else:
+            metrics.password_hashes.observe(seconds)
+
+
+def _start_timing():
+    timings = RequestTimings()
+    g._timing_tokens = (_current.set(timings), db.query_stats.set(timings))
+
+
+def _finish_timing(response):
+    timings = _current.get()
+    if timings is None:
+        return response
+
+    elapsed = time.perf_counter() - timings.start
+    endpoint = request.endpoint or 'none'
+    metrics = current_app.extensions['metrics']
+    metrics.requests.observe(elapsed, endpoint, request.method, str(response.status_code))
+    metrics.db_queries.inc(endpoint, amount=timings.db_count)
+    metrics.db_seconds.inc(endpoint, amount=timings.db)
+
+    if current_app.config['SERVER_TIMING']:
+        parts = [f'app;dur={elapsed * 1000:.1f}']
+        if timings.db_count:
+            parts.append(f'db;dur={timings.db * 1000:.1f};desc="{timings.db_count} queries"')
+        if timings.llm_count:
+            parts.append(f'llm;dur={timings.llm * 1000:.1f};desc="{timings.llm_count} calls"')
+        if timings.render:
+            parts.append(f'render;dur={timings.render * 1000:.1f}')
+        if timings.hash:
+            parts.append(f'hash;dur={timings.hash * 1000:.1f}')
+        response.headers['Server-Timing'] = ', '.join(parts)
+    return response
+
+
+def _stop_timing(exc=None):
+    tokens = g.pop('_timing_tokens', None)
+    if tokens is not None:
+        _current.reset(tokens[0])
+        db.query_stats.reset(tokens[1])
+
+
+def _template_started(sender, template, context, **extra):
+    timings = _current.get()
+    if timings is not None:
+        timings.render_start = time.perf_counter()
+
+
+def _template_finished(sender, template, context, **extra):
+    timings = _current.get()
+    if timings is not None and timings.render_start is not None:
+        seconds = time.perf_counter() - timings.render_start
+        timings.render += seconds
+        timings.render_start = None
+        sender.extensions['metrics'].render_seconds.inc(template.name, amount=seconds)
+
+
+def _app_gauges(app, metrics):
+    """Cache, Gemini guard and queue metrics read when /metrics is scraped."""
+
+    def cache_stats(name):
+        cache = app.extensions.get(name)
+        if cache is None:
+            return {}
+        return {(event,): value for event, value in cache.stats.items()}
+
+    def guard_state():
+        guard = app.extensions['gemini_guard']
+        return {
+            ('concurrency_limit',): guard.limiter.limit,
+            ('in_flight',): guard.limiter.in_flight,
+            ('circuit_open',): int(guard.breaker.state != 'closed'),
+        }
+
+    def queue_depth():
+        queued = running = 0
+        for index in db.shards():
+            row = db.get_shard(index).execute(
+                "SELECT COUNT(*), COUNT(*) FILTER (WHERE locked_at IS NOT NULL)"
+                ' FROM analysis_jobs'
+            ).fetchone()
+            queued += row[0] - row[1]
+            running += row[1]
+        return {('queued',): queued, ('running',): running}
+
+    metrics.register(CounterFunc(
+        'mindsight_analysis_cache_events_total', 'Analysis cache lookups and stores.',
+        lambda: cache_stats('analysis_cache'), ('event',),
+    ))
+    metrics.register(Gauge(
+        'mindsight_analysis_cache_hit_ratio', 'Share of analysis cache lookups that hit.',
+        lambda: {(): app.extensions['analysis_cache'].hit_rate},
+    ))
+    metrics.register(CounterFunc(
+        'mindsight_fragment_cache_events_total', 'Entry card cache lookups and stores.',
+        lambda: cache_stats('fragment_cache'), ('event',),
+    ))
+    metrics.register(Gauge(
+        'mindsight_gemini_guard', 'Gemini concurrency limit, calls in flight and circuit state.',
+        guard_state, ('value',),
+    ))
+    metrics.register(Gauge(
+        'mindsight_analysis_jobs', 'Analysis jobs waiting or being processed.',
+        queue_depth, ('state',),
+    ))
+
+
+def metrics_view():
+    """Prometheus text exposition of this process's metrics."""
+    token = current_app.config['METRICS_TOKEN']
+    if token:
+        given = request.headers.get('Authorization', '')
+        if not hmac.compare_digest(given.encode(), f'Bearer {token}'.encode()):
+            abort(401)
+    return Response(
+        current_app.extensions['metrics'].render(),
+        mimetype='text/plain; version=0.0.4',
+    )
+
+
+def init_app(app):
+    """Install request timing hooks and the /metrics endpoint when enabled."""
+    if not app.config['METRICS_ENABLED']:
+        return
+
+    metrics = Metrics()
+    _app_gauges(app, metrics)
+    app.extensions['metrics'] = metrics
+    app.before_request(_start_timing)
+    app.after_request(_finish_timing)
+    app.teardown_request(_stop_timing)
+    before_render_template.connect(_template_started, app)
+    template_rendered.connect(_template_finished, app)
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
@@ -0,0 +1,20 @@
+-- Background analysis queue, analysis cache and the entries list index
+CREATE TABLE IF NOT EXISTS analysis_jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    entry_id INTEGER UNIQUE NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    run_after REAL NOT NULL DEFAULT 0,
+    locked_at REAL,
+    last_error TEXT,
+    FOREIGN KEY (entry_id) REFERENCES entries (id)
+);
+
+CREATE TABLE IF NOT EXISTS analysis_cache (
+    key TEXT PRIMARY KEY,
+    mood TEXT NOT NULL,
+    reflection TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_analysis_cache_created ON analysis_cache (created_at);
+
+CREATE INDEX IF NOT EXISTS idx_entries_user_timestamp ON entries (user_id, timestamp DESC, id DESC);
@@ -0,0 +1,71 @@
+-- Normalized mood category on entries and per-user mood rollups.
+-- Run `flask rebuild-insights` afterwards to categorize existing entries.
+ALTER TABLE entries ADD COLUMN mood_category TEXT;
+
+CREATE TABLE IF NOT EXISTS mood_daily (
+    user_id INTEGER NOT NULL,
+    day TEXT NOT NULL,
+    category TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (user_id, day, category)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS mood_weekly (
+    user_id INTEGER NOT NULL,
+    week TEXT NOT NULL,
+    category TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (user_id, week, category)
+) WITHOUT ROWID;
+
+CREATE TRIGGER IF NOT EXISTS mood_rollup_insert AFTER INSERT ON entries
+WHEN new.mood_category IS NOT NULL BEGIN
+    INSERT INTO mood_daily (user_id, day, category, count)
+    VALUES (new.user_id, date(new.timestamp), new.mood_category, 1)
+    ON CONFLICT (user_id, day, category) DO UPDATE SET count = count + 1;
+    INSERT INTO mood_weekly (user_id, week, category, count)
+    VALUES (new.user_id, date(new.timestamp, 'weekday 0', '-6 days'), new.mood_category, 1)
+    ON CONFLICT (user_id, week, category) DO UPDATE SET count = count + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS mood_rollup_delete AFTER DELETE ON entries
+WHEN old.mood_category IS NOT NULL BEGIN
+    UPDATE mood_daily SET count = count - 1
+    WHERE user_id = old.user_id AND day = date(old.timestamp)
+    AND category = old.mood_category;
+    DELETE FROM mood_daily
+    WHERE user_id = old.user_id AND day = date(old.timestamp) AND count <= 0;
+    UPDATE mood_weekly SET count = count - 1
+    WHERE user_id = old.user_id AND week = date(old.timestamp, 'weekday 0', '-6 days')
+    AND category = old.mood_category;
+    DELETE FROM mood_weekly
+    WHERE user_id = old.user_id AND week = date(old.timestamp, 'weekday 0', '-6 days')
+    AND count <= 0;
+END;
+
+CREATE TRIGGER IF NOT EXISTS mood_rollup_update AFTER UPDATE OF mood_category, user_id, timestamp ON entries
+WHEN old.mood_category IS NOT new.mood_category
+    OR old.user_id IS NOT new.user_id
+    OR old.timestamp IS NOT new.timestamp BEGIN
+    UPDATE mood_daily SET count = count - 1
+    WHERE old.mood_category IS NOT NULL
+    AND user_id = old.user_id AND day = date(old.timestamp)
+    AND category = old.mood_category;
+    DELETE FROM mood_daily
+    WHERE user_id = old.user_id AND day = date(old.timestamp) AND count <= 0;
+    UPDATE mood_weekly SET count = count - 1
+    WHERE old.mood_category IS NOT NULL
+    AND user_id = old.user_id AND week = date(old.timestamp, 'weekday 0', '-6 days')
+    AND category = old.mood_category;
+    DELETE FROM mood_weekly
+    WHERE user_id = old.user_id AND week = date(old.timestamp, 'weekday 0', '-6 days')
+    AND count <= 0;
+    INSERT INTO mood_daily (user_id, day, category, count)
+    SELECT new.user_id, date(new.timestamp), new.mood_category, 1
+    WHERE new.mood_category IS NOT NULL
+    ON CONFLICT (user_id, day, category) DO UPDATE SET count = count + 1;
+    INSERT INTO mood_weekly (user_id, week, category, count)
+    SELECT new.user_id, date(new.timestamp, 'weekday 0', '-6 days'), new.mood_category, 1
+    WHERE new.mood_category IS NOT NULL
+    ON CONFLICT (user_id, week, category) DO UPDATE SET count = count + 1;
+END;
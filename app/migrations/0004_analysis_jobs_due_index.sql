@@ -0,0 +1,2 @@
+-- Claim analysis jobs in due order without sorting the whole queue
+CREATE INDEX IF NOT EXISTS idx_analysis_jobs_due ON analysis_jobs (run_after);
@@ -0,0 +1,28 @@
+-- Record how each entry was analyzed so failed or outdated analyses can be
+-- found and redone with `flask reanalyze`.
+ALTER TABLE entries ADD COLUMN analysis_status TEXT NOT NULL DEFAULT 'pending';
+ALTER TABLE entries ADD COLUMN analysis_model TEXT;
+ALTER TABLE entries ADD COLUMN analysis_prompt_version INTEGER;
+
+-- Existing analyses were made with the default model and the first prompt;
+-- fallback reflections mark the ones that failed
+UPDATE entries SET
+    analysis_status = CASE
+        WHEN reflection IN (
+            'Unable to generate reflection at this time.',
+            'Unable to generate reflection (API key missing)'
+        ) THEN 'failed'
+        ELSE 'ok'
+    END,
+    analysis_model = 'gemini-2.5-flash',
+    analysis_prompt_version = 1
+WHERE mood IS NOT NULL;
+
+CREATE INDEX IF NOT EXISTS idx_entries_needs_analysis ON entries (id)
+WHERE analysis_status IN ('failed', 'outdated');
+
+CREATE TABLE IF NOT EXISTS reanalyze_checkpoint (
+    target TEXT PRIMARY KEY,
+    last_id INTEGER NOT NULL,
+    updated_at REAL NOT NULL
+);
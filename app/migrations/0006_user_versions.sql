@@ -0,0 +1,24 @@
+-- Per-user change counter behind the ETags of entry pages. Triggers bump it
+-- on every write to a user's entries, whichever code path makes it.
+CREATE TABLE IF NOT EXISTS user_versions (
+    user_id INTEGER PRIMARY KEY,
+    version INTEGER NOT NULL
+);
+
+CREATE TRIGGER IF NOT EXISTS user_version_insert AFTER INSERT ON entries BEGIN
+    INSERT INTO user_versions (user_id, version) VALUES (new.user_id, 1)
+    ON CONFLICT (user_id) DO UPDATE SET version = version + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS user_version_delete AFTER DELETE ON entries BEGIN
+    INSERT INTO user_versions (user_id, version) VALUES (old.user_id, 1)
+    ON CONFLICT (user_id) DO UPDATE SET version = version + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS user_version_update AFTER UPDATE ON entries BEGIN
+    INSERT INTO user_versions (user_id, version) VALUES (new.user_id, 1)
+    ON CONFLICT (user_id) DO UPDATE SET version = version + 1;
+    INSERT INTO user_versions (user_id, version)
+    SELECT old.user_id, 1 WHERE old.user_id IS NOT new.user_id
+    ON CONFLICT (user_id) DO UPDATE SET version = version + 1;
+END;
@@ -0,0 +1,5 @@
+-- Which shard holds each user's entries when DATABASE_SHARDS is set
+CREATE TABLE IF NOT EXISTS user_shards (
+    user_id INTEGER PRIMARY KEY,
+    shard INTEGER NOT NULL
+);
@@ -0,0 +1,37 @@
+-- Entry text may be stored compressed (see app/codec.py); this view and
+-- the codec_decode() SQL function every connection registers read it back
+CREATE VIEW IF NOT EXISTS entry_texts AS
+SELECT id, codec_decode(text) AS text FROM entries;
+
+-- Preset dictionaries compressed values refer to by id
+CREATE TABLE IF NOT EXISTS codec_dictionaries (
+    id BLOB PRIMARY KEY,
+    data BLOB NOT NULL,
+    created_at REAL NOT NULL
+);
+
+-- Search reads entry text through the view, so it sees it decompressed
+DROP TRIGGER IF EXISTS entries_fts_insert;
+DROP TRIGGER IF EXISTS entries_fts_delete;
+DROP TRIGGER IF EXISTS entries_fts_update;
+DROP TABLE IF EXISTS entries_fts;
+
+CREATE VIRTUAL TABLE entries_fts USING fts5(
+    text, content='entry_texts', content_rowid='id', tokenize='porter unicode61'
+);
+CREATE TRIGGER entries_fts_insert AFTER INSERT ON entries BEGIN
+    INSERT INTO entries_fts (rowid, text) VALUES (new.id, codec_decode(new.text));
+END;
+CREATE TRIGGER entries_fts_delete AFTER DELETE ON entries BEGIN
+    INSERT INTO entries_fts (entries_fts, rowid, text)
+    VALUES ('delete', old.id, codec_decode(old.text));
+END;
+-- Compressing text leaves what is indexed as it is
+CREATE TRIGGER entries_fts_update AFTER UPDATE OF text ON entries
+WHEN codec_decode(old.text) IS NOT codec_decode(new.text) BEGIN
+    INSERT INTO entries_fts (entries_fts, rowid, text)
+    VALUES ('delete', old.id, codec_decode(old.text));
+    INSERT INTO entries_fts (rowid, text) VALUES (new.id, codec_decode(new.text));
+END;
+
+INSERT INTO entries_fts (entries_fts) VALUES ('rebuild');
@@ -0,0 +1,5 @@
+-- How long each user's entries are kept; see `flask apply-retention`
+CREATE TABLE IF NOT EXISTS retention_rules (
+    user_id INTEGER PRIMARY KEY,
+    keep_days INTEGER NOT NULL CHECK (keep_days > 0)
+);
@@ -0,0 +1,7 @@
+-- Change counter per entry, behind the rendered entry card cache
+ALTER TABLE entries ADD COLUMN revision INTEGER NOT NULL DEFAULT 0;
+
+CREATE TRIGGER IF NOT EXISTS entry_revision_update
+AFTER UPDATE OF text, mood, reflection, analysis_status ON entries BEGIN
+    UPDATE entries SET revision = revision + 1 WHERE id = new.id;
+END;
@@ -0,0 +1,23 @@
+-- The search triggers no longer call codec_decode(), so tools that open
+-- the file without the app (the sqlite3 shell, backup scripts) can still
+-- insert and delete entries. They index plain text only; the app indexes
+-- and unindexes compressed rows itself (see app/search.py).
+DROP TRIGGER IF EXISTS entries_fts_insert;
+DROP TRIGGER IF EXISTS entries_fts_delete;
+DROP TRIGGER IF EXISTS entries_fts_update;
+
+CREATE TRIGGER entries_fts_insert AFTER INSERT ON entries
+WHEN typeof(new.text) = 'text' BEGIN
+    INSERT INTO entries_fts (rowid, text) VALUES (new.id, new.text);
+END;
+CREATE TRIGGER entries_fts_delete AFTER DELETE ON entries
+WHEN typeof(old.text) = 'text' BEGIN
+    INSERT INTO entries_fts (entries_fts, rowid, text) VALUES ('delete', old.id, old.text);
+END;
+-- Compressing or uncompressing text leaves what is indexed as it is
+CREATE TRIGGER entries_fts_update AFTER UPDATE OF text ON entries
+WHEN typeof(old.text) = 'text' AND typeof(new.text) = 'text'
+AND old.text IS NOT new.text BEGIN
+    INSERT INTO entries_fts (entries_fts, rowid, text) VALUES ('delete', old.id, old.text);
+    INSERT INTO entries_fts (rowid, text) VALUES (new.id, new.text);
+END;
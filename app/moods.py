@@ -0,0 +1,99 @@
+import functools
+import re
+
+# Canonical mood categories. Gemini describes moods freely ("stressed but
+# hopeful"), so each category lists word stems that map onto it.
+MOOD_CATEGORIES = {
+    'joyful': (
+        'happ', 'joy', 'excit', 'elat', 'cheer', 'delight', 'glad', 'thrill',
+        'enthusias', 'proud', 'ecstatic', 'playful', 'energ', 'amazing',
+    ),
+    'calm': (
+        'calm', 'peace', 'relax', 'content', 'seren', 'grate', 'thank',
+        'hope', 'optimis', 'satisf', 'reflect', 'accept', 'relie', 'balanc',
+    ),
+    'sad': (
+        'sad', 'down', 'lonel', 'depress', 'unhapp', 'grie', 'melanchol',
+        'disappoint', 'hurt', 'heartbr', 'blue', 'hopeless', 'empty', 'cry',
+    ),
+    'anxious': (
+        'anxi', 'stress', 'worr', 'nervous', 'overwhelm', 'tense', 'afraid',
+        'scare', 'fear', 'uneas', 'pressur', 'panic', 'restless', 'uncertain',
+    ),
+    'angry': (
+        'angr', 'frustrat', 'annoy', 'irritat', 'mad', 'resent', 'furious',
+        'rage', 'bitter', 'upset',
+    ),
+    'tired': (
+        'tired', 'exhaust', 'drain', 'fatigu', 'sleep', 'burn', 'weary',
+        'letharg', 'worn',
+    ),
+}
+
+NEUTRAL = 'neutral'
+
+CATEGORIES = tuple(MOOD_CATEGORIES) + (NEUTRAL,)
+
+# Words that flip or dilute what follows, e.g. "not happy"
+_NEGATIONS = {'not', 'no', 'never', 'hardly', 'barely'}
+
+# Everyday words that merely start like a mood stem ('made', 'happened')
+_NOT_MOODS = {
+    'made', 'happen', 'happens', 'happened', 'happening', 'download',
+    'downloaded', 'downstairs', 'downtown',
+}
+
+# (stem, category) pairs, longest stem first so 'hopeless' beats 'hope'
+_STEMS = sorted(
+    ((stem, category) for category, stems in MOOD_CATEGORIES.items() for stem in stems),
+    key=lambda item: -len(item[0])
+)
+
+@functools.lru_cache(maxsize=4096)
+def _category_of(word):
+    if word in _NOT_MOODS:
+        return None
+    for stem, category in _STEMS:
+        if word.startswith(stem):
+            return category
+    return None
+
+def categorize_mood(mood):
+    """Map a free-text mood onto one of ``CATEGORIES``.
+
+    The first recognised word wins, since Gemini leads with the dominant
+    feeling. Returns None for a missing mood and 'neutral' when nothing is
+    recognised.
+    """
+    if mood is None:
+        return None
+
+    negated = False
+    for word in re.findall(r'[a-z]+', mood.lower()):
+        if word in _NEGATIONS:
+            negated = True
+            continue
+        category = _category_of(word)
+        if category is not None and not negated:
+            return category
+        negated = False
+
+    return NEUTRAL
+
+def mood_counts(text):
+    """Count the mood words in free text, by category.
+
+    Negated words ("not happy") are skipped. Returns a dict of
+    category -> count, in order of first appearance.
+    """
+    counts = {}
+    negated = False
+    for word in re.findall(r'[a-z]+', text.lower()):
+        if word in _NEGATIONS:
+            negated = True
+            continue
+        category = _category_of(word)
+        if category is not None and not negated:
+            counts[category] = counts.get(category, 0) + 1
+        negated = False
+    return counts
@@ -0,0 +1,150 @@
+import atexit
+import multiprocessing
+import os
+import threading
+import time
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+from werkzeug.security import check_password_hash, generate_password_hash
+from app import metrics
+
+
+class HashingBusy(Exception):
+    """Raised when the hashing queue is full and the request should back off."""
+
+
+class PasswordHasher:
+    """Runs password hashing in a bounded pool of worker processes.
+
+    Hashing is deliberately slow, so it is kept off the request threads. At
+    most ``queue_depth`` hashes may be queued or running; callers beyond that
+    get ``HashingBusy`` straight away instead of piling up. With
+    ``workers=0`` hashing runs inline, which is handy for tests.
+    """
+
+    def __init__(self, method, salt_length=16, workers=2, queue_depth=8,
+                 queue_timeout=0.5):
+        self.method = method
+        self.salt_length = salt_length
+        self.workers = workers
+        self.queue_timeout = queue_timeout
+        self._slots = threading.BoundedSemaphore(queue_depth)
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+        self._prefix = None
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                # Processes are spawned rather than forked so the pool never
+                # inherits the web server's threads or open connections
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                )
+                self._pid = os.getpid()
+            return self._executor
+
+    def _run(self, fn, *args):
+        start = time.perf_counter()
+        try:
+            if self.workers <= 0:
+                return fn(*args)
+
+            if not self._slots.acquire(timeout=self.queue_timeout):
+                raise HashingBusy()
+            try:
+                return self._get_executor().submit(fn, *args).result()
+            finally:
+                self._slots.release()
+        finally:
+            metrics.observe('hash', time.perf_counter() - start)
+
+    def hash(self, password):
+        """Hash a password with the configured method."""
+        return self._run(
+            generate_password_hash, password, self.method, self.salt_length
+        )
+
+    def verify(self, pwhash, password):
+        """Check a password against a stored hash."""
+        return self._run(check_password_hash, pwhash, password)
+
+    def needs_rehash(self, pwhash):
+        """True if ``pwhash`` was made with different parameters than configured."""
+        if self._prefix is None:
+            # Let werkzeug fill in defaults, e.g. 'scrypt' -> 'scrypt:32768:8:1'
+            self._prefix = self.hash('').split('$', 1)[0]
+        return pwhash.split('$', 1)[0] != self._prefix
+
+    def shutdown(self):
+        """Stop the worker processes owned by this process."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+            owned = self._pid == os.getpid()
+        if executor is not None and owned:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+class RateLimiter:
+    """Fixed-window attempt counter per key (client IP, username, ...).
+
+    Counting is a dict lookup, so floods are turned away before any hashing
+    happens. Limits are per process.
+    """
+
+    def __init__(self, limit, window):
+        self.limit = limit
+        self.window = window
+        self._counts = {}
+        self._lock = threading.Lock()
+        self._window_start = time.monotonic()
+
+    def hit(self, *keys):
+        """Record an attempt for each key; False if any key is over its limit."""
+        if self.limit <= 0:
+            return True
+
+        now = time.monotonic()
+        with self._lock:
+            if now - self._window_start >= self.window:
+                self._counts.clear()
+                self._window_start = now
+
+            allowed = True
+            for key in keys:
+                count = self._counts.get(key, 0) + 1
+                self._counts[key] = count
+                if count > self.limit:
+                    allowed = False
+            return allowed
+
+
+# Hashers of the apps in this process, stopped at exit. Held weakly so a
+# discarded app's hasher, and its worker processes, can go away with it.
+_hashers = weakref.WeakSet()
+
+
+def _shutdown_hashers():
+    for hasher in list(_hashers):
+        hasher.shutdown()
+
+
+atexit.register(_shutdown_hashers)
+
+
+def init_app(app):
+    """Attach the password hasher and login rate limiter to the Flask app."""
+    hasher = PasswordHasher(
+        method=app.config['PASSWORD_HASH_METHOD'],
+        salt_length=app.config['PASSWORD_SALT_LENGTH'],
+        workers=app.config['PASSWORD_HASH_WORKERS'],
+        queue_depth=app.config['PASSWORD_HASH_QUEUE_DEPTH'],
+        queue_timeout=app.config['PASSWORD_HASH_QUEUE_TIMEOUT'],
+    )
+    app.extensions['password_hasher'] = hasher
+    app.extensions['login_rate_limiter'] = RateLimiter(
+        app.config['LOGIN_RATE_LIMIT'], app.config['LOGIN_RATE_WINDOW']
+    )
+    _hashers.add(hasher)
@@ -0,0 +1,202 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+import click
+from flask import current_app
+from app import analysis, analyzers, gemini
+from app.db import get_shard, shards
+from app.resilience import Throttle
+
+
+def _backends_condition(sources):
+    # SQL matching analyses of the backends behind sources
+    backends = {analyzers.backend_of(model) for model, _ in sources}
+    lexicon = analyzers.backend_of(analyzers.LEXICON_MODEL)
+    if backends == {lexicon}:
+        return 'analysis_model = ?', [analyzers.LEXICON_MODEL]
+    if lexicon not in backends:
+        return 'analysis_model != ?', [analyzers.LEXICON_MODEL]
+    return 'analysis_model IS NOT NULL', []
+
+
+def mark_outdated(db, sources, other_backends=False):
+    """Flag analyses not made by one of ``sources``. The caller commits.
+
+    ``sources`` lists the (model, version) pairs the analyzer produces now;
+    an analysis from another model or an older version is outdated. Those
+    made by a backend the analyzer does not use, such as Gemini ones while
+    running the lexicon, are spared unless ``other_backends`` is set.
+    Entries whose model or prompt is unknown (imported ones) are left alone.
+    Returns the number of entries flagged.
+    """
+    current = ' OR '.join(
+        ['(analysis_model = ? AND analysis_prompt_version >= ?)'] * len(sources)
+    )
+    params = [value for source in sources for value in source]
+    condition = f'NOT ({current})'
+    if not other_backends:
+        backends, backend_params = _backends_condition(sources)
+        condition = f'{backends} AND {condition}'
+        params = backend_params + params
+    return db.execute(
+        "UPDATE entries SET analysis_status = 'outdated'"
+        f" WHERE analysis_status = 'ok' AND {condition}",
+        params
+    ).rowcount
+
+
+def count_remaining(db, after_id=0):
+    """Number of failed or outdated analyses with an id above ``after_id``."""
+    return db.execute(
+        'SELECT COUNT(*) FROM entries'
+        " WHERE analysis_status IN ('failed', 'outdated') AND id > ?",
+        (after_id,)
+    ).fetchone()[0]
+
+
+def _next_chunk(db, after_id, size):
+    # Served by the partial idx_entries_needs_analysis index
+    return db.execute(
+        'SELECT id, codec_decode(text) AS text FROM entries'
+        " WHERE analysis_status IN ('failed', 'outdated') AND id > ?"
+        ' ORDER BY id LIMIT ?',
+        (after_id, size)
+    ).fetchall()
+
+
+def _load_checkpoint(db, target):
+    row = db.execute(
+        'SELECT last_id FROM reanalyze_checkpoint WHERE target = ?', (target,)
+    ).fetchone()
+    return row['last_id'] if row is not None else 0
+
+
+def _save_checkpoint(db, target, last_id):
+    db.execute(
+        'INSERT OR REPLACE INTO reanalyze_checkpoint (target, last_id, updated_at)'
+        ' VALUES (?, ?, ?)',
+        (target, last_id, time.time())
+    )
+
+
+def _reanalyze_batch(app, index, rows, throttle):
+    """Analyze one batch of shard ``index`` in its own app context.
+
+    Returns (redone, failed).
+    """
+    throttle.wait()
+    with app.app_context():
+        results = analysis.analyze_texts([row['text'] for row in rows])
+        db = get_shard(index)
+        redone = 0
+        for row, (result, source) in zip(rows, results):
+            # A failed retry keeps whatever the entry had before
+            if not gemini.is_fallback(result):
+                analysis.store_analysis(db, row['id'], result, source)
+                redone += 1
+        db.commit()
+    return redone, len(rows) - redone
+
+
+def reanalyze(concurrency=2, rate=1.0, limit=None, restart=False,
+              replace_other_backends=False):
+    """Redo failed and outdated analyses, resuming from the last checkpoint.
+
+    Entries are read in id order through the partial index, split into
+    Gemini batches and analyzed by ``concurrency`` threads, with at most
+    ``rate`` batch requests started per second. Progress is checkpointed
+    after every chunk, so an interrupted run carries on where it stopped.
+    Analyses from backends the analyzer does not use are only redone with
+    ``replace_other_backends``; see ``mark_outdated``.
+
+    Returns a dict with ``marked``, ``redone``, ``failed`` and ``finished``.
+    With ``DATABASE_SHARDS`` set the shards are done one after another, each
+    with its own checkpoint.
+    """
+    app = current_app._get_current_object()
+    analyzer = analyzers.current_analyzer()
+    sources = analyzer.sources()
+    target = ' '.join(f'{model}:{version}' for model, version in sources)
+    batch_size = app.config['GEMINI_BATCH_SIZE']
+    throttle = Throttle(rate)
+    result = {'marked': 0, 'redone': 0, 'failed': 0, 'finished': False}
+
+    for index in shards():
+        db = get_shard(index)
+        result['marked'] += mark_outdated(db, sources, replace_other_backends)
+        # Checkpoints for another model or prompt no longer apply
+        db.execute('DELETE FROM reanalyze_checkpoint WHERE target != ?', (target,))
+        if restart:
+            db.execute('DELETE FROM reanalyze_checkpoint')
+        db.commit()
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for index in shards():
+            db = get_shard(index)
+            last_id = _load_checkpoint(db, target)
+            while True:
+                done = result['redone'] + result['failed']
+                if limit is not None and done >= limit:
+                    return result
+                if analyzer.unavailable_until() is not None:
+                    return result
+
+                size = batch_size * concurrency
+                if limit is not None:
+                    size = min(size, limit - done)
+                rows = _next_chunk(db, last_id, size)
+                if not rows:
+                    db.execute('DELETE FROM reanalyze_checkpoint WHERE target = ?', (target,))
+                    db.commit()
+                    break
+
+                batches = [rows[i:i + batch_size] for i in range(0, len(rows), batch_size)]
+                for redone, failed in pool.map(
+                    lambda batch: _reanalyze_batch(app, index, batch, throttle), batches
+                ):
+                    result['redone'] += redone
+                    result['failed'] += failed
+
+                last_id = rows[-1]['id']
+                _save_checkpoint(db, target, last_id)
+                db.commit()
+
+    result['finished'] = True
+    return result
+
+
+@click.command('reanalyze')
+@click.option('--concurrency', default=2, show_default=True,
+              help='Gemini requests in flight at once.')
+@click.option('--rate', type=float, default=1.0, show_default=True,
+              help='Most Gemini batch requests started per second (0 for no limit).')
+@click.option('--limit', type=int, help='Stop after this many entries.')
+@click.option('--restart', is_flag=True, help='Ignore the saved checkpoint.')
+@click.option('--replace-other-backends', is_flag=True,
+              help='Also redo analyses made by backends ANALYZER does not use.')
+@click.option('--dry-run', is_flag=True, help='Only count what would be redone.')
+def reanalyze_command(concurrency, rate, limit, restart, replace_other_backends, dry_run):
+    """Redo failed analyses and ones made with an older model or prompt."""
+    if dry_run:
+        marked = remaining = 0
+        for index in shards():
+            db = get_shard(index)
+            marked += mark_outdated(
+                db, analyzers.current_analyzer().sources(), replace_other_backends
+            )
+            remaining += count_remaining(db)
+            db.rollback()
+        click.echo(f'{remaining} entries to reanalyze ({marked} outdated).')
+        return
+
+    result = reanalyze(concurrency, rate, limit, restart, replace_other_backends)
+    click.echo(
+        f"Reanalyzed {result['redone']} entries, {result['failed']} still failing"
+        f" ({result['marked']} newly outdated)."
+    )
+    if not result['finished']:
+        click.echo('Stopped early; run again to continue from the checkpoint.')
+
+
+def init_app(app):
+    """Register the reanalyze command with the Flask app."""
+    app.cli.add_command(reanalyze_command)
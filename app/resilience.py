@@ -0,0 +1,295 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+
+
+class Unavailable(Exception):
+    """The call was not made, or was given up on, to protect the service."""
+
+
+class CircuitOpen(Unavailable):
+    """Recent calls kept failing, so this one was refused straight away."""
+
+
+class Overloaded(Unavailable):
+    """No concurrency slot freed up before the deadline."""
+
+
+class DeadlineExceeded(Unavailable):
+    """The call did not finish before its deadline."""
+
+
+class CircuitBreaker:
+    """Refuses calls for ``cooldown`` seconds after ``threshold`` failures in a row.
+
+    Once the cooldown is over a single probe call is let through: success
+    closes the circuit again, failure opens it for another cooldown.
+    """
+
+    def __init__(self, threshold=5, cooldown=30.0):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self._opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return 'closed'
+            if self._probing or time.monotonic() - self._opened_at >= self.cooldown:
+                return 'half-open'
+            return 'open'
+
+    def retry_at(self):
+        """Wall-clock time after which a call may be attempted again."""
+        with self._lock:
+            if self._opened_at is None:
+                return time.time()
+            return time.time() + max(
+                0.0, self._opened_at + self.cooldown - time.monotonic()
+            )
+
+    def allow(self):
+        """True if a call may go ahead now. The caller must report its outcome."""
+        if self.threshold <= 0:
+            return True
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._probing or time.monotonic() - self._opened_at < self.cooldown:
+                return False
+            self._probing = True
+            return True
+
+    def cancel(self):
+        """Report a call that ended with no outcome, freeing its probe slot."""
+        with self._lock:
+            self._probing = False
+
+    def success(self):
+        with self._lock:
+            self.failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._probing or (
+                self.threshold > 0 and self.failures >= self.threshold
+            ):
+                self._opened_at = time.monotonic()
+            self._probing = False
+
+
+class AdaptiveLimiter:
+    """Caps concurrent calls, adapting the cap to observed latency (AIMD).
+
+    Every call that finishes within ``latency_target`` seconds raises the
+    limit by about one per round of calls; a slow or failed call halves it.
+    The limit stays between ``min_limit`` and ``max_limit``.
+    """
+
+    def __init__(self, min_limit=1, max_limit=8, latency_target=8.0):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_target = latency_target
+        self.limit = float(max_limit)
+        self.in_flight = 0
+        self.latency = None
+        self._cond = threading.Condition()
+
+    def acquire(self, timeout=None):
+        """Take a slot, waiting up to ``timeout`` seconds. False if none freed up."""
+        with self._cond:
+            if not self._cond.wait_for(
+                lambda: self.in_flight < int(self.limit), timeout
+            ):
+                return False
+            self.in_flight += 1
+            return True
+
+    def cancel(self):
+        """Give back a slot that was never used."""
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+    def release(self, latency, ok=True):
+        """Give a slot back and adjust the limit from the call's outcome."""
+        with self._cond:
+            self.in_flight -= 1
+            # Smoothed latency, for monitoring
+            self.latency = latency if self.latency is None else (
+                0.8 * self.latency + 0.2 * latency
+            )
+            if ok and latency <= self.latency_target:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            else:
+                self.limit = max(self.min_limit, self.limit / 2)
+            self._cond.notify_all()
+
+
+class Throttle:
+    """Spaces calls out to at most ``rate`` per second, across threads."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        """Block until the caller's turn comes up."""
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(self._next, now)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class CallGuard:
+    """Runs outbound calls with a deadline, a circuit breaker and a concurrency cap.
+
+    Calls run on a small thread pool so the caller can give up at the
+    deadline. A call that overruns keeps its concurrency slot until it
+    really returns, so a slow service sees less traffic rather than more.
+    """
+
+    def __init__(self, timeout=20.0, breaker=None, limiter=None):
+        self.timeout = timeout
+        self.breaker = breaker or CircuitBreaker()
+        self.limiter = limiter or AdaptiveLimiter()
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                # Threads do not survive a fork, so each process gets its own
+                # pool, and calls the parent had in flight never finish here
+                if self._executor is not None:
+                    self.limiter.in_flight = 0
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.limiter.max_limit,
+                    thread_name_prefix='call-guard',
+                )
+                self._pid = os.getpid()
+            return self._executor
+
+    def _admit(self, timeout):
+        # Fail fast while open rather than queueing for a slot first
+        if self.breaker.state == 'open':
+            raise CircuitOpen('circuit open after repeated failures')
+        if not self.limiter.acquire(timeout):
+            raise Overloaded('no concurrency slot before the deadline')
+        if not self.breaker.allow():
+            self.limiter.cancel()
+            raise CircuitOpen('circuit open after repeated failures')
+
+    def call(self, fn, *args, timeout=None):
+        """Call ``fn(*args)`` and return its result.
+
+        Raises an ``Unavailable`` subclass when the call is refused or runs
+        past its deadline; exceptions from ``fn`` itself are re-raised.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        executor = self._get_executor()
+        self._admit(timeout)
+
+        started = time.monotonic()
+
+        def finished(future):
+            ok = not future.cancelled() and future.exception() is None
+            self.limiter.release(time.monotonic() - started, ok)
+
+        future = executor.submit(fn, *args)
+        future.add_done_callback(finished)
+        try:
+            result = future.result(max(0.0, deadline - time.monotonic()))
+        except FutureTimeout:
+            self.breaker.failure()
+            raise DeadlineExceeded(f'no response within {timeout:g}s')
+        except Exception:
+            self.breaker.failure()
+            raise
+
+        self.breaker.success()
+        return result
+
+    def stream(self, fn, *args, timeout=None):
+        """Iterate over the iterable returned by ``fn(*args)``, under the guard.
+
+        ``timeout`` bounds the whole stream, not each item. Raises like
+        ``call``. A consumer that stops early gives its slot back without
+        counting for or against the service.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        executor = self._get_executor()
+        self._admit(timeout)
+
+        started = time.monotonic()
+        done = object()
+        future = None
+        ok = False
+        failed = False
+        closed = False
+
+        def wait(future):
+            try:
+                return future.result(max(0.0, deadline - time.monotonic()))
+            except FutureTimeout:
+                raise DeadlineExceeded(f'no complete response within {timeout:g}s')
+
+        try:
+            future = executor.submit(lambda: iter(fn(*args)))
+            iterator = wait(future)
+            while True:
+                future = executor.submit(next, iterator, done)
+                item = wait(future)
+                if item is done:
+                    break
+                yield item
+            ok = True
+        except GeneratorExit:
+            closed = True
+            raise
+        except Exception:
+            failed = True
+            raise
+        finally:
+            if failed:
+                self.breaker.failure()
+            elif ok:
+                self.breaker.success()
+            else:
+                self.breaker.cancel()
+
+            def finished(future=None):
+                self.limiter.release(time.monotonic() - started, ok)
+
+            # As with call, an overrunning step keeps the slot until it returns
+            if closed:
+                self.limiter.cancel()
+            elif future is not None and not future.done():
+                future.add_done_callback(finished)
+            else:
+                finished()
+
+    def shutdown(self):
+        """Stop the pool threads owned by this process without waiting."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+            owned = self._pid == os.getpid()
+        if executor is not None and owned:
+            executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,217 @@
+import time
+import click
+from flask import current_app
+from app import fragments, search
+from app.db import get_db, get_shard, shards
+
+# PRAGMA auto_vacuum values
+INCREMENTAL = 2
+
+
+def _range_query(user_id, start, end):
+    # Ids of a user's entries written in [start, end), oldest first
+    query = 'SELECT id FROM entries WHERE user_id = ?'
+    params = [user_id]
+    if start is not None:
+        query += ' AND timestamp >= ?'
+        params.append(start)
+    if end is not None:
+        query += ' AND timestamp < ?'
+        params.append(end)
+    return query + ' ORDER BY timestamp, id LIMIT ?', params
+
+
+def _id_chunks(db, user_id, ids, start, end, chunk_size, limit):
+    # Ids of the entries to delete, chunk_size at a time, at most limit in all
+    if ids is not None:
+        ids = sorted(set(ids))[:limit]
+        for i in range(0, len(ids), chunk_size):
+            yield ids[i:i + chunk_size]
+        return
+
+    query, params = _range_query(user_id, start, end)
+    left = limit
+    while left is None or left > 0:
+        size = chunk_size if left is None else min(chunk_size, left)
+        rows = db.execute(query, params + [size]).fetchall()
+        if not rows:
+            return
+        if left is not None:
+            left -= len(rows)
+        yield [row['id'] for row in rows]
+
+
+def delete_entries(db, user_id, ids=None, start=None, end=None,
+                   chunk_size=500, pause=0.0, limit=None):
+    """Delete a user's entries with the given ids, or written in [start, end).
+
+    ``start`` and ``end`` are timestamps as stored, either may be None for
+    an open range. Entries go ``chunk_size`` at a time together with their
+    queued analyses, each chunk its own transaction with a ``pause`` before
+    the next, so other requests get the write lock in between. No more than
+    ``limit`` entries are deleted, oldest first. Ids of other users'
+    entries are ignored. Returns the number of entries deleted.
+    """
+    deleted = 0
+    chunks = _id_chunks(db, user_id, ids, start, end, chunk_size, limit)
+    for n, chunk in enumerate(chunks):
+        if n and pause:
+            time.sleep(pause)
+        marks = ', '.join('?' * len(chunk))
+        # +user_id keeps SQLite on rowid lookups; through the user_id index
+        # every chunk would scan the user's whole journal
+        db.execute(
+            f'DELETE FROM analysis_jobs WHERE entry_id IN'
+            f' (SELECT id FROM entries WHERE +user_id = ? AND id IN ({marks}))',
+            [user_id] + chunk
+        )
+        search.unindex_compressed(db, user_id, chunk)
+        cursor = db.execute(
+            f'DELETE FROM entries WHERE +user_id = ? AND id IN ({marks})',
+            [user_id] + chunk
+        )
+        db.commit()
+        fragments.discard(user_id, chunk)
+        deleted += cursor.rowcount
+    return deleted
+
+
+def has_entries(db, user_id, start=None, end=None):
+    """Whether a user has any entries written in [start, end)."""
+    query, params = _range_query(user_id, start, end)
+    return db.execute(query, params + [1]).fetchone() is not None
+
+
+def vacuum(db, step_pages, max_pages=None, pause=0.0):
+    """Return free pages to the file system, ``step_pages`` at a time.
+
+    Each step is a short write transaction of its own, followed by a
+    ``pause``. Stops when no free pages are left or ``max_pages`` were
+    freed. Does nothing unless the file uses ``auto_vacuum = INCREMENTAL``.
+    Returns the number of pages freed.
+    """
+    if db.execute('PRAGMA auto_vacuum').fetchone()[0] != INCREMENTAL:
+        return 0
+
+    freed = 0
+    free = db.execute('PRAGMA freelist_count').fetchone()[0]
+    while free and (max_pages is None or freed < max_pages):
+        step = step_pages if max_pages is None else min(step_pages, max_pages - freed)
+        # Run to completion: execute() would only free the first page
+        db.executescript(f'PRAGMA incremental_vacuum({int(step):d})')
+        left = db.execute('PRAGMA freelist_count').fetchone()[0]
+        if left >= free:
+            break
+        freed += free - left
+        free = left
+        if free and pause:
+            time.sleep(pause)
+    return freed
+
+
+def vacuum_step(db):
+    """One bounded incremental vacuum step, cheap enough to run in a request."""
+    config = current_app.config
+    return vacuum(db, config['VACUUM_STEP_PAGES'], max_pages=config['VACUUM_STEP_PAGES'])
+
+
+def set_rule(user_id, keep_days):
+    """Keep a user's entries for ``keep_days`` days, or forever for None."""
+    db = get_db()
+    if keep_days is None:
+        db.execute('DELETE FROM retention_rules WHERE user_id = ?', (user_id,))
+    else:
+        db.execute(
+            'INSERT INTO retention_rules (user_id, keep_days) VALUES (?, ?)'
+            ' ON CONFLICT (user_id) DO UPDATE SET keep_days = excluded.keep_days',
+            (user_id, keep_days)
+        )
+    db.commit()
+
+
+def get_rule(user_id):
+    """Days a user's entries are kept, or None if they are kept forever."""
+    row = get_db().execute(
+        'SELECT keep_days FROM retention_rules WHERE user_id = ?', (user_id,)
+    ).fetchone()
+    return row['keep_days'] if row is not None else None
+
+
+def apply_retention():
+    """Delete entries older than their owner's retention rule.
+
+    Returns {user_id: entries deleted} for users who had any.
+    """
+    config = current_app.config
+    rules = get_db().execute(
+        'SELECT user_id, keep_days FROM retention_rules ORDER BY user_id'
+    ).fetchall()
+
+    results = {}
+    for rule in rules:
+        db = get_db(rule['user_id'])
+        cutoff = db.execute(
+            "SELECT datetime('now', ?)", (f"-{rule['keep_days']:d} days",)
+        ).fetchone()[0]
+        deleted = delete_entries(
+            db, rule['user_id'], end=cutoff,
+            chunk_size=config['DELETE_CHUNK_SIZE'], pause=config['DELETE_CHUNK_PAUSE'],
+        )
+        if deleted:
+            results[rule['user_id']] = deleted
+    return results
+
+
+def _database_indexes():
+    # The main database and every shard; just [None] unsharded
+    return [None] + [index for index in shards() if index is not None]
+
+
+def _name(index):
+    return 'database' if index is None else f'shard {index}'
+
+
+@click.command('apply-retention')
+@click.option('--no-vacuum', is_flag=True, help='Leave freed pages in the files.')
+def apply_retention_command(no_vacuum):
+    """Delete entries past their owner's retention period, then vacuum."""
+    results = apply_retention()
+    for user_id, deleted in results.items():
+        click.echo(f'Deleted {deleted} entries of user {user_id}.')
+    click.echo(f'Deleted {sum(results.values())} entries in total.')
+    if not no_vacuum:
+        _vacuum_all()
+
+
+def _vacuum_all():
+    config = current_app.config
+    for index in _database_indexes():
+        freed = vacuum(
+            get_shard(index), config['VACUUM_STEP_PAGES'],
+            pause=config['VACUUM_STEP_PAUSE'],
+        )
+        click.echo(f'Freed {freed} pages in the {_name(index)}.')
+
+
+@click.command('vacuum-db')
+@click.option('--full', is_flag=True,
+              help='Rebuild each file with VACUUM, switching older files to '
+                   'incremental auto-vacuum. Locks the database while it runs.')
+def vacuum_db_command(full):
+    """Return free pages in the database files to the file system."""
+    if not full:
+        _vacuum_all()
+        return
+
+    mode = current_app.config['SQLITE_AUTO_VACUUM']
+    for index in _database_indexes():
+        db = get_shard(index)
+        db.execute(f'PRAGMA auto_vacuum = {mode}')
+        db.execute('VACUUM')
+        click.echo(f'Rebuilt the {_name(index)}.')
+
+
+def init_app(app):
+    """Register the retention and vacuum commands with the Flask app."""
+    app.cli.add_command(apply_retention_command)
+    app.cli.add_command(vacuum_db_command)
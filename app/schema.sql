@@ -15,6 +15,204 @@ CREATE TABLE entries (
     text TEXT NOT NULL,
     mood TEXT,
     reflection TEXT,
+    mood_category TEXT,
     timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    -- pending, ok, failed (fallback stored) or outdated (queued for reanalyze)
+    analysis_status TEXT NOT NULL DEFAULT 'pending',
+    analysis_model TEXT,
+    analysis_prompt_version INTEGER,
+    -- Bumped on every change to what an entry card shows (see below)
+    revision INTEGER NOT NULL DEFAULT 0,
     FOREIGN KEY (user_id) REFERENCES users (id)
-);
\ No newline at end of file
+);
+CREATE INDEX idx_entries_user_timestamp ON entries (user_id, timestamp DESC, id DESC);
+-- Small: only entries `flask reanalyze` still has to redo
+CREATE INDEX idx_entries_needs_analysis ON entries (id)
+WHERE analysis_status IN ('failed', 'outdated');
+
+-- Entry text may be stored compressed (see app/codec.py); this view and
+-- the codec_decode() SQL function every connection registers read it back
+DROP VIEW IF EXISTS entry_texts;
+CREATE VIEW entry_texts AS SELECT id, codec_decode(text) AS text FROM entries;
+
+-- Preset dictionaries compressed values refer to by id
+DROP TABLE IF EXISTS codec_dictionaries;
+CREATE TABLE codec_dictionaries (
+    id BLOB PRIMARY KEY,
+    data BLOB NOT NULL,
+    created_at REAL NOT NULL
+);
+
+-- Full-text search over entry text, kept in sync by triggers. They index
+-- plain text only and never call codec_decode(), so tools without the app
+-- can still write entries; the app indexes compressed rows itself (see
+-- app/search.py).
+DROP TABLE IF EXISTS entries_fts;
+CREATE VIRTUAL TABLE entries_fts USING fts5(
+    text, content='entry_texts', content_rowid='id', tokenize='porter unicode61'
+);
+CREATE TRIGGER entries_fts_insert AFTER INSERT ON entries
+WHEN typeof(new.text) = 'text' BEGIN
+    INSERT INTO entries_fts (rowid, text) VALUES (new.id, new.text);
+END;
+CREATE TRIGGER entries_fts_delete AFTER DELETE ON entries
+WHEN typeof(old.text) = 'text' BEGIN
+    INSERT INTO entries_fts (entries_fts, rowid, text) VALUES ('delete', old.id, old.text);
+END;
+-- Compressing or uncompressing text leaves what is indexed as it is
+CREATE TRIGGER entries_fts_update AFTER UPDATE OF text ON entries
+WHEN typeof(old.text) = 'text' AND typeof(new.text) = 'text'
+AND old.text IS NOT new.text BEGIN
+    INSERT INTO entries_fts (entries_fts, rowid, text) VALUES ('delete', old.id, old.text);
+    INSERT INTO entries_fts (rowid, text) VALUES (new.id, new.text);
+END;
+
+-- Background analysis queue
+DROP TABLE IF EXISTS analysis_jobs;
+CREATE TABLE analysis_jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    entry_id INTEGER UNIQUE NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    run_after REAL NOT NULL DEFAULT 0,
+    locked_at REAL,
+    last_error TEXT,
+    FOREIGN KEY (entry_id) REFERENCES entries (id)
+);
+CREATE INDEX idx_analysis_jobs_due ON analysis_jobs (run_after);
+
+-- Content-addressed cache of analysis results
+DROP TABLE IF EXISTS analysis_cache;
+CREATE TABLE analysis_cache (
+    key TEXT PRIMARY KEY,
+    mood TEXT NOT NULL,
+    reflection TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX idx_analysis_cache_created ON analysis_cache (created_at);
+
+-- Where an interrupted `flask reanalyze` run picks up again
+DROP TABLE IF EXISTS reanalyze_checkpoint;
+CREATE TABLE reanalyze_checkpoint (
+    target TEXT PRIMARY KEY,
+    last_id INTEGER NOT NULL,
+    updated_at REAL NOT NULL
+);
+
+-- Per-user mood counts by day and by week (keyed by the week's Monday),
+-- maintained by triggers so insights never scan entries
+DROP TABLE IF EXISTS mood_daily;
+CREATE TABLE mood_daily (
+    user_id INTEGER NOT NULL,
+    day TEXT NOT NULL,
+    category TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (user_id, day, category)
+) WITHOUT ROWID;
+
+DROP TABLE IF EXISTS mood_weekly;
+CREATE TABLE mood_weekly (
+    user_id INTEGER NOT NULL,
+    week TEXT NOT NULL,
+    category TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (user_id, week, category)
+) WITHOUT ROWID;
+
+CREATE TRIGGER mood_rollup_insert AFTER INSERT ON entries
+WHEN new.mood_category IS NOT NULL BEGIN
+    INSERT INTO mood_daily (user_id, day, category, count)
+    VALUES (new.user_id, date(new.timestamp), new.mood_category, 1)
+    ON CONFLICT (user_id, day, category) DO UPDATE SET count = count + 1;
+    INSERT INTO mood_weekly (user_id, week, category, count)
+    VALUES (new.user_id, date(new.timestamp, 'weekday 0', '-6 days'), new.mood_category, 1)
+    ON CONFLICT (user_id, week, category) DO UPDATE SET count = count + 1;
+END;
+
+CREATE TRIGGER mood_rollup_delete AFTER DELETE ON entries
+WHEN old.mood_category IS NOT NULL BEGIN
+    UPDATE mood_daily SET count = count - 1
+    WHERE user_id = old.user_id AND day = date(old.timestamp)
+    AND category = old.mood_category;
+    DELETE FROM mood_daily
+    WHERE user_id = old.user_id AND day = date(old.timestamp) AND count <= 0;
+    UPDATE mood_weekly SET count = count - 1
+    WHERE user_id = old.user_id AND week = date(old.timestamp, 'weekday 0', '-6 days')
+    AND category = old.mood_category;
+    DELETE FROM mood_weekly
+    WHERE user_id = old.user_id AND week = date(old.timestamp, 'weekday 0', '-6 days')
+    AND count <= 0;
+END;
+
+CREATE TRIGGER mood_rollup_update AFTER UPDATE OF mood_category, user_id, timestamp ON entries
+WHEN old.mood_category IS NOT new.mood_category
+    OR old.user_id IS NOT new.user_id
+    OR old.timestamp IS NOT new.timestamp BEGIN
+    UPDATE mood_daily SET count = count - 1
+    WHERE old.mood_category IS NOT NULL
+    AND user_id = old.user_id AND day = date(old.timestamp)
+    AND category = old.mood_category;
+    DELETE FROM mood_daily
+    WHERE user_id = old.user_id AND day = date(old.timestamp) AND count <= 0;
+    UPDATE mood_weekly SET count = count - 1
+    WHERE old.mood_category IS NOT NULL
+    AND user_id = old.user_id AND week = date(old.timestamp, 'weekday 0', '-6 days')
+    AND category = old.mood_category;
+    DELETE FROM mood_weekly
+    WHERE user_id = old.user_id AND week = date(old.timestamp, 'weekday 0', '-6 days')
+    AND count <= 0;
+    INSERT INTO mood_daily (user_id, day, category, count)
+    SELECT new.user_id, date(new.timestamp), new.mood_category, 1
+    WHERE new.mood_category IS NOT NULL
+    ON CONFLICT (user_id, day, category) DO UPDATE SET count = count + 1;
+    INSERT INTO mood_weekly (user_id, week, category, count)
+    SELECT new.user_id, date(new.timestamp, 'weekday 0', '-6 days'), new.mood_category, 1
+    WHERE new.mood_category IS NOT NULL
+    ON CONFLICT (user_id, week, category) DO UPDATE SET count = count + 1;
+END;
+
+-- Per-user change counter behind the ETags of entry pages. Triggers bump it
+-- on every write to a user's entries, whichever code path makes it.
+DROP TABLE IF EXISTS user_versions;
+CREATE TABLE user_versions (
+    user_id INTEGER PRIMARY KEY,
+    version INTEGER NOT NULL
+);
+CREATE TRIGGER user_version_insert AFTER INSERT ON entries BEGIN
+    INSERT INTO user_versions (user_id, version) VALUES (new.user_id, 1)
+    ON CONFLICT (user_id) DO UPDATE SET version = version + 1;
+END;
+CREATE TRIGGER user_version_delete AFTER DELETE ON entries BEGIN
+    INSERT INTO user_versions (user_id, version) VALUES (old.user_id, 1)
+    ON CONFLICT (user_id) DO UPDATE SET version = version + 1;
+END;
+CREATE TRIGGER user_version_update AFTER UPDATE ON entries BEGIN
+    INSERT INTO user_versions (user_id, version) VALUES (new.user_id, 1)
+    ON CONFLICT (user_id) DO UPDATE SET version = version + 1;
+    INSERT INTO user_versions (user_id, version)
+    SELECT old.user_id, 1 WHERE old.user_id IS NOT new.user_id
+    ON CONFLICT (user_id) DO UPDATE SET version = version + 1;
+END;
+
+-- Rendered entry cards are cached by entry and revision (app/fragments.py),
+-- so a card is rendered again whenever its text or analysis changes
+CREATE TRIGGER entry_revision_update
+AFTER UPDATE OF text, mood, reflection, analysis_status ON entries BEGIN
+    UPDATE entries SET revision = revision + 1 WHERE id = new.id;
+END;
+
+-- Which shard holds each user's entries when DATABASE_SHARDS is set. Only
+-- used in the main database; shards have the same schema so one set of
+-- migrations fits every file.
+DROP TABLE IF EXISTS user_shards;
+CREATE TABLE user_shards (
+    user_id INTEGER PRIMARY KEY,
+    shard INTEGER NOT NULL
+);
+
+-- How long each user's entries are kept; `flask apply-retention` deletes
+-- older ones. Users without a rule keep everything. Main database only.
+DROP TABLE IF EXISTS retention_rules;
+CREATE TABLE retention_rules (
+    user_id INTEGER PRIMARY KEY,
+    keep_days INTEGER NOT NULL CHECK (keep_days > 0)
+);
@@ -0,0 +1,114 @@
+import re
+import click
+from markupsafe import Markup, escape
+from app.db import get_db, get_shard, shards
+
+# Markers FTS5 wraps around matched terms; control characters cannot appear
+# in form input, so they survive HTML escaping and are swapped for <mark>.
+_MATCH_START = '\x02'
+_MATCH_END = '\x03'
+
+def build_match_query(terms):
+    """Turn free text into a safe FTS5 query.
+
+    Every word must match and the last one matches as a prefix, so results
+    narrow as the user types. FTS5 operators and quotes in the input are
+    treated as plain text rather than query syntax.
+    """
+    words = re.findall(r'\w+', terms)
+    if not words:
+        return None
+
+    quoted = [f'"{word}"' for word in words]
+    quoted[-1] += '*'
+    return ' '.join(quoted)
+
+def highlight(snippet):
+    """Escape a snippet and wrap matched terms in <mark> tags."""
+    html = str(escape(snippet))
+    return Markup(
+        html.replace(_MATCH_START, '<mark>').replace(_MATCH_END, '</mark>')
+    )
+
+def search_entries(user_id, terms, page=1, page_size=20):
+    """Search one user's entries, best matches first.
+
+    Returns the results for ``page`` and whether there is another page.
+    """
+    match = build_match_query(terms)
+    if match is None:
+        return [], False
+
+    rows = get_db(user_id).execute(
+        'SELECT e.id, e.mood, e.timestamp,'
+        ' snippet(entries_fts, 0, ?, ?, \'…\', 32) AS snippet'
+        ' FROM entries_fts JOIN entries e ON e.id = entries_fts.rowid'
+        ' WHERE entries_fts MATCH ? AND e.user_id = ?'
+        ' ORDER BY entries_fts.rank'
+        ' LIMIT ? OFFSET ?',
+        (_MATCH_START, _MATCH_END, match, user_id,
+         page_size + 1, (page - 1) * page_size)
+    ).fetchall()
+
+    results = [
+        {
+            'id': row['id'],
+            'mood': row['mood'],
+            'timestamp': row['timestamp'],
+            'snippet': highlight(row['snippet']),
+        }
+        for row in rows[:page_size]
+    ]
+    return results, len(rows) > page_size
+
+def _compressed(db, user_id, ids, sql):
+    # Run sql for the user's compressed entries among ids, 500 at a time
+    ids = list(ids)
+    for i in range(0, len(ids), 500):
+        chunk = ids[i:i + 500]
+        db.execute(
+            sql + " FROM entries WHERE +user_id = ? AND typeof(text) = 'blob'"
+            f" AND id IN ({', '.join('?' * len(chunk))})",
+            [user_id] + chunk
+        )
+
+def index_compressed(db, user_id, ids):
+    """Index a user's compressed entries among ``ids``, just inserted.
+
+    The triggers only index plain text, so copying compressed rows in
+    needs this. The caller commits.
+    """
+    _compressed(
+        db, user_id, ids,
+        'INSERT INTO entries_fts (rowid, text) SELECT id, codec_decode(text)'
+    )
+
+def unindex_compressed(db, user_id, ids):
+    """Drop a user's compressed entries among ``ids`` from the index.
+
+    Call before deleting them: the triggers only unindex plain text.
+    The caller commits.
+    """
+    _compressed(
+        db, user_id, ids,
+        "INSERT INTO entries_fts (entries_fts, rowid, text)"
+        " SELECT 'delete', id, codec_decode(text)"
+    )
+
+def rebuild_index():
+    """Rebuild the full-text index from the entries table of every shard."""
+    for index in shards():
+        db = get_shard(index)
+        db.execute("INSERT INTO entries_fts (entries_fts) VALUES ('rebuild')")
+        db.execute("INSERT INTO entries_fts (entries_fts) VALUES ('optimize')")
+        db.commit()
+
+@click.command('rebuild-search')
+def rebuild_search_command():
+    """Rebuild the full-text search index for all entries."""
+    rebuild_index()
+    click.echo('Rebuilt the search index.')
+
+def init_app(app):
+    """Register search CLI commands with the Flask app."""
+    app.cli.add_command(rebuild_search_command)
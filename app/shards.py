@@ -0,0 +1,196 @@
+import click
+from flask import current_app
+from app import fragments, search
+from app.db import get_db, get_shard, shard_of
+from app.httpcache import user_version
+
+
+def shard_loads():
+    """Entry counts per user on each shard: {shard: {user_id: count}}.
+
+    Covers the configured shards and any shard beyond them that users are
+    still placed on, e.g. after DATABASE_SHARDS was lowered.
+    """
+    placed = get_db().execute('SELECT DISTINCT shard FROM user_shards').fetchall()
+    indexes = set(range(current_app.config['DATABASE_SHARDS']))
+    indexes.update(row['shard'] for row in placed)
+
+    loads = {}
+    for index in sorted(indexes):
+        rows = get_shard(index).execute(
+            'SELECT user_id, COUNT(*) AS count FROM entries GROUP BY user_id'
+        ).fetchall()
+        loads[index] = {row['user_id']: row['count'] for row in rows}
+    return loads
+
+
+def plan_moves(loads, count):
+    """Moves that even out entry counts over shards 0..count-1.
+
+    ``loads`` is as returned by ``shard_loads``. Users on a shard outside
+    the range always move; then the biggest journal that narrows the gap
+    between the fullest and emptiest shard moves, until none does.
+    Returns a list of (user_id, from_shard, to_shard).
+    """
+    totals = {index: 0 for index in range(count)}
+    users = {index: {} for index in range(count)}
+    moves = []
+
+    for index, journals in loads.items():
+        if index in totals:
+            users[index].update(journals)
+            totals[index] += sum(journals.values())
+    for index, journals in sorted(loads.items()):
+        if index in totals:
+            continue
+        for user_id, size in sorted(journals.items(), key=lambda item: -item[1]):
+            target = min(totals, key=totals.get)
+            moves.append((user_id, index, target))
+            users[target][user_id] = size
+            totals[target] += size
+
+    while count > 1:
+        fullest = max(totals, key=totals.get)
+        emptiest = min(totals, key=totals.get)
+        gap = totals[fullest] - totals[emptiest]
+        # Moving a journal smaller than the gap always narrows it
+        fitting = [(size, user_id) for user_id, size in users[fullest].items()
+                   if 0 < size < gap]
+        if not fitting:
+            break
+        size, user_id = max(fitting)
+        moves.append((user_id, fullest, emptiest))
+        del users[fullest][user_id]
+        users[emptiest][user_id] = size
+        totals[fullest] -= size
+        totals[emptiest] += size
+
+    return moves
+
+
+def move_user(user_id, target):
+    """Move a user's entries, queued jobs and rollups to shard ``target``.
+
+    The source shard is write-locked for the duration of the copy, and the
+    old rows are only deleted once the new placement is committed, so a
+    crash midway leaves at worst an unreachable copy on one of the two
+    shards. Entries get new ids on the target shard. Returns the number of
+    entries moved.
+    """
+    source = shard_of(user_id)
+    if source == target:
+        return 0
+    src, dst = get_shard(source), get_shard(target)
+
+    src.execute('BEGIN IMMEDIATE')
+    dst.execute('BEGIN IMMEDIATE')
+    try:
+        entries = src.execute(
+            'SELECT * FROM entries WHERE user_id = ? ORDER BY id', (user_id,)
+        ).fetchall()
+        jobs = {
+            row['entry_id']: row for row in src.execute(
+                'SELECT j.* FROM analysis_jobs j JOIN entries e ON e.id = j.entry_id'
+                ' WHERE e.user_id = ?', (user_id,)
+            )
+        }
+
+        # Compressed text needs its dictionaries on the new shard too
+        dst.executemany(
+            'INSERT OR IGNORE INTO codec_dictionaries (id, data, created_at)'
+            ' VALUES (?, ?, ?)',
+            src.execute('SELECT id, data, created_at FROM codec_dictionaries').fetchall()
+        )
+        moved = []
+        for entry in entries:
+            # Rollups, search index and change counter follow via triggers;
+            # compressed text is indexed below
+            columns = [name for name in entry.keys() if name != 'id']
+            cursor = dst.execute(
+                f"INSERT INTO entries ({', '.join(columns)})"
+                f" VALUES ({', '.join('?' * len(columns))})",
+                [entry[name] for name in columns]
+            )
+            moved.append(cursor.lastrowid)
+            job = jobs.get(entry['id'])
+            if job is not None:
+                dst.execute(
+                    'INSERT INTO analysis_jobs (entry_id, attempts, run_after, last_error)'
+                    ' VALUES (?, ?, ?, ?)',
+                    (cursor.lastrowid, job['attempts'], job['run_after'], job['last_error'])
+                )
+
+        search.index_compressed(dst, user_id, moved)
+
+        # ETags must never go back to a value served from the old shard
+        dst.execute(
+            'INSERT INTO user_versions (user_id, version) VALUES (?, ?)'
+            ' ON CONFLICT (user_id) DO UPDATE SET'
+            ' version = MAX(version, excluded.version) + 1',
+            (user_id, user_version(src, user_id) + 1)
+        )
+        dst.commit()
+
+        main = get_db()
+        main.execute(
+            'INSERT INTO user_shards (user_id, shard) VALUES (?, ?)'
+            ' ON CONFLICT (user_id) DO UPDATE SET shard = excluded.shard',
+            (user_id, target)
+        )
+        main.commit()
+
+        src.execute(
+            'DELETE FROM analysis_jobs WHERE entry_id IN'
+            ' (SELECT id FROM entries WHERE user_id = ?)', (user_id,)
+        )
+        search.unindex_compressed(src, user_id, [entry['id'] for entry in entries])
+        src.execute('DELETE FROM entries WHERE user_id = ?', (user_id,))
+        src.commit()
+    except Exception:
+        src.rollback()
+        dst.rollback()
+        raise
+
+    # Cards are cached by entry id, and the entries were renumbered. This
+    # only reaches this process and the shared file; other processes miss
+    # their old cards because the shard is part of every card's version.
+    fragments.discard(user_id)
+
+    return len(entries)
+
+
+@click.command('rebalance-shards')
+@click.option('--user', 'username', help='Move only this user.')
+@click.option('--to', 'target', type=int, help='Shard to move --user to.')
+@click.option('--dry-run', is_flag=True, help='Only print the planned moves.')
+def rebalance_command(username, target, dry_run):
+    """Move users between shards to even out their size."""
+    count = current_app.config['DATABASE_SHARDS']
+    if not count:
+        raise click.ClickException('DATABASE_SHARDS is not set.')
+
+    if username is not None:
+        if target is None or not 0 <= target < count:
+            raise click.ClickException(f'--to must be a shard from 0 to {count - 1}.')
+        user = get_db().execute(
+            'SELECT id FROM users WHERE username = ?', (username,)
+        ).fetchone()
+        if user is None:
+            raise click.ClickException(f'User {username} does not exist.')
+        moves = [(user['id'], shard_of(user['id']), target)]
+    else:
+        moves = plan_moves(shard_loads(), count)
+
+    for user_id, source, destination in moves:
+        if dry_run:
+            click.echo(f'Would move user {user_id} from shard {source} to {destination}.')
+            continue
+        moved = move_user(user_id, destination)
+        click.echo(f'Moved user {user_id} ({moved} entries) from shard {source} to {destination}.')
+    if not moves:
+        click.echo('Shards are balanced.')
+
+
+def init_app(app):
+    """Register the shard rebalancing command with the Flask app."""
+    app.cli.add_command(rebalance_command)
@@ -0,0 +1,89 @@
+"""Analysis latency and Gemini usage of each analyzer backend.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_analyzers [--entries N] [--batch B]
+        [--llm-latency S] [--confidence C]
+
+Analyzes the same generated entries with the gemini, lexicon and tiered
+backends, B entries per call as the queue workers do. Gemini is a fake
+that answers after ``--llm-latency`` seconds per request. "instant" is
+the time to the mood shown when an entry is saved; "analyze" is the
+background queue's time per entry saved, for the entries it receives.
+"""
+import argparse
+import os
+import random
+import time
+
+from app import analyzers, create_app, gemini
+from benchmarks.support import fake_chat_model
+
+CLEAR = (
+    'Stressed about the deadline and worried I will not finish.',
+    'Such a happy day, excited and proud of the team.',
+    'Calm and grateful after a long walk, really relaxed.',
+    'Exhausted and drained, barely slept again.',
+)
+FILLER = (
+    'Went to the office, had lunch with Sam.',
+    'The train was late and the meeting ran long.',
+    'Cooked pasta and watched a film.',
+    'Mixed day, hard to say how I feel about it.',
+)
+
+
+def corpus(count, seed=3):
+    rng = random.Random(seed)
+    return [
+        ' '.join(rng.choice(CLEAR if rng.random() < 0.5 else FILLER) for _ in range(3))
+        for _ in range(count)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--entries', type=int, default=500)
+    parser.add_argument('--batch', type=int, default=10)
+    parser.add_argument('--llm-latency', type=float, default=0.8)
+    parser.add_argument('--confidence', type=float, default=0.6)
+    args = parser.parse_args()
+
+    fake = fake_chat_model(args.llm_latency, jitter=0.0)
+    os.environ.setdefault('GEMINI_API_KEY', 'bench-key')
+    gemini.ChatGoogleGenerativeAI = fake
+    # No result cache, so every backend pays for every entry
+    app = create_app({
+        'TESTING': True, 'DATABASE': ':memory:',
+        'ANALYSIS_CACHE_SIZE': 0, 'ANALYSIS_CACHE_PERSIST': False,
+        'ANALYZER_CONFIDENCE': args.confidence,
+    })
+    texts = corpus(args.entries)
+
+    print(f'{args.entries} entries, {args.batch} per batch,'
+          f' fake Gemini {args.llm_latency * 1000:.0f} ms/request')
+    print(f"{'backend':8} {'instant':>12} {'analyze':>14} {'gemini calls':>13} {'escalated':>10}")
+    with app.app_context():
+        for name in analyzers.BACKENDS:
+            analyzer = analyzers.BACKENDS[name](app.config)
+            fake.calls = 0
+
+            start = time.perf_counter()
+            quick = [analyzer.quick(text) for text in texts]
+            instant_ms = (time.perf_counter() - start) * 1000 / len(texts)
+
+            # Only entries without a final instant result reach the queue
+            queued = [text for text, q in zip(texts, quick) if q is None or not q[2]]
+            start = time.perf_counter()
+            for i in range(0, len(queued), args.batch):
+                analyzer.analyze(queued[i:i + args.batch])
+            analyze_ms = (time.perf_counter() - start) * 1000 / len(texts)
+
+            escalated = len(queued)
+            instant = 'none' if quick[0] is None else f'{instant_ms:.4f} ms'
+            print(f'{name:8} {instant:>12} {analyze_ms:>11.3f} ms {fake.calls:>13}'
+                  f' {escalated / len(texts):>10.0%}')
+
+
+if __name__ == '__main__':
+    main()
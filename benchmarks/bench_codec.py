@@ -0,0 +1,145 @@
+"""On-disk size and read latency of plain vs. compressed entry text.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_codec [--entries N] [--repeat R]
+
+Seeds one user with N generated journal entries and reflections, then
+compares three copies of the database: plain text, compressed with zlib
+alone, and compressed with a dictionary trained on the journal (what
+`flask compact-entries` does). Each copy is vacuumed before its file size
+is taken. Read latency is the median time to fetch an entries list page
+and to export the whole journal.
+"""
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from app import compaction, create_app
+from app.db import dispose_pool, get_db, init_db
+from app.entries import fetch_page
+from app.export import generate_export
+
+OPENINGS = [
+    'Today was {adj}.', 'Woke up feeling {adj}.', 'Another {adj} day at work.',
+    'Spent the evening {doing}.', 'This morning I was {adj} about {thing}.',
+]
+SENTENCES = [
+    'I went for a walk in the {place} and thought about {thing}.',
+    'The meeting about {thing} ran long, and I felt {adj} afterwards.',
+    'Had dinner with {person} and we talked about {thing}.',
+    'I keep worrying about {thing}, but I am trying to let it go.',
+    'Spent an hour {doing}, which always helps me feel {adj}.',
+    'I am grateful for {person} and for {thing}.',
+    'Tomorrow I want to focus on {thing} and get some rest.',
+]
+WORDS = {
+    'adj': ['calm', 'tired', 'anxious', 'happy', 'frustrated', 'hopeful', 'quiet'],
+    'doing': ['reading', 'cooking', 'running', 'writing', 'gardening', 'painting'],
+    'thing': ['the project deadline', 'my health', 'moving house', 'the budget',
+              'my sister', 'the new job', 'the garden', 'sleep'],
+    'place': ['park', 'woods', 'city', 'old neighbourhood'],
+    'person': ['my mother', 'an old friend', 'my partner', 'the team'],
+}
+REFLECTIONS = [
+    'It sounds like you are carrying a lot right now. Try naming the one '
+    'thing you can act on tomorrow, and let the rest wait.',
+    'Noticing what went well is a habit worth keeping. What made today '
+    'feel this way, and how can you make room for more of it?',
+    'Rest is part of the work, not a break from it. Be gentle with yourself '
+    'this evening.',
+]
+
+
+def make_entry(rng):
+    fill = {key: rng.choice(values) for key, values in WORDS.items()}
+    parts = [rng.choice(OPENINGS)] + rng.sample(SENTENCES, rng.randint(3, 6))
+    return ' '.join(part.format(**fill) for part in parts)
+
+
+def seed(app, count):
+    rng = random.Random(7)
+    with app.app_context():
+        init_db()
+        db = get_db()
+        db.execute("INSERT INTO users (username, password_hash) VALUES ('bench', 'x')")
+        db.executemany(
+            "INSERT INTO entries (user_id, text, mood, reflection, timestamp)"
+            " VALUES (1, ?, 'calm', ?, datetime('2015-01-01', ? || ' hours'))",
+            ((make_entry(rng), rng.choice(REFLECTIONS), i) for i in range(count))
+        )
+        db.commit()
+
+
+def file_size(app):
+    with app.app_context():
+        db = get_db()
+        db.execute('VACUUM')
+        db.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    return os.path.getsize(app.config['DATABASE'])
+
+
+def median_ms(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return timings[len(timings) // 2]
+
+
+def measure(app, repeat):
+    with app.app_context():
+        page_ms = median_ms(lambda: fetch_page(1), repeat * 10)
+        export_ms = median_ms(lambda: sum(map(len, generate_export(1))), repeat)
+    return file_size(app), page_ms, export_ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--entries', type=int, default=50_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    try:
+        plain_path = os.path.join(directory, 'plain.db')
+        apps = {}
+        for name in ('plain', 'zlib', 'zlib+dictionary'):
+            apps[name] = create_app({
+                'TESTING': True, 'ANALYSIS_WORKERS': 0,
+                'DATABASE': os.path.join(directory, f'{name}.db'),
+            })
+        seed(apps['plain'], args.entries)
+        file_size(apps['plain'])
+        dispose_pool(plain_path)
+        for name in ('zlib', 'zlib+dictionary'):
+            shutil.copy(plain_path, apps[name].config['DATABASE'])
+
+        for name, app in apps.items():
+            if name != 'plain':
+                with app.app_context():
+                    db = get_db()
+                    dictionary = None
+                    if name == 'zlib+dictionary':
+                        dictionary = compaction.train(db, 2000, 32 * 1024)
+                        db.commit()
+                    start = time.perf_counter()
+                    compaction.compact(db, 0, 0, dictionary=dictionary)
+                    print(f'compacted {name} in {time.perf_counter() - start:.1f}s')
+
+        print(f"{'storage':16} {'file MB':>8} {'list page ms':>13} {'export ms':>10}")
+        for name, app in apps.items():
+            size, page_ms, export_ms = measure(app, args.repeat)
+            print(f'{name:16} {size / 1e6:8.1f} {page_ms:13.2f} {export_ms:10.0f}')
+    finally:
+        dispose_pool()
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,163 @@
+"""Request latency while a large journal is deleted and its space reclaimed.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_delete [--entries N] [--chunks 500,0]
+
+Seeds one user with N entries (a million by default) and a second user with
+a small journal, then deletes the first user's entries in a background
+thread while the main thread keeps serving the second user: loading their
+entries page and saving a new entry, the way the list and add views do.
+Each chunk size is run on a fresh copy of the database. Chunked deletes
+are followed by bounded incremental vacuum steps; 0 deletes everything in
+one transaction followed by a full VACUUM, which is what the app did
+before. p50/p99/max are per request in milliseconds; "failed" counts
+writes that gave up waiting for the lock (SQLITE_BUSY_TIMEOUT).
+"""
+import argparse
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+
+from app import create_app, retention
+from app.db import dispose_pool, get_db, init_db
+from app.entries import fetch_page
+
+
+def make_app(path, **config):
+    return create_app({'TESTING': True, 'ANALYSIS_WORKERS': 0, 'DATABASE': path, **config})
+
+
+def seed(app, count):
+    with app.app_context():
+        init_db()
+        db = get_db()
+        db.executemany(
+            'INSERT INTO users (username, password_hash) VALUES (?, ?)',
+            [('big', 'x'), ('small', 'x')]
+        )
+        for start in range(0, count, 50_000):
+            db.executemany(
+                "INSERT INTO entries (user_id, text, mood, mood_category, timestamp)"
+                " VALUES (1, ?, 'calm', 'positive', datetime('2015-01-01', ? || ' minutes'))",
+                ((f'Entry {i}: a quiet day, a walk and an early night.', i)
+                 for i in range(start, min(count, start + 50_000)))
+            )
+            db.commit()
+        db.executemany(
+            "INSERT INTO entries (user_id, text, mood) VALUES (2, ?, 'calm')",
+            ((f'Small journal entry {i}.',) for i in range(200))
+        )
+        db.commit()
+
+
+def cleanup(app, chunk_size, timings):
+    with app.app_context():
+        db = get_db()
+        start = time.perf_counter()
+        if chunk_size:
+            retention.delete_entries(
+                db, 1, end='9999-12-31', chunk_size=chunk_size,
+                pause=app.config['DELETE_CHUNK_PAUSE'],
+            )
+            timings['delete'] = time.perf_counter() - start
+            retention.vacuum(
+                db, app.config['VACUUM_STEP_PAGES'], pause=app.config['VACUUM_STEP_PAUSE']
+            )
+        else:
+            db.execute('DELETE FROM analysis_jobs')
+            db.execute('DELETE FROM entries WHERE user_id = 1')
+            db.commit()
+            timings['delete'] = time.perf_counter() - start
+            db.execute('VACUUM')
+        timings['total'] = time.perf_counter() - start
+
+
+def serve(app, done):
+    reads, writes, failed = [], [], 0
+    with app.app_context():
+        db = get_db(2)
+        while not done.is_set():
+            start = time.perf_counter()
+            fetch_page(2)
+            reads.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            try:
+                db.execute("INSERT INTO entries (user_id, text) VALUES (2, 'New entry.')")
+                db.commit()
+                writes.append(time.perf_counter() - start)
+            except sqlite3.OperationalError:
+                db.rollback()
+                failed += 1
+            time.sleep(0.01)
+    return reads, writes, failed
+
+
+def percentiles(timings):
+    if not timings:
+        return '      -       -       -'
+    timings = sorted(t * 1000 for t in timings)
+    p50 = timings[len(timings) // 2]
+    p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+    return f'{p50:7.1f} {p99:7.1f} {timings[-1]:7.0f}'
+
+
+def run(path, chunk_size):
+    app = make_app(path)
+    timings = {}
+    done = threading.Event()
+
+    def worker():
+        try:
+            cleanup(app, chunk_size, timings)
+        finally:
+            done.set()
+
+    thread = threading.Thread(target=worker)
+    thread.start()
+    reads, writes, failed = serve(app, done)
+    thread.join()
+    with app.app_context():
+        # Let the file shrink now nothing is reading it
+        get_db().execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    dispose_pool()
+    return timings, reads, writes, failed, os.path.getsize(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--entries', type=int, default=1_000_000)
+    parser.add_argument('--chunks', default='500,0',
+                        help='Comma-separated chunk sizes; 0 is one transaction.')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    try:
+        seeded = os.path.join(directory, 'seeded.db')
+        start = time.perf_counter()
+        seed(make_app(seeded), args.entries)
+        dispose_pool()
+        print(f'seeded {args.entries:,} entries in {time.perf_counter() - start:.0f}s,'
+              f' {os.path.getsize(seeded) / 1e6:.1f} MB')
+
+        print(f"{'chunk':>6} {'delete s':>8} {'total s':>8} {'file MB':>8}"
+              f" {'read p50':>8} {'p99':>7} {'max':>7}"
+              f" {'write p50':>9} {'p99':>7} {'max':>7} {'failed':>6}")
+        for chunk_size in [int(n) for n in args.chunks.split(',')]:
+            path = os.path.join(directory, f'chunk{chunk_size}.db')
+            shutil.copy(seeded, path)
+            timings, reads, writes, failed, size = run(path, chunk_size)
+            print(f"{chunk_size or 'all':>6} {timings['delete']:8.1f} {timings['total']:8.1f}"
+                  f" {size / 1e6:8.1f} {percentiles(reads):>24}"
+                  f"  {percentiles(writes):>24} {failed:6d}")
+    finally:
+        dispose_pool()
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
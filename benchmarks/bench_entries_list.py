@@ -0,0 +1,89 @@
+"""Entries list latency at different depths of a very long journal.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_entries_list [--entries N] [--repeat R]
+
+Seeds one user with N entries and times the first page, a page halfway
+through (reached via its keyset cursor) and the last page. With keyset
+pagination all three should cost about the same.
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from app import create_app
+from app.db import dispose_pool, get_db, init_db
+from app.entries import encode_cursor
+
+
+def seed(app, count):
+    with app.app_context():
+        init_db()
+        db = get_db()
+        db.execute("INSERT INTO users (username, password_hash) VALUES ('bench', 'x')")
+        db.executemany(
+            "INSERT INTO entries (user_id, text, mood, reflection, timestamp)"
+            " VALUES (1, ?, 'calm', 'Keep going.', datetime('2015-01-01', ? || ' minutes'))",
+            ((f'Journal entry number {i}. ' * 8, i) for i in range(count))
+        )
+        db.commit()
+
+
+def cursor_at(app, offset):
+    with app.app_context():
+        row = get_db().execute(
+            'SELECT id, timestamp FROM entries WHERE user_id = 1'
+            ' ORDER BY timestamp DESC, id DESC LIMIT 1 OFFSET ?',
+            (offset,)
+        ).fetchone()
+        return encode_cursor(row)
+
+
+def time_page(client, url, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = client.get(url)
+        timings.append((time.perf_counter() - start) * 1000)
+        assert response.status_code == 200, response.status_code
+    timings.sort()
+    return timings[len(timings) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--entries', type=int, default=100_000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    db_fd, db_path = tempfile.mkstemp()
+    try:
+        app = create_app({
+            'TESTING': True, 'DATABASE': db_path, 'ANALYSIS_WORKERS': 0,
+        })
+        start = time.perf_counter()
+        seed(app, args.entries)
+        print(f'seeded {args.entries} entries in {time.perf_counter() - start:.1f}s')
+
+        page_size = app.config['ENTRIES_PAGE_SIZE']
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['user_id'] = 1
+
+        pages = {
+            'first page': '/entries/list',
+            'middle page': f'/entries/list?cursor={cursor_at(app, args.entries // 2)}',
+            'last page': f'/entries/list?cursor={cursor_at(app, args.entries - page_size - 1)}',
+        }
+        for name, url in pages.items():
+            print(f'{name:12} {time_page(client, url, args.repeat):8.2f} ms (median)')
+    finally:
+        dispose_pool(db_path)
+        os.close(db_fd)
+        os.unlink(db_path)
+
+
+if __name__ == '__main__':
+    main()
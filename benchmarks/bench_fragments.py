@@ -0,0 +1,124 @@
+"""Render time of a 1,000-entry list page with and without the card cache.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_fragments [--entries N] [--repeat R]
+
+Seeds one user with N analyzed entries and renders their entries page
+with all N entries on it (ENTRIES_PAGE_SIZE = N), the way the list view
+does. Rendering is timed apart from the database query, which is reported
+on its own line. Cache states compared:
+
+    no cache      FRAGMENT_CACHE_SIZE = 0, every card rendered by Jinja
+    cold          cache emptied before each render (render and store)
+    warm (file)   memory tier emptied, cards read from FRAGMENT_CACHE_PATH
+    warm          every card in the in-process LRU
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from flask import g, render_template
+
+from app import create_app
+from app.db import dispose_pool, get_db, init_db
+from app.entries import fetch_page
+from app.fragments import render_cards
+
+REFLECTION = (
+    'It sounds like you are carrying a lot right now. Try naming the one thing '
+    'you can act on tomorrow, and let the rest wait.'
+)
+
+
+def make_app(directory, entries, cache_size, cache_path=None):
+    return create_app({
+        'TESTING': True, 'ANALYSIS_WORKERS': 0, 'SERVER_NAME': 'localhost',
+        'DATABASE': os.path.join(directory, 'bench.db'),
+        'ENTRIES_PAGE_SIZE': entries,
+        'FRAGMENT_CACHE_SIZE': cache_size,
+        'FRAGMENT_CACHE_PATH': cache_path,
+    })
+
+
+def seed(app, count):
+    with app.app_context():
+        init_db()
+        db = get_db()
+        db.execute("INSERT INTO users (username, password_hash) VALUES ('bench', 'x')")
+        db.executemany(
+            "INSERT INTO entries (user_id, text, mood, reflection, analysis_status, timestamp)"
+            " VALUES (1, ?, 'calm', ?, 'ok', datetime('2020-01-01', ? || ' hours'))",
+            ((f'Entry {i}. Went for a walk after work and felt calmer by the evening. '
+              'Dinner was quiet and I read for an hour before bed.', REFLECTION, i)
+             for i in range(count))
+        )
+        db.commit()
+
+
+def median_ms(fn, repeat, before=None):
+    timings = []
+    for _ in range(repeat):
+        if before is not None:
+            before()
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return timings[len(timings) // 2]
+
+
+def measure(app, repeat, before=None):
+    with app.test_request_context('/entries/list'):
+        g.user = get_db().execute('SELECT * FROM users WHERE id = 1').fetchone()
+        entries, next_cursor = fetch_page(1)
+
+        def render():
+            cards = render_cards(1, entries)
+            return render_template(
+                'entries/list.html', entries=entries, next_cursor=next_cursor, cards=cards
+            )
+
+        render()
+        query_ms = median_ms(lambda: fetch_page(1), repeat)
+        return query_ms, median_ms(render, repeat, before)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--entries', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    try:
+        cache_path = os.path.join(directory, 'fragments.db')
+        seed(make_app(directory, args.entries, 0), args.entries)
+
+        uncached = make_app(directory, args.entries, 0)
+        memory = make_app(directory, args.entries, 4096)
+        shared = make_app(directory, args.entries, 4096, cache_path)
+        memory_cache = memory.extensions['fragment_cache']
+        shared_cache = shared.extensions['fragment_cache']
+
+        query_ms, none_ms = measure(uncached, args.repeat)
+        rows = [
+            ('no cache', none_ms),
+            ('cold', measure(memory, args.repeat, memory_cache.clear)[1]),
+            ('warm (file)', measure(shared, args.repeat, shared_cache._entries.clear)[1]),
+            ('warm', measure(memory, args.repeat)[1]),
+        ]
+
+        print(f'{args.entries} entries per page; query {query_ms:.1f} ms (not included below)')
+        print(f"{'cache':12} {'render ms':>10} {'speedup':>8}")
+        for name, ms in rows:
+            print(f'{name:12} {ms:10.2f} {none_ms / ms:7.1f}x')
+    finally:
+        dispose_pool()
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
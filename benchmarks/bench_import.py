@@ -0,0 +1,118 @@
+"""Bulk import throughput vs. inserting entries one at a time.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_import [--entries N] [--format jsonl|csv] [--chunk-size C]
+
+Writes N generated entries to a temporary JSONL or CSV file, imports them
+with import_entries() and reports rows/sec, next to the one-insert-and-
+commit-per-entry path that /entries/add takes.
+"""
+import argparse
+import csv
+import json
+import os
+import random
+import tempfile
+import time
+
+from app import analysis, create_app
+from app.db import dispose_pool, get_db, init_db
+from app.importer import import_entries
+
+WORDS = (
+    'work family friends coffee sleep tired happy anxious walk park rain '
+    'sunny meeting deadline project dinner cooking reading book movie music '
+    'gym run exercise stress calm grateful lonely excited worried hopeful'
+).split()
+
+
+def make_records(count):
+    rng = random.Random(42)
+    start = time.mktime((2015, 1, 1, 0, 0, 0, 0, 0, -1))
+    for i in range(count):
+        moment = time.gmtime(start + i * 3600)
+        yield {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', moment),
+            'text': ' '.join(rng.choices(WORDS, k=rng.randint(20, 60))),
+        }
+
+
+def write_file(path, fmt, count):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        if fmt == 'jsonl':
+            for record in make_records(count):
+                f.write(json.dumps(record) + '\n')
+        else:
+            writer = csv.DictWriter(f, fieldnames=('timestamp', 'text'))
+            writer.writeheader()
+            writer.writerows(make_records(count))
+
+
+def reset(app):
+    with app.app_context():
+        init_db()
+        db = get_db()
+        db.execute("INSERT INTO users (username, password_hash) VALUES ('bench', 'x')")
+        db.commit()
+
+
+def one_at_a_time(app, count):
+    with app.app_context():
+        db = get_db()
+        for record in make_records(count):
+            cursor = db.execute(
+                'INSERT INTO entries (user_id, text) VALUES (?, ?)',
+                (1, record['text'])
+            )
+            analysis.enqueue(db, cursor.lastrowid)
+            db.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--entries', type=int, default=100_000)
+    parser.add_argument('--format', choices=('jsonl', 'csv'), default='jsonl')
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    parser.add_argument('--baseline-entries', type=int, default=10_000,
+                        help='Entries for the one-at-a-time comparison.')
+    args = parser.parse_args()
+
+    db_fd, db_path = tempfile.mkstemp()
+    file_fd, file_path = tempfile.mkstemp(suffix='.' + args.format)
+    os.close(file_fd)
+    try:
+        app = create_app({
+            'TESTING': True, 'DATABASE': db_path, 'ANALYSIS_WORKERS': 0,
+        })
+        write_file(file_path, args.format, args.entries)
+        size_mb = os.path.getsize(file_path) / 1024 / 1024
+
+        reset(app)
+        with app.app_context():
+            start = time.perf_counter()
+            with open(file_path, 'rb') as f:
+                result = import_entries(1, f, args.format, chunk_size=args.chunk_size)
+            elapsed = time.perf_counter() - start
+        print(
+            f"bulk import    {result['imported']:8} rows ({size_mb:.1f} MB)"
+            f' in {elapsed:6.2f}s  {result["imported"] / elapsed:10.0f} rows/sec'
+        )
+
+        reset(app)
+        start = time.perf_counter()
+        one_at_a_time(app, args.baseline_entries)
+        elapsed = time.perf_counter() - start
+        print(
+            f'one at a time  {args.baseline_entries:8} rows'
+            f'            in {elapsed:6.2f}s  {args.baseline_entries / elapsed:10.0f} rows/sec'
+        )
+    finally:
+        dispose_pool(db_path)
+        os.close(db_fd)
+        os.unlink(db_path)
+        os.unlink(file_path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""Per-call overhead of building a chat model per call vs. the shared registry.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_llm_client [--calls N] [--setup-ms MS]
+
+The stub transport charges ``--setup-ms`` when a client is constructed, the
+way ChatGoogleGenerativeAI pays for channel and TLS setup, and answers every
+request instantly so only client overhead is measured.
+"""
+import argparse
+import os
+import time
+
+from app import create_app, gemini
+
+
+def make_stub(setup_seconds):
+    class StubChatModel:
+        def __init__(self, model, api_key, temperature, **options):
+            time.sleep(setup_seconds)
+
+        def invoke(self, prompt):
+            class Response:
+                content = 'MOOD: calm\nREFLECTION: Keep going.'
+            return Response()
+
+    return StubChatModel
+
+
+def per_call_ms(fn, calls):
+    start = time.perf_counter()
+    for _ in range(calls):
+        fn()
+    return (time.perf_counter() - start) * 1000 / calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--calls', type=int, default=200)
+    parser.add_argument('--setup-ms', type=float, default=20.0)
+    args = parser.parse_args()
+
+    os.environ.setdefault('GEMINI_API_KEY', 'bench-key')
+    gemini.ChatGoogleGenerativeAI = make_stub(args.setup_ms / 1000)
+    # No result cache, or every call after the first would skip the client
+    app = create_app({
+        'TESTING': True, 'DATABASE': ':memory:',
+        'ANALYSIS_CACHE_SIZE': 0, 'ANALYSIS_CACHE_PERSIST': False,
+    })
+
+    def construct_per_call():
+        llm = gemini.ChatGoogleGenerativeAI(
+            model='gemini-2.5-flash', api_key='bench-key', temperature=0.3
+        )
+        llm.invoke(gemini._build_prompt('Today was fine.'))
+
+    with app.app_context():
+        before = per_call_ms(construct_per_call, args.calls)
+        gemini.close_clients()
+        after = per_call_ms(lambda: gemini.call_gemini_api('Today was fine.'), args.calls)
+
+    print(f'client per call:  {before:8.3f} ms/call')
+    print(f'shared registry:  {after:8.3f} ms/call')
+    print(f'speedup:          {before / after:8.1f}x')
+
+
+if __name__ == '__main__':
+    main()
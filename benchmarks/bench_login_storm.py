@@ -0,0 +1,137 @@
+"""Latency of list/add requests while a login storm hits the same server.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_login_storm [--attackers N] [--requests R]
+
+Starts the app on a local threaded WSGI server and measures p50/p99 latency
+of /entries/list and /entries/add for a logged-in user, first on a quiet
+server and then while N threads hammer /auth/login with wrong passwords.
+Each configuration is run twice: hashing inline on the request threads
+with no rate limit (the old behaviour), and hashing in the worker pool
+behind the login rate limiter.
+"""
+import argparse
+import http.cookiejar
+import logging
+import os
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+from werkzeug.serving import make_server
+
+from app import create_app
+from app.db import dispose_pool, get_db, init_db
+
+MODES = {
+    'inline, unlimited': {'PASSWORD_HASH_WORKERS': 0, 'LOGIN_RATE_LIMIT': 0},
+    'pool, rate limited': {'PASSWORD_HASH_WORKERS': 2, 'LOGIN_RATE_LIMIT': 10},
+}
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def post(opener, url, **form):
+    data = urllib.parse.urlencode(form).encode()
+    try:
+        return opener.open(url, data).status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+def measure(opener, base, count):
+    timings = {'list': [], 'add': []}
+    for i in range(count):
+        start = time.perf_counter()
+        opener.open(base + '/entries/list').read()
+        timings['list'].append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        post(opener, base + '/entries/add', text=f'Benchmark entry {i}')
+        timings['add'].append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def run_mode(name, overrides, args):
+    db_fd, db_path = tempfile.mkstemp()
+    app = create_app({
+        'TESTING': True, 'DATABASE': db_path, 'ANALYSIS_WORKERS': 0,
+        **overrides,
+    })
+    with app.app_context():
+        init_db()
+        hasher = app.extensions['password_hasher']
+        get_db().executemany(
+            'INSERT INTO users (username, password_hash) VALUES (?, ?)',
+            [('reader', hasher.hash('reader-pass')), ('victim', hasher.hash('x'))]
+        )
+        get_db().commit()
+
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f'http://127.0.0.1:{server.server_port}'
+
+    try:
+        opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar())
+        )
+        post(opener, base + '/auth/login', username='reader', password='reader-pass')
+
+        quiet = measure(opener, base, args.requests)
+
+        stop = threading.Event()
+        refused = []
+
+        def attack():
+            attacker = urllib.request.build_opener()
+            while not stop.is_set():
+                status = post(attacker, base + '/auth/login',
+                              username='victim', password='guess')
+                if status in (429, 503):
+                    refused.append(status)
+
+        attackers = [threading.Thread(target=attack) for _ in range(args.attackers)]
+        for thread in attackers:
+            thread.start()
+        time.sleep(0.5)
+        try:
+            storm = measure(opener, base, args.requests)
+        finally:
+            stop.set()
+            for thread in attackers:
+                thread.join()
+
+        print(f'{name}:')
+        for label, timings in (('quiet', quiet), ('storm', storm)):
+            for endpoint, values in timings.items():
+                print(f'  {label:5} {endpoint:4}  p50 {percentile(values, 0.5):8.2f} ms'
+                      f'  p99 {percentile(values, 0.99):8.2f} ms')
+        print(f'  login attempts refused cheaply: {len(refused)}')
+    finally:
+        server.shutdown()
+        app.extensions['password_hasher'].shutdown()
+        dispose_pool(db_path)
+        os.close(db_fd)
+        os.unlink(db_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--attackers', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=50)
+    args = parser.parse_args()
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    for name, overrides in MODES.items():
+        run_mode(name, overrides, args)
+
+
+if __name__ == '__main__':
+    main()
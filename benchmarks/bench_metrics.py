@@ -0,0 +1,84 @@
+"""Cost of request instrumentation on the entries list.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_metrics [--entries N] [--requests R]
+
+Times /entries/list with metrics disabled (the default), with metrics
+enabled, and with metrics plus Server-Timing headers, and reports the
+median per-request latency of each.
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from app import create_app
+from app.db import dispose_pool, get_db, init_db
+from werkzeug.security import generate_password_hash
+
+
+def make_app(db_path, **config):
+    return create_app({
+        'TESTING': True, 'DATABASE': db_path, 'SECRET_KEY': 'bench',
+        'ANALYSIS_WORKERS': 0, 'PASSWORD_HASH_WORKERS': 0,
+        'LOGIN_RATE_LIMIT': 0, **config,
+    })
+
+
+def seed(app, count):
+    with app.app_context():
+        init_db()
+        db = get_db()
+        db.execute(
+            "INSERT INTO users (username, password_hash) VALUES ('bench', ?)",
+            (generate_password_hash('bench', 'scrypt:32768:8:1'),)
+        )
+        db.executemany(
+            "INSERT INTO entries (user_id, text, mood, reflection)"
+            " VALUES (1, ?, 'calm', 'Keep going.')",
+            ((f'Journal entry number {i}. ' * 8,) for i in range(count))
+        )
+        db.commit()
+
+
+def median_ms(app, requests):
+    client = app.test_client()
+    client.post('/auth/login', data={'username': 'bench', 'password': 'bench'})
+    client.get('/entries/list')
+    timings = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        client.get('/entries/list')
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return timings[len(timings) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--entries', type=int, default=1000)
+    parser.add_argument('--requests', type=int, default=500)
+    args = parser.parse_args()
+
+    db_fd, db_path = tempfile.mkstemp()
+    try:
+        seed(make_app(db_path), args.entries)
+        variants = [
+            ('disabled', {}),
+            ('metrics', {'METRICS_ENABLED': True}),
+            ('metrics + timing', {'METRICS_ENABLED': True, 'SERVER_TIMING': True}),
+        ]
+        baseline = None
+        for name, config in variants:
+            ms = median_ms(make_app(db_path, **config), args.requests)
+            baseline = baseline or ms
+            print(f'{name:18} {ms:7.3f} ms/request  ({(ms / baseline - 1) * 100:+5.1f}%)')
+    finally:
+        dispose_pool(db_path)
+        os.close(db_fd)
+        os.unlink(db_path)
+
+
+if __name__ == '__main__':
+    main()
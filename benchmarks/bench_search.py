@@ -0,0 +1,102 @@
+"""Full-text search latency vs. a LIKE scan over a large journal corpus.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_search [--entries N] [--users U] [--repeat R]
+
+Seeds N generated entries spread over U users (all of them for a single
+user by default, the worst case for a LIKE scan) and times the FTS5 query
+used by /entries/search against the equivalent LIKE '%term%' query.
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from app import create_app
+from app.db import dispose_pool, get_db, init_db
+from app.search import search_entries
+
+WORDS = (
+    'work family friends coffee sleep tired happy anxious walk park rain '
+    'sunny meeting deadline project dinner cooking reading book movie music '
+    'gym run exercise stress calm grateful lonely excited worried hopeful '
+    'weekend holiday travel train office email call mother father sister '
+    'brother garden dog cat morning evening night headache doctor'
+).split()
+RARE = ['volcano', 'saxophone', 'origami', 'lighthouse']
+
+
+def make_text(rng):
+    words = rng.choices(WORDS, k=rng.randint(20, 60))
+    if rng.random() < 0.001:
+        words.insert(rng.randrange(len(words)), rng.choice(RARE))
+    return ' '.join(words).capitalize() + '.'
+
+
+def seed(app, count, users):
+    rng = random.Random(42)
+    with app.app_context():
+        init_db()
+        db = get_db()
+        db.executemany(
+            'INSERT INTO users (username, password_hash) VALUES (?, ?)',
+            ((f'user{i}', 'x') for i in range(users))
+        )
+        db.executemany(
+            'INSERT INTO entries (user_id, text) VALUES (?, ?)',
+            ((i % users + 1, make_text(rng)) for i in range(count))
+        )
+        db.commit()
+
+
+def median_ms(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return timings[len(timings) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--entries', type=int, default=1_000_000)
+    parser.add_argument('--users', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    db_fd, db_path = tempfile.mkstemp()
+    try:
+        app = create_app({
+            'TESTING': True, 'DATABASE': db_path, 'ANALYSIS_WORKERS': 0,
+        })
+        start = time.perf_counter()
+        seed(app, args.entries, args.users)
+        print(f'seeded {args.entries} entries in {time.perf_counter() - start:.1f}s')
+
+        with app.app_context():
+            db = get_db()
+
+            def like(term):
+                return db.execute(
+                    'SELECT id, text FROM entries WHERE user_id = 1 AND text LIKE ?'
+                    ' ORDER BY timestamp DESC LIMIT 20',
+                    (f'%{term}%',)
+                ).fetchall()
+
+            for term in ('volcano', 'coffee', 'lighthouse garden'):
+                fts_ms = median_ms(lambda: search_entries(1, term), args.repeat)
+                like_term = term.split()[0]
+                like_ms = median_ms(lambda: like(like_term), args.repeat)
+                print(f'{term!r:22} fts5 {fts_ms:9.2f} ms   like {like_ms:9.2f} ms')
+    finally:
+        dispose_pool(db_path)
+        os.close(db_fd)
+        os.unlink(db_path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""Write throughput with several writer processes, by shard count.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_shards [--shards 0,2,4,8] [--writers W] [--entries N]
+
+For each shard count, W processes each save N entries for their own users
+the way the add view does (insert, queue for analysis, commit) and the
+combined entries per second is reported. 0 is the unsharded single file.
+SQLite allows one writer per file at a time, so with one file the writers
+queue behind each other's commits; with shards they mostly do not.
+Use --synchronous FULL to see the effect with durable commits.
+"""
+import argparse
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+
+from app import analysis, create_app
+from app.db import dispose_pool, get_db, init_db
+
+USERS_PER_WRITER = 4
+
+
+def make_app(directory, shards, synchronous):
+    return create_app({
+        'TESTING': True,
+        'DATABASE': os.path.join(directory, 'main.db'),
+        'DATABASE_SHARDS': shards,
+        'SQLITE_SYNCHRONOUS': synchronous,
+        'ANALYSIS_WORKERS': 0,
+        'ANALYZER': 'gemini',
+    })
+
+
+def writer(directory, shards, synchronous, first_user, entries, start_at, results):
+    app = make_app(directory, shards, synchronous)
+    users = range(first_user, first_user + USERS_PER_WRITER)
+    with app.app_context():
+        # Every writer starts together once all processes are up
+        time.sleep(max(0.0, start_at - time.time()))
+        start = time.perf_counter()
+        for i in range(entries):
+            user_id = users[i % len(users)]
+            db = get_db(user_id)
+            cursor = db.execute(
+                'INSERT INTO entries (user_id, text) VALUES (?, ?)',
+                (user_id, f'Entry {i} of user {user_id}, a quiet and calm day.')
+            )
+            analysis.enqueue(db, cursor.lastrowid)
+            db.commit()
+        results.put(time.perf_counter() - start)
+    dispose_pool()
+
+
+def run(shards, writers, entries, synchronous):
+    directory = tempfile.mkdtemp()
+    try:
+        app = make_app(directory, shards, synchronous)
+        with app.app_context():
+            init_db()
+            db = get_db()
+            db.executemany(
+                'INSERT INTO users (username, password_hash) VALUES (?, ?)',
+                ((f'user{i}', 'x') for i in range(writers * USERS_PER_WRITER))
+            )
+            db.commit()
+        dispose_pool()
+
+        results = multiprocessing.Queue()
+        start_at = time.time() + 1.0
+        processes = [
+            multiprocessing.Process(target=writer, args=(
+                directory, shards, synchronous, w * USERS_PER_WRITER + 1,
+                entries, start_at, results,
+            ))
+            for w in range(writers)
+        ]
+        for process in processes:
+            process.start()
+        elapsed = max(results.get() for _ in processes)
+        for process in processes:
+            process.join()
+        return writers * entries / elapsed
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--shards', default='0,2,4,8',
+                        help='Comma-separated shard counts to compare.')
+    parser.add_argument('--writers', type=int, default=8)
+    parser.add_argument('--entries', type=int, default=500,
+                        help='Entries saved by each writer.')
+    parser.add_argument('--synchronous', default='NORMAL',
+                        help='SQLITE_SYNCHRONOUS for every file.')
+    args = parser.parse_args()
+
+    print(f'{args.writers} writers x {args.entries} entries, synchronous={args.synchronous}')
+    print(f"{'shards':>6}  {'entries/s':>10}  {'speedup':>7}")
+    baseline = None
+    for shards in [int(n) for n in args.shards.split(',')]:
+        rate = run(shards, args.writers, args.entries, args.synchronous)
+        baseline = baseline or rate
+        print(f'{shards:>6}  {rate:>10.0f}  {rate / baseline:>6.2f}x')
+
+
+if __name__ == '__main__':
+    main()
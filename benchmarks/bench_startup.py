@@ -0,0 +1,68 @@
+"""Cold-start time of create_app() and a CLI command, with and without the SDK import.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_startup [--runs N]
+
+Every sample is a fresh interpreter. "eager" imports langchain_google_genai
+first, as app/gemini.py used to at import time; "lazy" is the app as it
+is, where the SDK waits for the first analysis.
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+CREATE_APP = (
+    "from app import create_app\n"
+    "create_app({'TESTING': True, 'DATABASE': ':memory:'})\n"
+)
+CLI = (
+    "import runpy, sys\n"
+    "sys.argv = ['flask', '--app', 'app', 'routes']\n"
+    "runpy.run_module('flask', run_name='__main__')\n"
+)
+EAGER = (
+    "try:\n"
+    "    import langchain_google_genai\n"
+    "except ImportError:\n"
+    "    pass\n"
+)
+
+
+def sdk_installed():
+    return subprocess.run(
+        [sys.executable, '-c', 'import langchain_google_genai'],
+        capture_output=True,
+    ).returncode == 0
+
+
+def median_ms(code, runs):
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', code], check=True, capture_output=True)
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10)
+    args = parser.parse_args()
+
+    if not sdk_installed():
+        print('langchain-google-genai is not installed; eager and lazy will match')
+
+    baseline = median_ms('pass', args.runs)
+    print(f'bare interpreter: {baseline:8.1f} ms')
+    for name, code in (('create_app()', CREATE_APP), ('flask routes', CLI)):
+        eager = median_ms(EAGER + code, args.runs)
+        lazy = median_ms(code, args.runs)
+        print(f'{name:16}  eager {eager:8.1f} ms  lazy {lazy:8.1f} ms'
+              f'  saved {eager - lazy:8.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
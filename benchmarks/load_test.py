@@ -0,0 +1,266 @@
+"""Throughput and latency of the main user flows under concurrent clients.
+
+Run from the repository root:
+
+    python -m benchmarks.load_test [--users U] [--entries-per-user E]
+        [--clients C] [--requests R] [--llm-latency S] [--llm-errors P]
+        [--config KEY=VALUE ...] [--output report.json] [--compare old.json]
+
+Seeds U users with E entries each, starts the app on a local threaded
+server with a fake Gemini backend (configurable latency and error rate),
+then runs register, login, add, list and delete phases. In each phase C
+clients send R requests apiece at the same time. Throughput and
+p50/p90/p99 latency for every phase are printed and written as JSON. Pass
+an earlier report with --compare to see the change from one commit to the
+next.
+"""
+import argparse
+import ast
+import json
+import logging
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import tempfile
+import threading
+import time
+
+from werkzeug.security import generate_password_hash
+
+from app import create_app, gemini
+from app.db import dispose_pool, get_db, init_db
+from benchmarks.support import fake_chat_model, get, new_opener, post, serve, summarize
+
+PASSWORD = 'load-test-pass'
+PHASES = ('register', 'login', 'add', 'list', 'delete')
+WORDS = (
+    'work family friends coffee sleep tired happy anxious walk park rain '
+    'sunny meeting deadline project dinner cooking reading book movie music '
+    'gym run exercise stress calm grateful lonely excited worried hopeful'
+).split()
+
+
+def parse_config(pairs):
+    """Turn KEY=VALUE options into app config, reading values as Python literals."""
+    config = {}
+    for pair in pairs:
+        key, _, value = pair.partition('=')
+        try:
+            config[key] = ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            config[key] = value
+    return config
+
+
+def seed(app, users, entries_per_user):
+    """Create users load0..loadN-1, each with a year of entries."""
+    rng = random.Random(7)
+    # One hash serves every seeded user; seeding should not take minutes
+    password_hash = generate_password_hash(PASSWORD, app.config['PASSWORD_HASH_METHOD'])
+    with app.app_context():
+        init_db()
+        db = get_db()
+        db.executemany(
+            'INSERT INTO users (username, password_hash) VALUES (?, ?)',
+            ((f'load{i}', password_hash) for i in range(users))
+        )
+        db.executemany(
+            'INSERT INTO entries (user_id, text, mood, reflection, mood_category,'
+            " analysis_status, timestamp) VALUES (?, ?, 'calm', 'Keep going.',"
+            " 'calm', 'ok', datetime('now', ? || ' minutes'))",
+            (
+                (user, ' '.join(rng.choices(WORDS, k=rng.randint(30, 120))),
+                 -rng.randint(0, 365 * 24 * 60))
+                for user in range(1, users + 1)
+                for _ in range(entries_per_user)
+            )
+        )
+        db.commit()
+
+
+def run_phase(clients, requests, action):
+    """Run ``action(client, i)`` ``requests`` times from each client concurrently.
+
+    ``action`` returns an HTTP status; anything 400 or above counts as an error.
+    """
+    latencies = [[] for _ in clients]
+    errors = [0] * len(clients)
+    barrier = threading.Barrier(len(clients) + 1)
+
+    def work(n, client):
+        barrier.wait()
+        for i in range(requests):
+            start = time.perf_counter()
+            status = action(client, i)
+            latencies[n].append((time.perf_counter() - start) * 1000)
+            if status >= 400:
+                errors[n] += 1
+
+    threads = [
+        threading.Thread(target=work, args=(n, client))
+        for n, client in enumerate(clients)
+    ]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    return summarize([ms for values in latencies for ms in values], elapsed, sum(errors))
+
+
+def run(args, db_path):
+    config = {
+        'TESTING': True, 'DATABASE': db_path, 'SECRET_KEY': 'load-test',
+        # Every client comes from 127.0.0.1, which the limiter would refuse
+        'LOGIN_RATE_LIMIT': 0,
+        **parse_config(args.config),
+    }
+    app = create_app(config)
+
+    start = time.perf_counter()
+    seed(app, max(args.users, args.clients), args.entries_per_user)
+    seed_seconds = time.perf_counter() - start
+
+    fake = fake_chat_model(args.llm_latency, args.llm_jitter, args.llm_errors, seed=1)
+    gemini.ChatGoogleGenerativeAI = fake
+    os.environ['GEMINI_API_KEY'] = 'load-test-key'
+    gemini.close_clients()
+
+    results = {}
+    with serve(app) as base:
+        clients = [new_opener() for _ in range(args.clients)]
+
+        results['register'] = run_phase(clients, args.requests, lambda client, i: post(
+            client, base + '/auth/register',
+            username=f'new-{id(client)}-{i}', password=PASSWORD,
+        ))
+
+        users = {id(client): f'load{n}' for n, client in enumerate(clients)}
+        results['login'] = run_phase(clients, args.requests, lambda client, i: post(
+            client, base + '/auth/login', username=users[id(client)], password=PASSWORD,
+        ))
+
+        results['add'] = run_phase(clients, args.requests, lambda client, i: post(
+            client, base + '/entries/add',
+            text=f'Load test entry {i}: ' + ' '.join(WORDS[i % 10:i % 10 + 20]),
+        ))
+
+        results['list'] = run_phase(
+            clients, args.requests, lambda client, i: get(client, base + '/entries/list')
+        )
+
+        # Each client deletes the entries it just added
+        with app.app_context():
+            added = {
+                id(client): [
+                    row['id'] for row in get_db().execute(
+                        'SELECT id FROM entries WHERE user_id = ?'
+                        ' ORDER BY id DESC LIMIT ?',
+                        (n + 1, args.requests)
+                    )
+                ]
+                for n, client in enumerate(clients)
+            }
+        results['delete'] = run_phase(clients, args.requests, lambda client, i: post(
+            client, base + f'/entries/{added[id(client)][i]}/delete',
+        ))
+
+    with app.app_context():
+        queued = get_db().execute('SELECT COUNT(*) FROM analysis_jobs').fetchone()[0]
+    app.extensions['analysis'].stop(timeout=5)
+    app.extensions['password_hasher'].shutdown()
+
+    return {
+        'seed_seconds': round(seed_seconds, 2),
+        'phases': results,
+        'llm': {'calls': fake.calls, 'errors': fake.errors, 'jobs_left': queued},
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(report, baseline=None):
+    print(f"commit {report['commit']}  seeded in {report['seed_seconds']}s")
+    for phase in PHASES:
+        stats = report['phases'][phase]
+        line = (
+            f"{phase:9} {stats['throughput_rps']:8.1f} req/s"
+            f"  p50 {stats['p50_ms']:8.2f} ms  p99 {stats['p99_ms']:8.2f} ms"
+            f"  errors {stats['errors']}"
+        )
+        old = (baseline or {}).get('phases', {}).get(phase)
+        if old:
+            line += (
+                f"  | vs {baseline['commit']}: "
+                f"{(stats['throughput_rps'] / old['throughput_rps'] - 1) * 100:+6.1f}% req/s,"
+                f" p99 {(stats['p99_ms'] / old['p99_ms'] - 1) * 100:+6.1f}%"
+            )
+        print(line)
+    llm = report['llm']
+    print(f"fake llm: {llm['calls']} calls, {llm['errors']} failed, {llm['jobs_left']} jobs left")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--entries-per-user', type=int, default=500)
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=25,
+                        help='Requests per client in each phase.')
+    parser.add_argument('--llm-latency', type=float, default=0.8,
+                        help='Mean fake Gemini latency in seconds.')
+    parser.add_argument('--llm-jitter', type=float, default=0.3)
+    parser.add_argument('--llm-errors', type=float, default=0.02,
+                        help='Share of fake Gemini calls that fail.')
+    parser.add_argument('--config', action='append', default=[],
+                        metavar='KEY=VALUE', help='App config override.')
+    parser.add_argument('--output', help='Write the JSON report here.')
+    parser.add_argument('--compare', help='Earlier JSON report to compare with.')
+    args = parser.parse_args()
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    logging.getLogger('app').setLevel(logging.CRITICAL)
+
+    db_fd, db_path = tempfile.mkstemp()
+    try:
+        outcome = run(args, db_path)
+    finally:
+        dispose_pool(db_path)
+        os.close(db_fd)
+        os.unlink(db_path)
+
+    report = {
+        'commit': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'args': vars(args),
+        **outcome,
+    }
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
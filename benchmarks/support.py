@@ -0,0 +1,121 @@
+"""Helpers shared by the benchmarks: HTTP clients, a local server and a fake LLM."""
+import contextlib
+import http.cookiejar
+import random
+import re
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+from werkzeug.serving import make_server
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def summarize(latencies_ms, elapsed, errors=0):
+    """Throughput and latency percentiles for one batch of timed requests."""
+    count = len(latencies_ms)
+    if not count:
+        return {'requests': 0, 'errors': errors}
+    return {
+        'requests': count,
+        'errors': errors,
+        'throughput_rps': round(count / elapsed, 2),
+        'p50_ms': round(percentile(latencies_ms, 0.50), 3),
+        'p90_ms': round(percentile(latencies_ms, 0.90), 3),
+        'p99_ms': round(percentile(latencies_ms, 0.99), 3),
+        'max_ms': round(max(latencies_ms), 3),
+    }
+
+
+def post(opener, url, **form):
+    data = urllib.parse.urlencode(form).encode()
+    try:
+        with opener.open(url, data) as response:
+            response.read()
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+def get(opener, url):
+    try:
+        with opener.open(url) as response:
+            response.read()
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+def new_opener():
+    """A urllib opener with its own cookie jar, i.e. its own session."""
+    return urllib.request.build_opener(
+        urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar())
+    )
+
+
+@contextlib.contextmanager
+def serve(app):
+    """Run ``app`` on a threaded local WSGI server and yield its base URL."""
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f'http://127.0.0.1:{server.server_port}'
+    finally:
+        server.shutdown()
+        thread.join()
+
+
+_BATCH_COUNT = re.compile(r'Analyze each of these (\d+) journal entries')
+
+
+def fake_chat_model(latency=0.5, jitter=0.2, error_rate=0.0, seed=None):
+    """A stand-in for ChatGoogleGenerativeAI with configurable latency and errors.
+
+    Each call sleeps ``latency`` seconds give or take ``jitter`` (as a
+    fraction), fails with probability ``error_rate``, and otherwise answers
+    single and batch prompts in the format Gemini is asked for.
+    """
+    rng = random.Random(seed)
+    lock = threading.Lock()
+
+    class FakeChatModel:
+        calls = 0
+        errors = 0
+
+        def __init__(self, model, api_key, temperature, **options):
+            pass
+
+        def invoke(self, prompt):
+            with lock:
+                FakeChatModel.calls += 1
+                delay = latency * (1 + rng.uniform(-jitter, jitter))
+                fail = rng.random() < error_rate
+            time.sleep(max(0.0, delay))
+            if fail:
+                with lock:
+                    FakeChatModel.errors += 1
+                raise ConnectionError('injected failure')
+
+            match = _BATCH_COUNT.search(prompt)
+            if match is None:
+                content = 'MOOD: calm and steady\nREFLECTION: Keep writing.'
+            else:
+                content = '\n'.join(
+                    f'[{i}] MOOD: calm and steady\n[{i}] REFLECTION: Keep writing.'
+                    for i in range(1, int(match.group(1)) + 1)
+                )
+
+            class Response:
+                pass
+            response = Response()
+            response.content = content
+            return response
+
+    return FakeChatModel
@@ -1,31 +1,46 @@
-import os
-import tempfile
 import pytest
 from app import create_app
-from app.db import get_db, init_db
+from app.db import dispose_pool, get_db, init_db, shard_path
 
 @pytest.fixture
-def app():
+def app_factory(tmp_path):
+    """Create test apps whose config differs from the default in a few keys.
+
+    Each app gets its own database in ``tmp_path`` unless ``DATABASE`` is
+    given, and is stopped and disconnected after the test.
+    """
+    apps = []
+
+    def make(**config):
+        app = create_app({
+            'TESTING': True,
+            'DATABASE': str(tmp_path / f'app{len(apps)}.db'),
+            'SECRET_KEY': 'test',
+            'ANALYSIS_WORKERS': 0,
+            'PASSWORD_HASH_WORKERS': 0,
+            'LOGIN_RATE_LIMIT': 0,
+            **config,
+        })
+        apps.append(app)
+
+        # Create the database and load test data
+        with app.app_context():
+            init_db()
+        return app
+
+    yield make
+
+    # Cleanup: stop workers and close pooled connections to every file
+    for app in apps:
+        app.extensions['analysis'].stop()
+        dispose_pool(app.config['DATABASE'])
+        for index in range(app.config['DATABASE_SHARDS'] or 0):
+            dispose_pool(shard_path(app.config, index))
+
+@pytest.fixture
+def app(app_factory):
     """Create and configure a test app instance."""
-    # Create a temporary file for the test database
-    db_fd, db_path = tempfile.mkstemp()
-    
-    # Create test app with test database
-    app = create_app({
-        'TESTING': True,
-        'DATABASE': db_path,
-        'SECRET_KEY': 'test',
-    })
-    
-    # Create the database and load test data
-    with app.app_context():
-        init_db()
-    
-    yield app
-    
-    # Cleanup: close and remove the temporary database
-    os.close(db_fd)
-    os.unlink(db_path)
+    return app_factory()
 
 @pytest.fixture
 def client(app):
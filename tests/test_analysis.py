@@ -0,0 +1,147 @@
+import threading
+import time
+import pytest
+from app import analysis
+from app.db import get_db
+from app.gemini import essential_fallback
+
+class FakeAnalyzer:
+    """Stand-in for Gemini that takes a while and records what it saw."""
+    def __init__(self, delay=0.0, results=None):
+        self.delay = delay
+        self.results = list(results or [])
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def __call__(self, text):
+        time.sleep(self.delay)
+        with self.lock:
+            self.calls.append(text)
+            if self.results:
+                return self.results.pop(0)
+        return {'mood': 'calm', 'reflection': f'Reflecting on {text}'}
+
+def add_entry(app, text='Entry', user_id=1):
+    """Insert an entry and queue it, as the add view does."""
+    with app.app_context():
+        db = get_db()
+        cursor = db.execute(
+            'INSERT INTO entries (user_id, text) VALUES (?, ?)', (user_id, text)
+        )
+        analysis.enqueue(db, cursor.lastrowid)
+        db.commit()
+        return cursor.lastrowid
+
+def test_add_returns_before_analysis(client, auth, app, monkeypatch):
+    """Saving is not held up by a slow analyzer; workers finish later."""
+    fake = FakeAnalyzer(delay=0.5)
+    monkeypatch.setattr('app.gemini.call_gemini_api', fake)
+    app.config.update(ANALYSIS_WORKERS=2, ANALYSIS_POLL_INTERVAL=0.05)
+    auth.register()
+    auth.login()
+
+    try:
+        for i in range(4):
+            start = time.perf_counter()
+            response = client.post('/entries/add', data={'text': f'Entry {i}'})
+            assert response.status_code == 302
+            assert time.perf_counter() - start < fake.delay
+
+        response = client.get('/entries/list')
+        assert b'Analyzing...' in response.data
+
+        deadline = time.time() + 10
+        with app.app_context():
+            db = get_db()
+            while time.time() < deadline:
+                pending = db.execute(
+                    'SELECT COUNT(*) FROM analysis_jobs'
+                ).fetchone()[0]
+                if not pending:
+                    break
+                time.sleep(0.05)
+
+            assert pending == 0
+            moods = db.execute('SELECT mood FROM entries').fetchall()
+            assert [row['mood'] for row in moods] == ['calm'] * 4
+    finally:
+        app.extensions['analysis'].stop()
+
+def test_failed_analysis_is_retried_with_backoff(app, monkeypatch):
+    """Fallback results put the job back in the queue for later."""
+    fake = FakeAnalyzer(results=[essential_fallback])
+    monkeypatch.setattr('app.gemini.call_gemini_api', fake)
+    app.config.update(ANALYSIS_BACKOFF=60)
+    entry_id = add_entry(app)
+
+    with app.app_context():
+        assert analysis.run_pending() == 1
+        db = get_db()
+        job = db.execute('SELECT * FROM analysis_jobs').fetchone()
+        assert job['attempts'] == 1
+        assert job['locked_at'] is None
+        assert job['run_after'] > time.time() + 30
+
+        # Not due yet
+        assert analysis.run_pending() == 0
+
+        db.execute('UPDATE analysis_jobs SET run_after = 0')
+        db.commit()
+        assert analysis.run_pending() == 1
+        entry = db.execute(
+            'SELECT mood FROM entries WHERE id = ?', (entry_id,)
+        ).fetchone()
+        assert entry['mood'] == 'calm'
+        assert db.execute('SELECT COUNT(*) FROM analysis_jobs').fetchone()[0] == 0
+
+def test_fallback_stored_after_max_attempts(app, monkeypatch):
+    """A job that keeps failing eventually stores the fallback."""
+    fake = FakeAnalyzer(results=[essential_fallback] * 3)
+    monkeypatch.setattr('app.gemini.call_gemini_api', fake)
+    app.config.update(ANALYSIS_BACKOFF=0, ANALYSIS_MAX_ATTEMPTS=3)
+    add_entry(app)
+
+    with app.app_context():
+        analysis.run_pending()
+        db = get_db()
+        assert len(fake.calls) == 3
+        assert db.execute('SELECT mood FROM entries').fetchone()['mood'] == 'neutral'
+        assert db.execute('SELECT COUNT(*) FROM analysis_jobs').fetchone()[0] == 0
+
+def test_stale_lock_is_recovered(app, monkeypatch):
+    """Jobs locked by a crashed worker are picked up again after the lease."""
+    monkeypatch.setattr('app.gemini.call_gemini_api', FakeAnalyzer())
+    add_entry(app)
+
+    with app.app_context():
+        db = get_db()
+        db.execute('UPDATE analysis_jobs SET locked_at = ?', (time.time(),))
+        db.commit()
+        assert analysis.run_pending() == 0
+
+        db.execute('UPDATE analysis_jobs SET locked_at = ?', (time.time() - 3600,))
+        db.commit()
+        assert analysis.run_pending() == 1
+
+def test_delete_removes_queued_job(client, auth, app):
+    """Deleting an entry also drops its pending analysis."""
+    auth.register()
+    auth.login()
+    client.post('/entries/add', data={'text': 'Short lived'})
+
+    with app.app_context():
+        entry_id = get_db().execute('SELECT id FROM entries').fetchone()['id']
+
+    client.post(f'/entries/{entry_id}/delete')
+
+    with app.app_context():
+        assert get_db().execute('SELECT COUNT(*) FROM analysis_jobs').fetchone()[0] == 0
+
+def test_analysis_worker_drain_command(runner, app, monkeypatch):
+    """The CLI command drains the queue in the foreground."""
+    monkeypatch.setattr('app.gemini.call_gemini_api', FakeAnalyzer())
+    add_entry(app)
+    add_entry(app)
+
+    result = runner.invoke(args=['analysis-worker', '--drain'])
+    assert 'Processed 2 analysis jobs' in result.output
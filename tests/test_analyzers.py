@@ -0,0 +1,153 @@
+import pytest
+from app import analysis, analyzers, create_app, gemini, reanalysis
+from app.db import get_db
+
+@pytest.fixture
+def use_analyzer(app):
+    """Switch the app to another analyzer backend."""
+    def use(name, **config):
+        app.config.update(ANALYZER=name, **config)
+        app.extensions['analyzer'] = analyzers.BACKENDS[name](app.config)
+        return app.extensions['analyzer']
+    return use
+
+@pytest.fixture
+def fake_batch(monkeypatch):
+    """Record what reaches Gemini and answer every text the same way."""
+    calls = []
+
+    def analyze(texts):
+        calls.append(list(texts))
+        return [{'mood': 'wistful', 'reflection': f'Gemini on {text}'} for text in texts]
+
+    monkeypatch.setattr(gemini, 'call_gemini_api_batch', analyze)
+    return calls
+
+def entry_row(app, entry_id):
+    with app.app_context():
+        return get_db().execute(
+            'SELECT e.mood, e.mood_category, e.analysis_status, e.analysis_model,'
+            ' j.id IS NOT NULL AS queued'
+            ' FROM entries e LEFT JOIN analysis_jobs j ON j.entry_id = e.id'
+            ' WHERE e.id = ?', (entry_id,)
+        ).fetchone()
+
+def test_lexicon_classifies_mood_words():
+    """Mood words are counted, negations skipped and confidence reflects evidence."""
+    lexicon = analyzers.LexiconAnalyzer()
+
+    result, confidence = lexicon.classify('Stressed and worried, so anxious all day.')
+    assert result['mood'] == 'anxious'
+    assert confidence == 1.0
+
+    result, confidence = lexicon.classify('Happy at the park, but tired.')
+    assert result['mood'] == 'happy and tired'
+    assert confidence < 0.6
+
+    result, confidence = lexicon.classify('Not happy. Nothing happened, I made soup.')
+    assert result['mood'] == 'neutral'
+    assert confidence == 0.0
+
+def test_unknown_analyzer_rejected():
+    """A typo in ANALYZER fails at startup rather than on the first entry."""
+    with pytest.raises(ValueError, match='Unknown ANALYZER'):
+        create_app({'TESTING': True, 'ANALYZER': 'gpt'})
+
+def test_lexicon_analyzes_on_save(client, auth, app, use_analyzer, fake_batch):
+    """The offline backend stores the analysis with the entry and queues nothing."""
+    use_analyzer('lexicon')
+    auth.register()
+    auth.login()
+
+    client.post('/entries/add', data={'text': 'So grateful and relaxed today.'})
+
+    row = entry_row(app, 1)
+    assert row['mood'] == 'calm'
+    assert row['mood_category'] == 'calm'
+    assert row['analysis_status'] == 'ok'
+    assert row['analysis_model'] == analyzers.LEXICON_MODEL
+    assert not row['queued']
+    assert fake_batch == []
+
+def test_tiered_escalates_only_unclear_entries(app, use_analyzer, fake_batch):
+    """Confident lexicon results are final; the rest wait for Gemini."""
+    use_analyzer('tiered')
+    with app.app_context():
+        db = get_db()
+        ids = []
+        for text in ('Anxious, stressed and worried.', 'A long walk by the river.'):
+            cursor = db.execute('INSERT INTO entries (user_id, text) VALUES (1, ?)', (text,))
+            analysis.submit(db, cursor.lastrowid, text)
+            ids.append(cursor.lastrowid)
+        db.commit()
+
+        # Both have a mood straight away, only the unclear one is queued
+        assert entry_row(app, ids[0])['mood'] == 'anxious'
+        assert not entry_row(app, ids[0])['queued']
+        assert entry_row(app, ids[1])['mood'] == 'neutral'
+        assert entry_row(app, ids[1])['queued']
+
+        assert analysis.run_pending() == 1
+
+    assert fake_batch == [['A long walk by the river.']]
+    row = entry_row(app, ids[1])
+    assert row['mood'] == 'wistful'
+    assert row['analysis_model'] == gemini.current_model()
+
+def test_tiered_llm_reflections_sends_everything(app, use_analyzer, fake_batch):
+    """With Gemini reflections on, confident entries are still escalated."""
+    analyzer = use_analyzer('tiered', ANALYZER_LLM_REFLECTIONS=True)
+    with app.app_context():
+        results = analyzer.analyze(['Anxious, stressed and worried.', 'A walk.'])
+
+    assert fake_batch == [['Anxious, stressed and worried.', 'A walk.']]
+    assert [source for _, source in results] == [
+        (gemini.current_model(), gemini.PROMPT_VERSION)
+    ] * 2
+
+def test_tiered_keeps_lexicon_analyses_current(app, use_analyzer):
+    """Switching to tiered does not mark lexicon results outdated, nor does
+    leaving it unless other backends are to be replaced."""
+    use_analyzer('tiered')
+    with app.app_context():
+        db = get_db()
+        db.execute(
+            'INSERT INTO entries (user_id, text, mood, reflection, analysis_status,'
+            " analysis_model, analysis_prompt_version) VALUES (1, 'x', 'calm', 'Ok.',"
+            " 'ok', ?, ?)", (analyzers.LEXICON_MODEL, analyzers.LEXICON_VERSION)
+        )
+        assert reanalysis.mark_outdated(db, analyzers.current_analyzer().sources()) == 0
+
+        use_analyzer('gemini')
+        sources = analyzers.current_analyzer().sources()
+        assert reanalysis.mark_outdated(db, sources) == 0
+        assert reanalysis.mark_outdated(db, sources, other_backends=True) == 1
+
+def test_switching_backend_keeps_gemini_analyses(app, use_analyzer, fake_batch):
+    """After a switch to the lexicon, reanalyze leaves Gemini analyses alone."""
+    use_analyzer('lexicon')
+    model, version = gemini.current_model(), gemini.PROMPT_VERSION
+    with app.app_context():
+        db = get_db()
+        db.executemany(
+            'INSERT INTO entries (user_id, text, mood, reflection, analysis_status,'
+            " analysis_model, analysis_prompt_version) VALUES (1, ?, 'calm', 'Ok.', 'ok', ?, ?)",
+            [('Gemini now', model, version), ('Gemini before', model, version - 1),
+             ('Old lexicon', analyzers.LEXICON_MODEL, analyzers.LEXICON_VERSION - 1)]
+        )
+        db.commit()
+
+        result = reanalysis.reanalyze(rate=0)
+        assert result['marked'] == 1
+        rows = db.execute(
+            'SELECT analysis_status, analysis_model FROM entries ORDER BY id'
+        ).fetchall()
+        assert [tuple(row) for row in rows] == [
+            ('ok', model), ('ok', model), ('ok', analyzers.LEXICON_MODEL)
+        ]
+
+        result = reanalysis.reanalyze(rate=0, replace_other_backends=True)
+        assert result['marked'] == 2
+        models = db.execute('SELECT DISTINCT analysis_model FROM entries').fetchall()
+        assert [row[0] for row in models] == [analyzers.LEXICON_MODEL]
+    assert fake_batch == []
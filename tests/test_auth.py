@@ -1,5 +1,9 @@
+import gc
+import weakref
 import pytest
 from flask import g, session
+from app import create_app, passwords
+from app.auth import UserCache
 from app.db import get_db
 
 def test_register(client, app):
@@ -81,4 +85,162 @@ def test_logout(client, auth):
     
     with client:
         client.get('/')
-        assert 'user_id' not in session
\ No newline at end of file
+        assert 'user_id' not in session
+
+def count_queries(app, client, url):
+    """Run a request and return the SQL statements it sent to the database."""
+    statements = []
+    with app.app_context():
+        # The test client runs in this thread, so it gets the same pooled connection
+        db = get_db()
+    db.set_trace_callback(statements.append)
+    try:
+        client.get(url)
+    finally:
+        db.set_trace_callback(None)
+    return statements
+
+def test_user_lookup_without_session_identity(client, auth, app):
+    """Without identity in the session, the user is cached between requests."""
+    auth.register()
+    auth.login()
+
+    # Uncached, every request looks the user up
+    app.extensions['user_cache'].ttl = 0
+    assert len(count_queries(app, client, '/entries/add')) == 1
+    assert len(count_queries(app, client, '/entries/add')) == 1
+
+    app.extensions['user_cache'].ttl = 60
+    first = count_queries(app, client, '/entries/add')
+    assert len(first) == 1
+    assert 'password_hash' not in first[0]
+    assert count_queries(app, client, '/entries/add') == []
+
+def test_user_lookup_from_session(client, auth, app):
+    """With identity in the signed session, requests need no user query."""
+    app.config['SESSION_USER_IDENTITY'] = True
+    auth.register()
+    auth.login()
+
+    assert count_queries(app, client, '/entries/add') == []
+    with client:
+        client.get('/entries/add')
+        assert g.user == {'id': 1, 'username': 'testuser'}
+
+def test_removed_user_is_logged_out(client, auth, app):
+    """By default a cookie for a user who no longer exists logs nobody in."""
+    auth.register()
+    auth.login()
+    with app.app_context():
+        db = get_db()
+        db.execute('DELETE FROM users')
+        db.commit()
+    app.extensions['user_cache'].invalidate(1)
+
+    response = client.get('/entries/add')
+    assert response.headers['Location'] == '/auth/login'
+
+def test_logout_invalidates_cached_user(client, auth, app):
+    """Logging out drops the user from the cache."""
+    auth.register()
+    auth.login()
+    client.get('/entries/add')
+    assert app.extensions['user_cache'].get(1) is not None
+
+    auth.logout()
+    assert app.extensions['user_cache'].get(1) is None
+
+def test_user_cache_expiry_and_bound(monkeypatch):
+    """Expired users are dropped on lookup; the least recently used go first."""
+    now = [100.0]
+    monkeypatch.setattr('app.auth.time.monotonic', lambda: now[0])
+    cache = UserCache(ttl=60, max_entries=2)
+    for user_id in (1, 2):
+        cache.put({'id': user_id, 'username': f'user{user_id}'})
+    assert cache.get(1) == {'id': 1, 'username': 'user1'}
+
+    cache.put({'id': 3, 'username': 'user3'})
+    assert cache.get(2) is None
+    assert list(cache._users) == [1, 3]
+
+    now[0] += 61
+    assert cache.get(1) is None
+    assert list(cache._users) == [3]
+
+def test_login_rate_limited_before_hashing(client, auth, app, monkeypatch):
+    """Login floods are refused without hashing or querying."""
+    auth.register()
+    app.extensions['login_rate_limiter'].limit = 3
+    hasher = app.extensions['password_hasher']
+    calls = []
+    monkeypatch.setattr(hasher, 'verify', lambda *args: calls.append(args))
+
+    statuses = [auth.login('testuser', 'wrong').status_code for _ in range(5)]
+    assert statuses == [200, 200, 200, 429, 429]
+    assert len(calls) == 3
+
+def test_register_rate_limited_per_ip(client, auth, app):
+    """Registrations from one address are capped too."""
+    app.extensions['login_rate_limiter'].limit = 2
+    auth.register('a', 'pass')
+    auth.register('b', 'pass')
+    response = auth.register('c', 'pass')
+    assert response.status_code == 429
+    assert b'Too many attempts' in response.data
+
+def test_hashing_queue_full(client, auth, app, monkeypatch):
+    """When the hashing queue is full the request fails fast with 503."""
+    from app.passwords import HashingBusy
+
+    def busy(*args):
+        raise HashingBusy()
+
+    monkeypatch.setattr(app.extensions['password_hasher'], 'hash', busy)
+    response = auth.register()
+    assert response.status_code == 503
+    assert b'server is busy' in response.data
+
+def test_rehash_on_login(client, auth, app):
+    """Passwords are rehashed transparently when hash parameters change."""
+    hasher = app.extensions['password_hasher']
+    hasher.method = 'pbkdf2:sha256:1000'
+    auth.register()
+    with app.app_context():
+        old = get_db().execute('SELECT password_hash FROM users').fetchone()[0]
+    assert old.startswith('pbkdf2:sha256:1000$')
+
+    hasher.method = 'pbkdf2:sha256:2000'
+    hasher._prefix = None
+    assert auth.login().headers['Location'] == '/'
+    with app.app_context():
+        new = get_db().execute('SELECT password_hash FROM users').fetchone()[0]
+    assert new.startswith('pbkdf2:sha256:2000$')
+
+    auth.logout()
+    assert auth.login().headers['Location'] == '/'
+
+def test_hashing_in_worker_processes():
+    """The process pool produces hashes werkzeug can verify."""
+    from app.passwords import PasswordHasher
+
+    hasher = PasswordHasher('pbkdf2:sha256:1000', workers=1, queue_depth=2)
+    try:
+        pwhash = hasher.hash('secret')
+        assert hasher.verify(pwhash, 'secret')
+        assert not hasher.verify(pwhash, 'guess')
+        assert not hasher.needs_rehash(pwhash)
+    finally:
+        hasher.shutdown()
+
+def test_discarded_app_releases_its_hasher(tmp_path):
+    """Apps do not pin their password hashers for the life of the process."""
+    app = create_app({
+        'TESTING': True, 'DATABASE': str(tmp_path / 'db.sqlite'),
+        'ANALYSIS_WORKERS': 0, 'PASSWORD_HASH_WORKERS': 0,
+    })
+    hasher = weakref.ref(app.extensions['password_hasher'])
+    assert hasher() in passwords._hashers
+
+    del app
+    gc.collect()
+    assert hasher() is None
@@ -0,0 +1,148 @@
+import json
+import sqlite3
+from app import codec, compaction, retention
+from app.db import get_db
+
+TEXTS = [
+    f'Day {i}. Woke up early and went for a walk in the park before work. '
+    'The meeting ran long again, but dinner with my family was lovely and '
+    'I went to bed feeling grateful for the small things.'
+    for i in range(60)
+]
+
+def seed(app, texts=TEXTS, age_days=400):
+    """Entries for user 1, written ``age_days`` ago."""
+    with app.app_context():
+        db = get_db()
+        db.executemany(
+            "INSERT INTO entries (user_id, text, reflection, timestamp)"
+            " VALUES (1, ?, 'Keep noticing the good moments.', datetime('now', ?))",
+            [(text, f'-{age_days} days') for text in texts]
+        )
+        db.commit()
+
+def stored_types(app):
+    with app.app_context():
+        return {row[0] for row in get_db().execute('SELECT typeof(text) FROM entries')}
+
+def test_encode_round_trip():
+    """Values come back as written, with or without a dictionary."""
+    dictionary = codec.train_dictionary(TEXTS, 4096)
+    assert 0 < len(dictionary) <= 4096
+    for shared in (None, dictionary):
+        value = codec.encode(TEXTS[0], shared)
+        assert isinstance(value, bytes)
+        assert codec.decode(value) == TEXTS[0]
+    assert codec.decode('plain text') == 'plain text'
+    assert codec.decode(None) is None
+
+    # The trained dictionary pays off on short texts
+    assert len(codec.encode(TEXTS[7], dictionary)) < len(codec.encode(TEXTS[7])) / 2
+
+def test_compaction_is_transparent(app, client, auth):
+    """Compressed entries still list, export and search as before."""
+    auth.register()
+    seed(app)
+    with app.app_context():
+        db = get_db()
+        dictionary = compaction.train(db, 100, 4096)
+        db.commit()
+        result = compaction.compact(db, min_age_days=30, min_size=10_000, dictionary=dictionary)
+    assert result['rows'] == len(TEXTS)
+    assert result['after'] < result['before'] / 3
+    assert stored_types(app) == {'blob'}
+
+    auth.login()
+    page = client.get('/entries/list').data.decode()
+    assert 'Day 59. Woke up early' in page
+    assert 'Keep noticing the good moments.' in page
+
+    lines = client.get('/entries/export?format=jsonl').data.decode().splitlines()
+    assert json.loads(lines[0])['text'] == TEXTS[0]
+
+    results = client.get('/entries/search?q=grateful').data
+    assert b'<mark>grateful</mark>' in results
+
+    # Deleting a compressed entry drops it from the index too
+    client.post('/entries/1/delete')
+    with app.app_context():
+        hits = get_db().execute(
+            "SELECT COUNT(*) FROM entries_fts WHERE entries_fts MATCH '\"Day 0\"'"
+        ).fetchone()[0]
+    assert hits == 0
+
+def test_compacted_rows_not_decoded_again(app, monkeypatch):
+    """A second run skips rows already compressed with the current dictionary."""
+    seed(app)
+    with app.app_context():
+        db = get_db()
+        dictionary = compaction.train(db, 100, 4096)
+        compaction.compact(db, 30, 10_000, dictionary=dictionary)
+
+        decoded = []
+        decode = codec.decode
+        monkeypatch.setattr(codec, 'decode', lambda *args: decoded.append(args) or decode(*args))
+        assert compaction.compact(db, 30, 10_000, dictionary=dictionary)['rows'] == 0
+    assert decoded == []
+
+def test_other_tools_can_write_entries(app):
+    """Connections without codec_decode() can still insert and delete entries."""
+    seed(app, TEXTS[:2])
+    with app.app_context():
+        compaction.compact(get_db(), min_age_days=30, min_size=10_000)
+
+    db = sqlite3.connect(app.config['DATABASE'])
+    db.execute("INSERT INTO entries (user_id, text) VALUES (1, 'Written from the shell')")
+    db.execute("DELETE FROM entries WHERE text = 'Written from the shell'")
+    db.commit()
+    db.close()
+
+def test_compressed_entries_leave_the_index(app):
+    """Bulk deletes unindex compressed entries; plain ones go via the triggers."""
+    seed(app, TEXTS[:4])
+    seed(app, ['Day 99. A short plain note.'], age_days=1)
+    with app.app_context():
+        db = get_db()
+        assert compaction.compact(db, min_age_days=30, min_size=10_000)['rows'] == 4
+        assert retention.delete_entries(db, 1, ids=[1, 2, 5]) == 3
+        hits = lambda term: db.execute(
+            'SELECT COUNT(*) FROM entries_fts WHERE entries_fts MATCH ?', (term,)
+        ).fetchone()[0]
+        assert hits('"Day 0"') == hits('"Day 1"') == hits('"Day 99"') == 0
+        assert hits('"Day 2"') == hits('"Day 3"') == 1
+        db.execute("INSERT INTO entries_fts (entries_fts) VALUES ('integrity-check')")
+
+def test_only_old_or_large_entries_compressed(app):
+    """Recent short entries are left as plain text."""
+    seed(app, TEXTS[:2], age_days=1)
+    with app.app_context():
+        db = get_db()
+        db.execute("INSERT INTO entries (user_id, text) VALUES (1, ?)", ('long ' * 1000,))
+        db.commit()
+        result = compaction.compact(db, min_age_days=30, min_size=2048)
+        kinds = [row[0] for row in db.execute('SELECT typeof(text) FROM entries ORDER BY id')]
+    assert result['rows'] == 1
+    assert kinds == ['text', 'text', 'blob']
+
+def test_dictionary_loaded_from_database(app, client, auth):
+    """A process that has not seen a dictionary reads it from the database."""
+    auth.register()
+    seed(app)
+    with app.app_context():
+        db = get_db()
+        compaction.compact(db, 30, 10_000, dictionary=compaction.train(db, 100, 4096))
+    codec._dictionaries.clear()
+
+    auth.login()
+    assert b'Day 59. Woke up early' in client.get('/entries/list').data
+
+def test_compact_command(app, runner):
+    """The command trains a dictionary, compresses, and skips what is done."""
+    seed(app)
+    result = runner.invoke(args=['compact-entries'])
+    assert f'Compacted {len(TEXTS)} entries in the database' in result.output
+    with app.app_context():
+        assert get_db().execute('SELECT COUNT(*) FROM codec_dictionaries').fetchone()[0] == 1
+
+    result = runner.invoke(args=['compact-entries'])
+    assert 'Compacted 0 entries' in result.output
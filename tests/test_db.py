@@ -1,6 +1,8 @@
+import gc
 import sqlite3
+import threading
 import pytest
-from app.db import get_db
+from app.db import _is_healthy, _pooled, dispose_pool, get_db, get_schema_version, list_migrations, upgrade_db
 
 def test_get_db(app):
     """Test that get_db returns same connection within context."""
@@ -9,7 +11,8 @@ def test_get_db(app):
         assert db is get_db()
 
 def test_close_db(app):
-    """Test that database is closed after context."""
+    """Test that database is closed after context when pooling is off."""
+    app.config['DATABASE_POOL'] = False
     with app.app_context():
         db = get_db()
     
@@ -19,6 +22,103 @@ def test_close_db(app):
     
     assert 'closed' in str(e.value)
 
+def test_pooled_connection_reused(app):
+    """Pooled connections go back to the thread and come out healthy."""
+    with app.app_context():
+        db = get_db()
+        db.execute("INSERT INTO users (username, password_hash) VALUES ('a', 'b')")
+        assert db.in_transaction
+    
+    # The unfinished transaction was rolled back on release
+    assert not db.in_transaction
+    with app.app_context():
+        assert get_db() is db
+        assert db.execute('SELECT COUNT(*) FROM users').fetchone()[0] == 0
+    
+    # A broken connection is replaced
+    db.close()
+    with app.app_context():
+        assert get_db() is not db
+
+def test_connection_pragmas(app):
+    """Connections are tuned from app config."""
+    app.config['SQLITE_CACHE_SIZE'] = -1234
+    dispose_pool(app.config['DATABASE'])
+    with app.app_context():
+        db = get_db()
+        assert db.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+        assert db.execute('PRAGMA synchronous').fetchone()[0] == 1
+        assert db.execute('PRAGMA busy_timeout').fetchone()[0] == 5000
+        assert db.execute('PRAGMA cache_size').fetchone()[0] == -1234
+
+def test_pool_not_shared_across_fork(app, monkeypatch):
+    """A forked child opens its own connection instead of reusing the parent's."""
+    with app.app_context():
+        parent = get_db()
+    
+    monkeypatch.setattr('app.db.os.getpid', lambda: -1)
+    with app.app_context():
+        child = get_db()
+        assert child is not parent
+    dispose_pool(app.config['DATABASE'])
+    assert not _is_healthy(child)
+    monkeypatch.undo()
+
+def test_pool_bounded_by_live_threads(app):
+    """Connections of threads that have exited are closed and leave the pool."""
+    database = app.config['DATABASE']
+    opened = []
+
+    def work():
+        with app.app_context():
+            db = get_db()
+            db.execute('SELECT 1')
+            opened.append(db)
+
+    for _ in range(200):
+        thread = threading.Thread(target=work)
+        thread.start()
+        thread.join()
+    gc.collect()
+
+    assert len(opened) == 200
+    assert len(_pooled.get(database, [])) <= 1
+    assert not any(_is_healthy(db) for db in opened)
+
+def test_concurrent_readers_and_writers(app):
+    """Many threads reading and writing at once never see 'database is locked'."""
+    errors = []
+    threads_count = 8
+    writes = 50
+
+    def work(n):
+        try:
+            for i in range(writes):
+                with app.app_context():
+                    db = get_db()
+                    db.execute(
+                        'INSERT INTO entries (user_id, text) VALUES (?, ?)',
+                        (n, f'thread {n} entry {i}')
+                    )
+                    db.commit()
+                with app.app_context():
+                    get_db().execute(
+                        'SELECT COUNT(*) FROM entries WHERE user_id = ?', (n,)
+                    ).fetchone()
+        except Exception as e:  # pragma: no cover - reported below
+            errors.append(e)
+
+    threads = [threading.Thread(target=work, args=(n,)) for n in range(threads_count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    with app.app_context():
+        count = get_db().execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+    assert count == threads_count * writes
+
 def test_init_db_command(runner, monkeypatch):
     """Test the init-db CLI command."""
     class Recorder:
@@ -30,4 +130,100 @@ def test_init_db_command(runner, monkeypatch):
     monkeypatch.setattr('app.db.init_db', fake_init_db)
     result = runner.invoke(args=['init-db'])
     assert 'Initialized' in result.output
-    assert Recorder.called
\ No newline at end of file
+    assert Recorder.called
+
+
+BASELINE_SCHEMA = """
+CREATE TABLE users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username TEXT UNIQUE NOT NULL,
+    password_hash TEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE entries (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    mood TEXT,
+    reflection TEXT,
+    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (user_id) REFERENCES users (id)
+);
+INSERT INTO users (username, password_hash) VALUES ('old', 'hash');
+INSERT INTO entries (user_id, text, mood, reflection) VALUES (1, 'Kept', 'calm', 'Ok.');
+"""
+
+
+def test_db_upgrade_migrates_old_database(app, runner):
+    """An unversioned database is upgraded in place with its data intact."""
+    with app.app_context():
+        db = get_db()
+        db.executescript(
+            'DROP TABLE users; DROP TABLE entries; DROP TABLE analysis_jobs;'
+            ' DROP TABLE analysis_cache; PRAGMA user_version = 0;'
+            + BASELINE_SCHEMA
+        )
+
+    result = runner.invoke(args=['db-upgrade'])
+    assert 'Upgraded the database' in result.output
+
+    with app.app_context():
+        db = get_db()
+        assert get_schema_version(db) == list_migrations()[-1][0]
+        entry = db.execute('SELECT text, analysis_status FROM entries').fetchone()
+        assert entry['text'] == 'Kept'
+        assert entry['analysis_status'] == 'ok'
+        indexes = {
+            row['name'] for row in
+            db.execute("SELECT name FROM sqlite_master WHERE type = 'index'")
+        }
+        assert 'idx_entries_user_timestamp' in indexes
+        assert 'idx_analysis_jobs_due' in indexes
+
+    result = runner.invoke(args=['db-upgrade'])
+    assert 'up to date' in result.output
+
+
+def test_init_db_is_at_latest_version(app):
+    """A freshly created database needs no migrations."""
+    with app.app_context():
+        assert upgrade_db() == []
+
+
+# 'list page' is the query entries.fetch_page sends for a page past the first
+HOT_QUERIES = {
+    'list page': (
+        'SELECT e.id, codec_decode(e.text) AS text, e.mood,'
+        ' codec_decode(e.reflection) AS reflection, e.timestamp,'
+        ' e.analysis_status, e.revision, j.id IS NOT NULL AS pending'
+        ' FROM entries e LEFT JOIN analysis_jobs j ON j.entry_id = e.id'
+        ' WHERE e.user_id = ? AND (e.timestamp, e.id) < (?, ?)'
+        ' ORDER BY e.timestamp DESC, e.id DESC LIMIT 21',
+        (1, '2024-01-01 00:00:00', 10)
+    ),
+    'delete ownership check': (
+        'SELECT id, user_id FROM entries WHERE id = ?', (1,)
+    ),
+    'delete queued analysis': (
+        'DELETE FROM analysis_jobs WHERE entry_id = ?', (1,)
+    ),
+    'login lookup': (
+        'SELECT * FROM users WHERE username = ?', ('someone',)
+    ),
+    'analysis cache lookup': (
+        'SELECT mood, reflection, created_at FROM analysis_cache WHERE key = ?',
+        ('abc',)
+    ),
+}
+
+
+@pytest.mark.parametrize('name', sorted(HOT_QUERIES))
+def test_hot_queries_use_indexes(app, name):
+    """Hot queries are index lookups, never full table scans."""
+    sql, params = HOT_QUERIES[name]
+    with app.app_context():
+        plan = get_db().execute('EXPLAIN QUERY PLAN ' + sql, params).fetchall()
+
+    details = [row['detail'] for row in plan]
+    assert not [d for d in details if d.startswith('SCAN')], details
+    assert any('USING' in d for d in details), details
@@ -1,3 +1,4 @@
+import re
 import pytest
 from app.db import get_db
 
@@ -83,4 +84,67 @@ def test_list_entries_empty_state(client, auth):
     auth.login()
     
     response = client.get('/entries/list')
-    assert b'No entries yet' in response.data
\ No newline at end of file
+    assert b'No entries yet' in response.data
+
+def seed_entries(app, count, user_id=1):
+    """Insert ``count`` entries one minute apart, oldest first."""
+    with app.app_context():
+        db = get_db()
+        db.executemany(
+            "INSERT INTO entries (user_id, text, timestamp)"
+            " VALUES (?, ?, datetime('2024-01-01', ? || ' minutes'))",
+            [(user_id, f'Entry {i}', i) for i in range(count)]
+        )
+        db.commit()
+
+def test_list_entries_paginates(client, auth, app):
+    """The list shows one page and links to the next via a cursor."""
+    app.config['ENTRIES_PAGE_SIZE'] = 3
+    auth.register()
+    auth.login()
+    seed_entries(app, 7)
+
+    response = client.get('/entries/list')
+    assert b'Entry 6' in response.data
+    assert b'Entry 4' in response.data
+    assert b'Entry 3' not in response.data
+    assert b'Older entries' in response.data
+    # One shared delete modal instead of one per entry
+    assert response.data.count(b'class="modal fade"') == 1
+
+    seen = []
+    url = '/entries/list.json'
+    while url:
+        page = client.get(url).get_json()
+        seen += [int(i) for i in re.findall(r'Entry (\d+)<', page['html'])]
+        url = page['next_cursor'] and f"/entries/list.json?cursor={page['next_cursor']}"
+
+    assert seen == [6, 5, 4, 3, 2, 1, 0]
+
+def test_list_pagination_breaks_timestamp_ties(client, auth, app):
+    """Entries sharing a timestamp are neither skipped nor repeated."""
+    app.config['ENTRIES_PAGE_SIZE'] = 2
+    auth.register()
+    auth.login()
+    with app.app_context():
+        db = get_db()
+        db.executemany(
+            "INSERT INTO entries (user_id, text, timestamp) VALUES (1, ?, '2024-01-01 00:00:00')",
+            [(f'Same {i}',) for i in range(5)]
+        )
+        db.commit()
+
+    texts = []
+    url = '/entries/list.json'
+    while url:
+        page = client.get(url).get_json()
+        texts += [int(i) for i in re.findall(r'Same (\d+)<', page['html'])]
+        url = page['next_cursor'] and f"/entries/list.json?cursor={page['next_cursor']}"
+
+    assert texts == [4, 3, 2, 1, 0]
+
+def test_list_rejects_bad_cursor(client, auth):
+    """A malformed cursor is a client error."""
+    auth.register()
+    auth.login()
+    assert client.get('/entries/list?cursor=not-a-cursor').status_code == 400
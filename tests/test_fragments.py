@@ -0,0 +1,87 @@
+import sqlite3
+import pytest
+from app import analysis, fragments
+from app.db import get_db
+
+@pytest.fixture
+def app(app_factory, tmp_path):
+    """An app whose entry card cache also has a shared file tier."""
+    return app_factory(FRAGMENT_CACHE_PATH=str(tmp_path / 'fragments.db'))
+
+def seed(app, texts):
+    with app.app_context():
+        db = get_db()
+        db.executemany(
+            "INSERT INTO entries (user_id, text, mood, reflection, analysis_status)"
+            " VALUES (1, ?, 'calm', 'Breathe.', 'ok')",
+            [(text,) for text in texts]
+        )
+        db.commit()
+
+def cache(app):
+    return app.extensions['fragment_cache']
+
+def test_warm_page_matches_cold(app, client, auth):
+    """Cards come from the cache on the second view, unchanged."""
+    auth.register()
+    auth.login()
+    seed(app, [f'Entry number {i}' for i in range(5)])
+
+    cold = client.get('/entries/list').data
+    assert cache(app).stats['misses'] == 5
+    warm = client.get('/entries/list').data
+    assert cache(app).stats['memory_hits'] == 5
+    assert warm == cold
+    assert b'Entry number 4' in warm
+
+    page = client.get('/entries/list.json').get_json()
+    assert 'Entry number 0' in page['html']
+
+def test_changed_analysis_rendered_again(app, client, auth):
+    """Reanalysis bumps the entry's revision, so its card is not served stale."""
+    auth.register()
+    auth.login()
+    seed(app, ['A long day'])
+    assert b'calm' in client.get('/entries/list').data
+
+    with app.app_context():
+        db = get_db()
+        analysis.store_analysis(db, 1, {'mood': 'relieved', 'reflection': 'Well done.'})
+        db.commit()
+        assert db.execute('SELECT revision FROM entries').fetchone()[0] == 1
+
+    page = client.get('/entries/list').data
+    assert b'relieved' in page and b'Well done.' in page
+    assert b'calm' not in page
+
+def test_shared_tier(app, client, auth):
+    """Another worker finds cards in the file; deleted entries leave it."""
+    auth.register()
+    auth.login()
+    seed(app, ['First', 'Second'])
+    client.get('/entries/list')
+
+    # A fresh process starts with an empty memory tier
+    app.extensions['fragment_cache'] = fragments.FragmentCache(
+        path=app.config['FRAGMENT_CACHE_PATH']
+    )
+    client.get('/entries/list')
+    assert cache(app).stats['disk_hits'] == 2
+
+    client.post('/entries/1/delete')
+    client.post('/entries/delete', data={'ids': ['2']})
+    stored = sqlite3.connect(app.config['FRAGMENT_CACHE_PATH']).execute(
+        'SELECT COUNT(*) FROM fragments'
+    ).fetchone()[0]
+    assert stored == 0
+    assert cache(app)._entries == {}
+
+def test_lru_bound_and_versions():
+    """The memory tier keeps the newest cards, one version per entry."""
+    lru = fragments.FragmentCache(max_entries=2)
+    lru.put_many(1, [(1, 'a', '<one>'), (2, 'a', '<two>')])
+    lru.put_many(1, [(1, 'b', '<one again>'), (3, 'a', '<three>')])
+
+    assert lru.get_many(1, {1: 'a', 2: 'a', 3: 'a'}) == {3: '<three>'}
+    assert lru.get_many(1, {1: 'b'}) == {1: '<one again>'}
+    assert lru.get_many(2, {1: 'b'}) == {}
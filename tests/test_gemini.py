@@ -0,0 +1,306 @@
+import gc
+import os
+import subprocess
+import sys
+import time
+import weakref
+import pytest
+from app import create_app, gemini
+from app.db import get_db
+
+class StubChatModel:
+    """Minimal stand-in for ChatGoogleGenerativeAI."""
+    instances = 0
+    invocations = 0
+    fail = False
+    delay = 0.0
+
+    def __init__(self, model, api_key, temperature, **options):
+        StubChatModel.instances += 1
+        self.model = model
+
+    def invoke(self, prompt):
+        StubChatModel.invocations += 1
+        time.sleep(StubChatModel.delay)
+        if StubChatModel.fail:
+            raise ConnectionError('Gemini is down')
+
+        class Response:
+            content = 'MOOD: calm\nREFLECTION: Nice work.'
+        return Response()
+
+@pytest.fixture
+def stub_model(monkeypatch):
+    """Route Gemini calls to the stub with a fresh client registry."""
+    monkeypatch.setenv('GEMINI_API_KEY', 'test-key')
+    monkeypatch.setattr(gemini, 'ChatGoogleGenerativeAI', StubChatModel)
+    StubChatModel.instances = 0
+    StubChatModel.invocations = 0
+    StubChatModel.fail = False
+    StubChatModel.delay = 0.0
+    gemini.close_clients()
+    yield StubChatModel
+    gemini.close_clients()
+
+def test_chat_model_is_reused(app, stub_model):
+    """Repeated calls share one client per configuration."""
+    with app.app_context():
+        for _ in range(5):
+            assert gemini.call_gemini_api('Hello') == {
+                'mood': 'calm', 'reflection': 'Nice work.'
+            }
+    assert stub_model.instances == 1
+
+def test_chat_models_keyed_by_settings(stub_model):
+    """Different model, key or temperature get their own client."""
+    a = gemini.get_chat_model('m1', 'k1', 0.3)
+    assert gemini.get_chat_model('m1', 'k1', 0.3) is a
+    assert gemini.get_chat_model('m2', 'k1', 0.3) is not a
+    assert gemini.get_chat_model('m1', 'k2', 0.3) is not a
+    assert gemini.get_chat_model('m1', 'k1', 0.7) is not a
+    assert stub_model.instances == 4
+
+def test_registry_reset_after_fork(stub_model):
+    """A forked child starts without the parent's clients."""
+    a = gemini.get_chat_model('m1', 'k1')
+    gemini._forget_clients_after_fork()
+    assert gemini.get_chat_model('m1', 'k1') is not a
+
+def test_repeated_text_served_from_cache(app, stub_model):
+    """Identical texts, give or take whitespace, only reach Gemini once."""
+    with app.app_context():
+        first = gemini.call_gemini_api('Daily check-in: fine')
+        assert gemini.call_gemini_api('Daily check-in:   fine\n') == first
+        assert gemini.call_gemini_api('Something else') == first
+        cache = app.extensions['analysis_cache']
+
+    assert stub_model.invocations == 2
+    assert cache.stats['memory_hits'] == 1
+    assert cache.stats['misses'] == 2
+
+def test_cache_key_includes_model():
+    """The same text analyzed by another model is a different entry."""
+    assert gemini.cache_key('Hi', 'model-a') != gemini.cache_key('Hi', 'model-b')
+    assert gemini.cache_key('Hi  there', 'model-a') == gemini.cache_key('Hi there', 'model-a')
+
+def test_persistent_tier_survives_process_cache(app, stub_model):
+    """Results found in the database are promoted back into memory."""
+    with app.app_context():
+        gemini.call_gemini_api('Persisted')
+        cache = app.extensions['analysis_cache']
+        cache.clear()
+
+        assert gemini.call_gemini_api('Persisted')['mood'] == 'calm'
+        assert cache.stats['disk_hits'] == 1
+        gemini.call_gemini_api('Persisted')
+        assert cache.stats['memory_hits'] == 1
+
+    assert stub_model.invocations == 1
+
+def test_fallback_is_never_cached(app, stub_model):
+    """Errors fall back without poisoning the cache."""
+    stub_model.fail = True
+    with app.app_context():
+        assert gemini.call_gemini_api('Retry me') == gemini.essential_fallback
+        stub_model.fail = False
+        assert gemini.call_gemini_api('Retry me')['mood'] == 'calm'
+        assert get_db().execute('SELECT COUNT(*) FROM analysis_cache').fetchone()[0] == 1
+
+    assert stub_model.invocations == 2
+
+def test_cache_expiry_and_size_limit(app):
+    """Entries expire after the TTL and the table is trimmed to max_rows."""
+    cache = gemini.AnalysisCache(max_entries=2, ttl=60, max_rows=3)
+    cache.trim_every = 1
+    analysis = {'mood': 'calm', 'reflection': 'Ok.'}
+
+    with app.app_context():
+        for i in range(5):
+            cache.put(f'k{i}', analysis)
+        assert len(cache._entries) == 2
+        assert get_db().execute('SELECT COUNT(*) FROM analysis_cache').fetchone()[0] == 3
+        assert cache.get('k0') is None
+        assert cache.get('k4') == analysis
+
+        cache.ttl = 0
+        cache.clear()
+        assert cache.get('k4') is None
+
+def test_parse_batch_response_tolerates_noise():
+    """Indexed lines are mapped back; incomplete or out-of-range ones are dropped."""
+    text = (
+        'Here you go:\n'
+        '**[1] MOOD:** tired but proud\n'
+        '[1] REFLECTION: Rest well.\n'
+        '- [3] mood: anxious\n'
+        '[3] Reflection: Breathe.\n'
+        '[2] MOOD: happy\n'
+        '[9] MOOD: ignored\n'
+        '[9] REFLECTION: ignored\n'
+    )
+    parsed = gemini._parse_batch_response(text, 3)
+    assert parsed == {
+        0: {'mood': 'tired but proud', 'reflection': 'Rest well.'},
+        2: {'mood': 'anxious', 'reflection': 'Breathe.'},
+    }
+
+def test_plan_batches_respects_size_and_budget():
+    """Batches close when either the entry count or token budget is reached."""
+    texts = ['a' * 40] * 5 + ['b' * 400, 'c' * 4]
+    assert gemini._plan_batches(texts, 2, 1000) == [[0, 1], [2, 3], [4, 5], [6]]
+    assert gemini._plan_batches(texts, 10, 60) == [[0, 1, 2, 3, 4], [5], [6]]
+
+class StubBatchModel(StubChatModel):
+    """Answers batch prompts but forgets the second entry."""
+    prompts = []
+
+    def invoke(self, prompt):
+        StubBatchModel.prompts.append(prompt)
+        if prompt.startswith('Analyze each of these'):
+            class Response:
+                content = (
+                    '[1] MOOD: calm\n[1] REFLECTION: One.\n'
+                    '[3] MOOD: glad\n[3] REFLECTION: Three.'
+                )
+            return Response()
+        return super().invoke(prompt)
+
+def test_batch_call_packs_entries_and_falls_back(app, stub_model, monkeypatch):
+    """One request covers the batch; unparsed entries are analyzed singly."""
+    monkeypatch.setattr(gemini, 'ChatGoogleGenerativeAI', StubBatchModel)
+    StubBatchModel.prompts = []
+
+    with app.app_context():
+        results = gemini.call_gemini_api_batch(['one', 'two', 'three', 'one'])
+
+    assert results == [
+        {'mood': 'calm', 'reflection': 'One.'},
+        {'mood': 'calm', 'reflection': 'Nice work.'},
+        {'mood': 'glad', 'reflection': 'Three.'},
+        {'mood': 'calm', 'reflection': 'One.'},
+    ]
+    # One batch for the three distinct texts plus one retry for 'two'
+    assert len(StubBatchModel.prompts) == 2
+    assert '[3] three' in StubBatchModel.prompts[0]
+
+def test_worker_analyzes_jobs_in_batches(app, monkeypatch):
+    """Queued jobs are claimed and analyzed together."""
+    from app import analysis
+
+    batches = []
+    def fake_batch(texts):
+        batches.append(texts)
+        return [{'mood': 'calm', 'reflection': t} for t in texts]
+
+    monkeypatch.setattr(gemini, 'call_gemini_api_batch', fake_batch)
+    app.config['ANALYSIS_BATCH_SIZE'] = 3
+
+    with app.app_context():
+        db = get_db()
+        for i in range(5):
+            cursor = db.execute(
+                'INSERT INTO entries (user_id, text) VALUES (1, ?)', (f'e{i}',)
+            )
+            analysis.enqueue(db, cursor.lastrowid)
+        db.commit()
+
+        assert analysis.run_pending() == 5
+
+    assert batches == [['e0', 'e1', 'e2'], ['e3', 'e4']]
+
+def test_slow_gemini_hits_deadline(app, stub_model):
+    """A slow response falls back at the deadline instead of the SDK timeout."""
+    stub_model.delay = 0.5
+    app.config['GEMINI_TIMEOUT'] = 0.05
+    app.extensions['gemini_guard'].timeout = 0.05
+
+    with app.app_context():
+        start = time.monotonic()
+        assert gemini.call_gemini_api('Slow day') == gemini.essential_fallback
+        assert time.monotonic() - start < 0.4
+
+def test_circuit_breaker_stops_calling_gemini(app, stub_model):
+    """After repeated errors Gemini is not called until a probe succeeds."""
+    stub_model.fail = True
+    breaker = app.extensions['gemini_guard'].breaker
+    breaker.cooldown = 0.05
+
+    with app.app_context():
+        for i in range(8):
+            assert gemini.call_gemini_api(f'Entry {i}') == gemini.essential_fallback
+        assert stub_model.invocations == app.config['GEMINI_BREAKER_THRESHOLD']
+        assert gemini.unavailable_until() is not None
+
+        time.sleep(0.06)
+        stub_model.fail = False
+        assert gemini.call_gemini_api('Recovered')['mood'] == 'calm'
+        assert breaker.state == 'closed'
+        assert gemini.unavailable_until() is None
+
+def test_batch_does_not_retry_singly_when_unavailable(app, stub_model):
+    """A batch that hits the deadline falls back without per-entry calls."""
+    stub_model.delay = 0.2
+    app.extensions['gemini_guard'].timeout = 0.05
+
+    with app.app_context():
+        results = gemini.call_gemini_api_batch(['a', 'b', 'c'])
+
+    assert results == [gemini.essential_fallback] * 3
+    assert stub_model.invocations == 1
+
+def test_jobs_deferred_while_circuit_open(app, stub_model):
+    """Jobs are put back without losing an attempt while Gemini is down."""
+    from app import analysis
+
+    stub_model.fail = True
+    app.extensions['gemini_guard'].breaker.threshold = 1
+
+    with app.app_context():
+        db = get_db()
+        cursor = db.execute("INSERT INTO entries (user_id, text) VALUES (1, 'Down')")
+        analysis.enqueue(db, cursor.lastrowid)
+        db.commit()
+
+        assert analysis.run_pending() == 1
+        # Nothing else is attempted while the circuit is open
+        assert analysis.run_pending() == 0
+        job = db.execute('SELECT * FROM analysis_jobs').fetchone()
+        assert job['attempts'] == 0
+        assert job['last_error'] == 'circuit open'
+        assert job['run_after'] > time.time() + 20
+
+SDK_IMPORT_CHECK = '''
+import sys
+from app import create_app, gemini
+app = create_app({'TESTING': True, 'DATABASE': ':memory:'})
+app.test_cli_runner().invoke(args=['routes'])
+print('langchain_google_genai' in sys.modules)
+print(gemini.prewarm(), 'langchain_google_genai' in sys.modules)
+'''
+
+def test_sdk_imported_on_first_use(tmp_path):
+    """Starting the app and running commands leave the SDK unimported."""
+    (tmp_path / 'langchain_google_genai.py').write_text(
+        'class ChatGoogleGenerativeAI:\n    pass\n'
+    )
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [str(tmp_path), env.get('PYTHONPATH')]))
+    result = subprocess.run(
+        [sys.executable, '-c', SDK_IMPORT_CHECK], env=env,
+        capture_output=True, text=True, check=True,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    )
+    assert result.stdout.split('\n')[:2] == ['False', 'True True']
+
+def test_discarded_app_releases_its_guard(tmp_path):
+    """Apps do not pin their Gemini guards for the life of the process."""
+    app = create_app({
+        'TESTING': True, 'DATABASE': str(tmp_path / 'db.sqlite'),
+        'ANALYSIS_WORKERS': 0, 'PASSWORD_HASH_WORKERS': 0,
+    })
+    guard = weakref.ref(app.extensions['gemini_guard'])
+    assert guard() in gemini._guards
+
+    del app
+    gc.collect()
+    assert guard() is None
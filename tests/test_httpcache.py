@@ -0,0 +1,137 @@
+import gzip
+from flask import template_rendered, url_for
+from app import analysis
+from app.db import get_db
+
+def rendered_templates(app):
+    """Collect the names of templates rendered while the list is alive."""
+    names = []
+    template_rendered.connect(
+        lambda sender, template, context, **extra: names.append(template.name),
+        app, weak=False
+    )
+    return names
+
+def test_unchanged_list_is_not_rendered_again(client, auth, app):
+    """A repeat visit with the ETag gets 304 without rendering anything."""
+    auth.register()
+    auth.login()
+    client.post('/entries/add', data={'text': 'First'})
+    client.get('/entries/list')  # shows the "saved" flash
+
+    response = client.get('/entries/list')
+    etag = response.headers['ETag']
+    assert response.status_code == 200
+    assert 'private' in response.headers['Cache-Control']
+    assert 'no-cache' in response.headers['Cache-Control']
+
+    names = rendered_templates(app)
+    response = client.get('/entries/list', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.data == b''
+    assert response.headers['ETag'] == etag
+    assert names == []
+
+def test_etag_follows_every_change(client, auth, app):
+    """Adding, analyzing and deleting entries each produce a new ETag."""
+    auth.register()
+    auth.login()
+
+    def etag():
+        return client.get('/entries/list').headers['ETag']
+
+    seen = [etag()]
+    client.post('/entries/add', data={'text': 'Entry'})
+    client.get('/entries/list')  # consume the flash
+    seen.append(etag())
+
+    with app.app_context():
+        db = get_db()
+        analysis.store_analysis(db, 1, {'mood': 'calm', 'reflection': 'Ok.'})
+        db.commit()
+    seen.append(etag())
+
+    client.post('/entries/1/delete')
+    client.get('/entries/list')
+    seen.append(etag())
+
+    assert len(set(seen)) == 4
+    # Other pages of the same list have their own tags
+    assert client.get('/entries/list?cursor=MjAyNXwx').headers['ETag'] != seen[-1]
+
+def test_etag_is_per_user(client, auth, app):
+    """Two users with identical journals never share an ETag."""
+    auth.register('ann', 'pw')
+    auth.login('ann', 'pw')
+    ann = client.get('/entries/list').headers['ETag']
+    auth.logout()
+    auth.register('bob', 'pw')
+    auth.login('bob', 'pw')
+
+    response = client.get('/entries/list', headers={'If-None-Match': ann})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != ann
+
+def test_pending_flash_skips_304(client, auth):
+    """A page about to show a flashed message is always rendered."""
+    auth.register()
+    auth.login()
+    etag = client.get('/entries/list').headers['ETag']
+    with client.session_transaction() as session:
+        session['_flashes'] = [('success', 'Hello there')]
+
+    response = client.get('/entries/list', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert b'Hello there' in response.data
+
+def test_html_is_gzipped(client, auth):
+    """Pages are compressed for clients that accept gzip, with their own ETag."""
+    auth.register()
+    auth.login()
+    plain = client.get('/entries/list')
+    response = client.get('/entries/list', headers={'Accept-Encoding': 'gzip'})
+
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert gzip.decompress(response.data) == plain.data
+    etag = response.headers['ETag']
+    assert etag != plain.headers['ETag']
+
+    response = client.get(
+        '/entries/list', headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag}
+    )
+    assert response.status_code == 304
+    assert response.headers['ETag'] == etag
+
+def test_small_and_streamed_responses_not_compressed(client, auth, app):
+    """Tiny bodies and streamed exports are sent as they are."""
+    auth.register()
+    auth.login()
+    client.post('/entries/add', data={'text': 'Entry'})
+
+    response = client.get('/entries/list.json?cursor=MjAyNXwx',
+                          headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in response.headers
+
+    response = client.get('/entries/export?format=jsonl',
+                          headers={'Accept-Encoding': 'gzip'})
+    assert response.is_streamed
+    assert 'Content-Encoding' not in response.headers
+
+def test_static_urls_are_fingerprinted(client, app):
+    """Static URLs carry a content hash and are cached for a year."""
+    with app.test_request_context():
+        url = url_for('static', filename='css/app.css')
+    assert '?v=' in url
+
+    response = client.get(url)
+    assert response.headers['Cache-Control'] == 'public, max-age=31536000, immutable'
+    response.close()
+
+    response = client.get('/static/css/app.css?v=stale')
+    assert 'immutable' not in response.headers.get('Cache-Control', '')
+    response.close()
+
+    response = client.get(url, headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert b'--primary-color' in gzip.decompress(response.data)
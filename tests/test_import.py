@@ -0,0 +1,135 @@
+import gzip
+import io
+import json
+from app import importer
+from app.analysis import claim_jobs
+from app.db import get_db
+
+def jsonl(*records):
+    return ''.join(json.dumps(record) + '\n' for record in records).encode()
+
+def upload(client, data, filename):
+    return client.post(
+        '/entries/import',
+        data={'file': (io.BytesIO(data), filename)},
+        content_type='multipart/form-data',
+        follow_redirects=True,
+    )
+
+def test_import_requires_login(client):
+    """Importing requires login."""
+    assert client.get('/entries/import').headers['Location'] == '/auth/login'
+
+def test_import_jsonl(client, auth, app):
+    """Imported entries keep their timestamps and are queued for analysis."""
+    auth.register()
+    auth.login()
+
+    response = upload(client, jsonl(
+        {'text': 'Old entry', 'timestamp': '2021-03-04T05:06:07Z'},
+        {'text': 'Offset entry', 'timestamp': '2021-03-04T12:00:00+02:00'},
+        {'text': 'Undated entry'},
+    ), 'journal.jsonl')
+    assert b'Imported 3 entries.' in response.data
+
+    with app.app_context():
+        db = get_db()
+        rows = db.execute(
+            'SELECT CAST(timestamp AS TEXT) AS ts, text FROM entries ORDER BY id'
+        ).fetchall()
+        assert [row['ts'] for row in rows[:2]] == [
+            '2021-03-04 05:06:07', '2021-03-04 10:00:00'
+        ]
+        assert rows[2]['ts'] is not None
+        assert db.execute('SELECT COUNT(*) FROM analysis_jobs').fetchone()[0] == 3
+
+    # Entries show up in the list, oldest last
+    response = client.get('/entries/list')
+    assert response.data.index(b'Undated entry') < response.data.index(b'Old entry')
+
+def test_import_csv_keeps_analysis(client, auth, app):
+    """Rows that already carry a mood and reflection are not analyzed again."""
+    auth.register()
+    auth.login()
+    data = (
+        '\ufefftimestamp,text,mood,reflection\r\n'
+        '2022-01-02 03:04:05,"Commas, and\nnewlines",happy,Lovely.\r\n'
+        '2022-01-03 03:04:05,No analysis yet,,\r\n'
+    ).encode()
+
+    response = upload(client, gzip.compress(data), 'journal.csv.gz')
+    assert b'Imported 2 entries.' in response.data
+
+    with app.app_context():
+        db = get_db()
+        entry = db.execute('SELECT * FROM entries WHERE mood IS NOT NULL').fetchone()
+        assert entry['text'] == 'Commas, and\nnewlines'
+        assert entry['mood_category'] == 'joyful'
+        jobs = db.execute('SELECT entry_id FROM analysis_jobs').fetchall()
+        assert [job['entry_id'] for job in jobs] == [entry['id'] + 1]
+        # The mood rollups count the imported day
+        assert db.execute(
+            "SELECT count FROM mood_daily WHERE day = '2022-01-02'"
+        ).fetchone()['count'] == 1
+
+def test_import_skips_bad_rows(client, auth, app):
+    """Invalid rows are reported and skipped without stopping the import."""
+    auth.register()
+    auth.login()
+    data = jsonl({'text': 'Fine'}, {'text': ''}, {'text': 'Bad', 'timestamp': 'soon'})
+    data += b'not json\n'
+
+    response = upload(client, data, 'journal.jsonl')
+    assert b'Imported 1 entries.' in response.data
+    assert b'Skipped line 2: missing text.' in response.data
+    assert b'Skipped line 3: invalid timestamp' in response.data
+    assert b'Skipped line 4: not a JSON object.' in response.data
+
+    response = upload(client, b'whatever', 'journal.txt')
+    assert b'Upload a .jsonl or .csv file.' in response.data
+
+def test_import_commits_in_chunks(app):
+    """Each chunk is inserted in its own transaction."""
+    with app.app_context():
+        db = get_db()
+        db.execute("INSERT INTO users (username, password_hash) VALUES ('u', 'x')")
+        db.commit()
+
+        statements = []
+        db.set_trace_callback(statements.append)
+        data = jsonl(*({'text': f'Entry {i}'} for i in range(25)))
+        result = importer.import_entries(1, io.BytesIO(data), chunk_size=10)
+        db.set_trace_callback(None)
+
+        assert result == {'imported': 25, 'skipped': 0, 'errors': []}
+        assert statements.count('BEGIN IMMEDIATE') == 3
+        assert db.execute('SELECT COUNT(*) FROM entries').fetchone()[0] == 25
+
+def test_imported_jobs_yield_to_live_entries(client, auth, app):
+    """Analysis of a big import does not hold up newly written entries."""
+    auth.register()
+    auth.login()
+    upload(client, jsonl({'text': 'Imported'}), 'journal.jsonl')
+    client.post('/entries/add', data={'text': 'Written today'})
+
+    with app.app_context():
+        job = claim_jobs(get_db(), 1)[0]
+        assert job['text'] == 'Written today'
+
+def test_import_command(runner, app, tmp_path):
+    """The CLI imports a file for an existing user."""
+    with app.app_context():
+        db = get_db()
+        db.execute("INSERT INTO users (username, password_hash) VALUES ('cli', 'x')")
+        db.commit()
+
+    path = tmp_path / 'journal.jsonl'
+    path.write_bytes(jsonl({'text': 'From the CLI'}, {'nope': 1}))
+    result = runner.invoke(args=['import-entries', 'cli', str(path)])
+    assert 'Imported 1 entries, skipped 1' in result.output
+
+    with app.app_context():
+        assert get_db().execute('SELECT text FROM entries').fetchone()['text'] == 'From the CLI'
+
+    result = runner.invoke(args=['import-entries', 'nobody', str(path)])
+    assert 'does not exist' in result.output
@@ -0,0 +1,104 @@
+import random
+import pytest
+from app import analysis
+from app.db import get_db
+from app.moods import categorize_mood
+
+@pytest.mark.parametrize('mood, category', [
+    ('happy and excited', 'joyful'),
+    ('stressed but hopeful', 'anxious'),
+    ('Hopeless', 'sad'),
+    ('not happy, just tired', 'tired'),
+    ('neutral', 'neutral'),
+    (None, None),
+])
+def test_categorize_mood(mood, category):
+    """Free-text moods map onto the taxonomy."""
+    assert categorize_mood(mood) == category
+
+def rollups(db, table, period):
+    return sorted(tuple(row) for row in db.execute(
+        f'SELECT user_id, {period}, category, count FROM {table}'
+    ))
+
+def recomputed(db, period_sql):
+    return sorted(tuple(row) for row in db.execute(
+        f'SELECT user_id, {period_sql}, mood_category, COUNT(*) FROM entries'
+        ' WHERE mood_category IS NOT NULL GROUP BY 1, 2, 3'
+    ))
+
+def test_rollups_consistent_after_adds_and_deletes(app):
+    """Incremental rollups always equal a full recount of the entries."""
+    rng = random.Random(7)
+    moods = ['happy', 'calm', 'sad', 'anxious', 'tired', 'meh']
+
+    with app.app_context():
+        db = get_db()
+        ids = []
+        for i in range(200):
+            cursor = db.execute(
+                'INSERT INTO entries (user_id, text, timestamp)'
+                " VALUES (?, ?, datetime('2024-01-01', ? || ' hours'))",
+                (rng.randint(1, 3), f'Entry {i}', rng.randint(0, 24 * 60))
+            )
+            ids.append(cursor.lastrowid)
+            analysis.store_analysis(
+                db, cursor.lastrowid,
+                {'mood': rng.choice(moods), 'reflection': 'Ok.'}
+            )
+        # Re-analysis moves entries between categories
+        for entry_id in rng.sample(ids, 50):
+            analysis.store_analysis(
+                db, entry_id, {'mood': rng.choice(moods), 'reflection': 'Again.'}
+            )
+        for entry_id in rng.sample(ids, 80):
+            db.execute('DELETE FROM entries WHERE id = ?', (entry_id,))
+        db.commit()
+
+        assert rollups(db, 'mood_daily', 'day') == recomputed(db, 'date(timestamp)')
+        assert rollups(db, 'mood_weekly', 'week') == recomputed(
+            db, "date(timestamp, 'weekday 0', '-6 days')"
+        )
+        assert db.execute('SELECT COUNT(*) FROM mood_daily WHERE count <= 0').fetchone()[0] == 0
+
+def test_insights_endpoint(client, auth, app):
+    """The endpoint reports frequency and trends for the current user only."""
+    auth.register()
+    auth.login()
+    with app.app_context():
+        db = get_db()
+        for user_id, mood in [(1, 'happy'), (1, 'happy'), (1, 'worried'), (2, 'sad')]:
+            cursor = db.execute(
+                'INSERT INTO entries (user_id, text) VALUES (?, ?)', (user_id, mood)
+            )
+            analysis.store_analysis(db, cursor.lastrowid, {'mood': mood, 'reflection': ''})
+        db.commit()
+
+    data = client.get('/entries/insights.json').get_json()
+    assert data['frequency']['joyful'] == 2
+    assert data['frequency']['anxious'] == 1
+    assert data['frequency']['sad'] == 0
+    assert data['daily'][-1]['counts'] == {'joyful': 2, 'anxious': 1}
+    assert data['weekly'][-1]['counts'] == {'joyful': 2, 'anxious': 1}
+
+    response = client.get('/entries/insights')
+    assert b'Mood Insights' in response.data
+    assert client.get('/entries/insights.json?days=0').status_code == 400
+
+def test_rebuild_insights_command(runner, app):
+    """Rebuilding categorizes old entries and recounts the rollups."""
+    with app.app_context():
+        db = get_db()
+        db.execute(
+            "INSERT INTO entries (user_id, text, mood) VALUES (1, 'Old', 'calm and content')"
+        )
+        db.execute("INSERT INTO mood_daily VALUES (1, '2000-01-01', 'sad', 5)")
+        db.commit()
+
+    result = runner.invoke(args=['rebuild-insights'])
+    assert 'Rebuilt mood insights' in result.output
+
+    with app.app_context():
+        db = get_db()
+        assert db.execute('SELECT mood_category FROM entries').fetchone()[0] == 'calm'
+        assert [tuple(r)[2:] for r in db.execute('SELECT * FROM mood_daily')] == [('calm', 1)]
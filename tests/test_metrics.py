@@ -0,0 +1,92 @@
+import pytest
+from app import gemini
+from app.db import get_db
+
+@pytest.fixture
+def metrics_app(app_factory):
+    """An app with metrics and Server-Timing switched on."""
+    return app_factory(METRICS_ENABLED=True, SERVER_TIMING=True)
+
+def login(client):
+    client.post('/auth/register', data={'username': 'm', 'password': 'pw'})
+    client.post('/auth/login', data={'username': 'm', 'password': 'pw'})
+
+def test_metrics_disabled_by_default(client, app):
+    """Nothing is exposed or timed unless metrics are enabled."""
+    assert client.get('/metrics').status_code == 404
+    assert 'Server-Timing' not in client.get('/auth/login').headers
+    assert 'metrics' not in app.extensions
+
+def test_request_latency_and_db_time(metrics_app):
+    """Each request is timed per endpoint, with its SQL statements counted."""
+    client = metrics_app.test_client()
+    login(client)
+    response = client.get('/entries/list')
+
+    timing = response.headers['Server-Timing']
+    assert timing.startswith('app;dur=')
+    assert 'db;dur=' in timing and 'render;dur=' in timing
+
+    metrics = metrics_app.extensions['metrics']
+    assert metrics.requests.count('entries.list', 'GET', '200') == 1
+    assert metrics.db_queries.value('entries.list') >= 1
+    assert metrics.render_seconds.value('entries/list.html') > 0
+    # Register, verify on login, and the one-off rehash check
+    assert metrics.password_hashes.count() == 3
+
+    text = client.get('/metrics').data.decode()
+    assert 'mindsight_http_request_duration_seconds_bucket{endpoint="entries.list",method="GET",status="200",le="+Inf"} 1' in text
+    assert '# TYPE mindsight_db_queries_total counter' in text
+    assert '# TYPE mindsight_fragment_cache_events_total counter' in text
+    assert 'mindsight_fragment_cache_events_total{event="stores"} 0' in text
+    assert 'mindsight_analysis_jobs{state="queued"} 0' in text
+    assert 'mindsight_gemini_guard{value="circuit_open"} 0' in text
+
+class StubChatModel:
+    def __init__(self, model, api_key, temperature, **options):
+        pass
+
+    def invoke(self, prompt):
+        if 'fail' in prompt:
+            raise ConnectionError('down')
+
+        class Response:
+            content = 'MOOD: calm\nREFLECTION: Fine.'
+        return Response()
+
+def test_llm_calls_and_cache_hits(metrics_app, monkeypatch):
+    """Gemini calls are recorded by outcome and cache stats are exported."""
+    monkeypatch.setenv('GEMINI_API_KEY', 'test-key')
+    monkeypatch.setattr(gemini, 'ChatGoogleGenerativeAI', StubChatModel)
+    gemini.close_clients()
+
+    with metrics_app.app_context():
+        gemini.call_gemini_api('all good')
+        gemini.call_gemini_api('all good')
+        gemini.call_gemini_api('fail please')
+    gemini.close_clients()
+
+    metrics = metrics_app.extensions['metrics']
+    assert metrics.llm_calls.count('ok') == 1
+    assert metrics.llm_calls.count('error') == 1
+
+    text = metrics_app.test_client().get('/metrics').data.decode()
+    assert '# TYPE mindsight_analysis_cache_events_total counter' in text
+    assert 'mindsight_analysis_cache_events_total{event="memory_hits"} 1' in text
+    assert 'mindsight_analysis_cache_events_total{event="misses"} 2' in text
+    assert 'mindsight_analysis_cache_hit_ratio 0.333' in text
+
+def test_metrics_token(metrics_app):
+    """A configured token is required to scrape /metrics."""
+    metrics_app.config['METRICS_TOKEN'] = 'secret'
+    client = metrics_app.test_client()
+    assert client.get('/metrics').status_code == 401
+    response = client.get('/metrics', headers={'Authorization': 'Bearer secret'})
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+
+def test_queries_not_timed_outside_requests(metrics_app):
+    """Background work pays nothing for query timing."""
+    with metrics_app.app_context():
+        get_db().execute('SELECT 1')
+    assert metrics_app.extensions['metrics'].db_queries.value('none') == 0
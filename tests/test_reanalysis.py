@@ -0,0 +1,137 @@
+import pytest
+from app import analysis, gemini, reanalysis
+from app.db import get_db
+
+def add_entry(db, text, mood=None, reflection=None, status='pending',
+              model=None, version=None):
+    return db.execute(
+        'INSERT INTO entries (user_id, text, mood, reflection, analysis_status,'
+        ' analysis_model, analysis_prompt_version) VALUES (1, ?, ?, ?, ?, ?, ?)',
+        (text, mood, reflection, status, model, version)
+    ).lastrowid
+
+def status_of(db, entry_id):
+    return db.execute(
+        'SELECT mood, reflection, analysis_status, analysis_model,'
+        ' analysis_prompt_version FROM entries WHERE id = ?', (entry_id,)
+    ).fetchone()
+
+@pytest.fixture
+def fake_batch(monkeypatch):
+    """Analyze every text as 'calm' unless its text contains 'down'."""
+    calls = []
+
+    def analyze(texts):
+        calls.append(list(texts))
+        return [
+            gemini.essential_fallback if 'down' in text
+            else {'mood': 'calm', 'reflection': f'Redone {text}'}
+            for text in texts
+        ]
+
+    monkeypatch.setattr(gemini, 'call_gemini_api_batch', analyze)
+    return calls
+
+def test_store_analysis_records_status(app):
+    """Real results are 'ok' with model and prompt version; fallbacks are 'failed'."""
+    with app.app_context():
+        db = get_db()
+        good = add_entry(db, 'Good')
+        bad = add_entry(db, 'Bad')
+        analysis.store_analysis(db, good, {'mood': 'calm', 'reflection': 'Ok.'})
+        analysis.store_analysis(db, bad, gemini.essential_fallback)
+
+        row = status_of(db, good)
+        assert row['analysis_status'] == 'ok'
+        assert row['analysis_model'] == gemini.current_model()
+        assert row['analysis_prompt_version'] == gemini.PROMPT_VERSION
+        assert status_of(db, bad)['analysis_status'] == 'failed'
+
+def test_reanalyze_failed_and_outdated(app, fake_batch):
+    """Failed and outdated analyses are redone; unknown provenance is left alone."""
+    model, version = gemini.current_model(), gemini.PROMPT_VERSION
+    with app.app_context():
+        db = get_db()
+        failed = add_entry(db, 'failed', 'neutral', 'x', 'failed', model, version)
+        old_prompt = add_entry(db, 'old prompt', 'sad', 'x', 'ok', model, version - 1)
+        old_model = add_entry(db, 'old model', 'sad', 'x', 'ok', 'gemini-1.0', version)
+        current = add_entry(db, 'current', 'sad', 'x', 'ok', model, version)
+        imported = add_entry(db, 'imported', 'sad', 'x', 'ok')
+        still_down = add_entry(db, 'still down', 'sad', 'x', 'ok', model, version - 1)
+        db.commit()
+
+        result = reanalysis.reanalyze(concurrency=2, rate=0)
+        assert result == {'marked': 3, 'redone': 3, 'failed': 1, 'finished': True}
+
+        for entry_id in (failed, old_prompt, old_model):
+            row = status_of(db, entry_id)
+            assert row['mood'] == 'calm'
+            assert row['analysis_status'] == 'ok'
+            assert row['analysis_model'] == model
+        for entry_id in (current, imported):
+            assert status_of(db, entry_id)['mood'] == 'sad'
+        # A failed retry keeps the previous analysis until next time
+        row = status_of(db, still_down)
+        assert row['mood'] == 'sad'
+        assert row['analysis_status'] == 'outdated'
+
+    assert sorted(sum(fake_batch, [])) == ['failed', 'old model', 'old prompt', 'still down']
+
+def test_reanalyze_resumes_from_checkpoint(app, fake_batch):
+    """An interrupted run continues after the last finished chunk."""
+    app.config['GEMINI_BATCH_SIZE'] = 2
+    with app.app_context():
+        db = get_db()
+        ids = [add_entry(db, f'down {i}', 'neutral', 'x', 'failed') for i in range(5)]
+        db.commit()
+
+        result = reanalysis.reanalyze(concurrency=1, rate=0, limit=2)
+        assert result['failed'] == 2 and not result['finished']
+        assert db.execute('SELECT last_id FROM reanalyze_checkpoint').fetchone()[0] == ids[1]
+
+        # Still-failing entries before the checkpoint are not retried this run
+        result = reanalysis.reanalyze(concurrency=1, rate=0)
+        assert result['failed'] == 3 and result['finished']
+        assert db.execute('SELECT COUNT(*) FROM reanalyze_checkpoint').fetchone()[0] == 0
+
+    assert fake_batch == [['down 0', 'down 1'], ['down 2', 'down 3'], ['down 4']]
+
+def test_reanalyze_stops_while_circuit_open(app, fake_batch):
+    """Nothing is attempted while Gemini is known to be down."""
+    with app.app_context():
+        db = get_db()
+        add_entry(db, 'failed', 'neutral', 'x', 'failed')
+        db.commit()
+        breaker = app.extensions['gemini_guard'].breaker
+        breaker.threshold = 1
+        breaker.failure()
+
+        result = reanalysis.reanalyze(rate=0)
+        assert result['redone'] == 0 and not result['finished']
+    assert fake_batch == []
+
+def test_needs_analysis_query_uses_partial_index(app):
+    """The repair query reads the small partial index, not the whole table."""
+    with app.app_context():
+        plan = ' '.join(
+            row['detail'] for row in get_db().execute(
+                'EXPLAIN QUERY PLAN SELECT id, text FROM entries'
+                " WHERE analysis_status IN ('failed', 'outdated') AND id > 0"
+                ' ORDER BY id LIMIT 10'
+            )
+        )
+    assert 'idx_entries_needs_analysis' in plan
+
+def test_reanalyze_command(runner, app, fake_batch):
+    """The CLI reports what it did; --dry-run changes nothing."""
+    with app.app_context():
+        db = get_db()
+        add_entry(db, 'failed', 'neutral', 'x', 'failed')
+        db.commit()
+
+    result = runner.invoke(args=['reanalyze', '--dry-run'])
+    assert '1 entries to reanalyze' in result.output
+    assert fake_batch == []
+
+    result = runner.invoke(args=['reanalyze', '--rate', '0'])
+    assert 'Reanalyzed 1 entries, 0 still failing' in result.output
@@ -0,0 +1,100 @@
+import threading
+import time
+import pytest
+from app import resilience
+
+def test_breaker_opens_and_probes():
+    """Repeated failures open the circuit; one probe after the cooldown decides."""
+    breaker = resilience.CircuitBreaker(threshold=2, cooldown=0.05)
+    breaker.failure()
+    assert breaker.state == 'closed'
+    breaker.failure()
+    assert breaker.state == 'open'
+    assert not breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.allow()
+    # Only one probe at a time
+    assert not breaker.allow()
+    breaker.failure()
+    assert breaker.state == 'open'
+
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.success()
+    assert breaker.state == 'closed'
+    assert breaker.allow()
+
+def test_limiter_adapts_to_latency():
+    """Slow or failed calls halve the limit; fast ones win it back gradually."""
+    limiter = resilience.AdaptiveLimiter(min_limit=1, max_limit=8, latency_target=1.0)
+
+    for _ in range(3):
+        assert limiter.acquire(0)
+        limiter.release(5.0)
+    assert limiter.limit == 1
+
+    assert limiter.acquire(0)
+    assert not limiter.acquire(0)
+    limiter.release(0.1, ok=False)
+    assert limiter.limit == 1
+
+    for _ in range(20):
+        limiter.acquire(0)
+        limiter.release(0.1)
+    assert 4 < limiter.limit < 8
+
+def test_guard_enforces_deadline():
+    """A hung call is abandoned at the deadline but keeps its slot until it returns."""
+    guard = resilience.CallGuard(
+        timeout=0.05,
+        limiter=resilience.AdaptiveLimiter(max_limit=1, latency_target=1.0),
+    )
+    release = threading.Event()
+    try:
+        start = time.monotonic()
+        with pytest.raises(resilience.DeadlineExceeded):
+            guard.call(release.wait, 5)
+        assert time.monotonic() - start < 1
+
+        # The hung call still holds the only slot
+        with pytest.raises(resilience.Overloaded):
+            guard.call(lambda: 'ok')
+
+        release.set()
+        time.sleep(0.05)
+        assert guard.call(lambda: 'ok') == 'ok'
+    finally:
+        release.set()
+        guard.shutdown()
+
+def test_guard_short_circuits_when_open():
+    """Once the breaker trips, calls are refused without running."""
+    guard = resilience.CallGuard(
+        timeout=1, breaker=resilience.CircuitBreaker(threshold=2, cooldown=60)
+    )
+    calls = []
+
+    def failing():
+        calls.append(1)
+        raise ConnectionError('down')
+
+    try:
+        for _ in range(2):
+            with pytest.raises(ConnectionError):
+                guard.call(failing)
+        with pytest.raises(resilience.CircuitOpen):
+            guard.call(failing)
+        assert len(calls) == 2
+        # Refused calls do not leak concurrency slots
+        assert guard.limiter.in_flight == 0
+    finally:
+        guard.shutdown()
+
+def test_throttle_spaces_calls():
+    """Calls are spread out to the configured rate."""
+    throttle = resilience.Throttle(rate=50)
+    start = time.monotonic()
+    for _ in range(6):
+        throttle.wait()
+    assert time.monotonic() - start >= 0.1
@@ -0,0 +1,180 @@
+import sqlite3
+import pytest
+from app import retention
+from app.db import get_db
+
+def seed(app, user_id, days_ago):
+    """One entry for ``user_id`` per value in ``days_ago``, each with a queued job."""
+    with app.app_context():
+        db = get_db()
+        for days in days_ago:
+            cursor = db.execute(
+                "INSERT INTO entries (user_id, text, timestamp)"
+                " VALUES (?, ?, datetime('now', ?))",
+                (user_id, f'{days} days ago', f'-{days} days')
+            )
+            db.execute(
+                'INSERT INTO analysis_jobs (entry_id) VALUES (?)', (cursor.lastrowid,)
+            )
+        db.commit()
+
+def remaining(app, user_id=None):
+    with app.app_context():
+        query = 'SELECT text FROM entries'
+        params = ()
+        if user_id is not None:
+            query += ' WHERE user_id = ?'
+            params = (user_id,)
+        return sorted(row['text'] for row in get_db().execute(query + ' ORDER BY id', params))
+
+def test_delete_selected(app, client, auth):
+    """Ticked entries go, along with their jobs; other users' ids are ignored."""
+    auth.register('user1', 'pass1')
+    auth.register('user2', 'pass2')
+    seed(app, 1, [1, 2, 3])
+    seed(app, 2, [4])
+    auth.login('user1', 'pass1')
+
+    response = client.post('/entries/delete', data={'ids': ['1', '3', '4']},
+                           follow_redirects=True)
+    assert b'Deleted 2 entries.' in response.data
+    assert remaining(app) == ['2 days ago', '4 days ago']
+    with app.app_context():
+        jobs = get_db().execute('SELECT entry_id FROM analysis_jobs ORDER BY entry_id')
+        assert [row['entry_id'] for row in jobs] == [2, 4]
+
+def test_delete_date_range(app, client, auth):
+    """Both ends of the range are included; either may be left open."""
+    auth.register()
+    seed(app, 1, [1, 10, 20, 30])
+    auth.login()
+    with app.app_context():
+        day = lambda days: get_db().execute(
+            "SELECT date('now', ?)", (f'-{days} days',)
+        ).fetchone()[0]
+        first, last = day(20), day(10)
+
+    client.post('/entries/delete', data={'from': first, 'to': last})
+    assert remaining(app) == ['1 days ago', '30 days ago']
+
+    client.post('/entries/delete', data={'to': last})
+    assert remaining(app) == ['1 days ago']
+
+    response = client.post('/entries/delete', data={}, follow_redirects=True)
+    assert b'Select entries or a date range to delete.' in response.data
+    assert client.post('/entries/delete', data={'from': 'soon'}).status_code == 400
+
+def test_chunks_release_the_write_lock(app, monkeypatch):
+    """Another connection can write between chunks of a large delete."""
+    seed(app, 1, range(10))
+    other = sqlite3.connect(app.config['DATABASE'], timeout=0)
+    writes = []
+
+    def pause(seconds):
+        # Would raise "database is locked" if the chunk were still open
+        other.execute('INSERT INTO users (username, password_hash) VALUES (?, ?)',
+                      (f'user{len(writes)}', 'x'))
+        other.commit()
+        writes.append(seconds)
+
+    monkeypatch.setattr(retention.time, 'sleep', pause)
+    with app.app_context():
+        deleted = retention.delete_entries(get_db(), 1, end='9999-12-31', chunk_size=3, pause=0.01)
+    other.close()
+    assert deleted == 10
+    assert len(writes) == 3
+    assert remaining(app) == []
+
+def test_delete_request_is_capped(app, client, auth, monkeypatch):
+    """One request deletes at most DELETE_REQUEST_LIMIT entries and never sleeps."""
+    auth.register()
+    seed(app, 1, range(10))
+    auth.login()
+    app.config.update(DELETE_REQUEST_LIMIT=4, DELETE_CHUNK_SIZE=3)
+    monkeypatch.setattr(retention.time, 'sleep', lambda seconds: pytest.fail('slept'))
+
+    response = client.post('/entries/delete', data={'to': '2999-12-31'}, follow_redirects=True)
+    assert b'Deleted 4 entries. More remain in that range' in response.data
+    assert len(remaining(app)) == 6
+    assert remaining(app)[0] == '0 days ago'
+
+    response = client.post('/entries/delete', data={'ids': [str(i) for i in range(1, 6)]},
+                           follow_redirects=True)
+    assert b'Select at most 4 entries to delete at a time.' in response.data
+    assert len(remaining(app)) == 6
+
+    client.post('/entries/delete', data={'to': '2999-12-31'}, follow_redirects=True)
+    response = client.post('/entries/delete', data={'to': '2999-12-31'}, follow_redirects=True)
+    assert b'Deleted 2 entries.' in response.data
+    assert b'More remain' not in response.data
+    assert remaining(app) == []
+
+def test_retention_rule_form(app, client, auth):
+    """Users choose how long entries are kept, or keep them forever."""
+    auth.register()
+    auth.login()
+    assert b'placeholder="Forever"' in client.get('/entries/cleanup').data
+
+    response = client.post('/entries/cleanup', data={'keep_days': '90'}, follow_redirects=True)
+    assert b'Entries older than 90 days will be deleted.' in response.data
+    assert b'value="90"' in response.data
+
+    response = client.post('/entries/cleanup', data={'keep_days': '-5'})
+    assert b'Keep entries for 1 to 36500 days' in response.data
+
+    client.post('/entries/cleanup', data={'keep_days': ''})
+    with app.app_context():
+        assert retention.get_rule(1) is None
+
+def test_apply_retention_command(app, runner):
+    """Old entries of users with a rule are deleted and the space reclaimed."""
+    with app.app_context():
+        db = get_db()
+        db.executemany('INSERT INTO users (username, password_hash) VALUES (?, ?)',
+                       [('user1', 'x'), ('user2', 'x')])
+        db.commit()
+        retention.set_rule(1, 30)
+    seed(app, 1, [1, 29, 31, 400])
+    seed(app, 2, [400])
+    with app.app_context():
+        db = get_db()
+        db.executemany('INSERT INTO entries (user_id, text, timestamp) VALUES (1, ?, ?)',
+                       [('x' * 4000, '2000-01-01')] * 200)
+        db.commit()
+
+    result = runner.invoke(args=['apply-retention'])
+    assert 'Deleted 202 entries of user 1.' in result.output
+    assert remaining(app, 1) == ['1 days ago', '29 days ago']
+    assert remaining(app, 2) == ['400 days ago']
+    with app.app_context():
+        db = get_db()
+        assert db.execute('PRAGMA auto_vacuum').fetchone()[0] == retention.INCREMENTAL
+        assert db.execute('PRAGMA freelist_count').fetchone()[0] == 0
+
+def test_vacuum_is_bounded(app):
+    """A vacuum step frees no more than it is allowed to."""
+    with app.app_context():
+        db = get_db()
+        db.executemany('INSERT INTO entries (user_id, text) VALUES (1, ?)',
+                       [('x' * 4000,)] * 200)
+        db.commit()
+        retention.delete_entries(db, 1, end='9999-12-31')
+        free = db.execute('PRAGMA freelist_count').fetchone()[0]
+
+        assert retention.vacuum(db, step_pages=10, max_pages=25) == 25
+        assert db.execute('PRAGMA freelist_count').fetchone()[0] == free - 25
+        assert retention.vacuum(db, step_pages=64) == free - 25
+
+def test_vacuum_full_converts_older_files(app, runner):
+    """Files made before incremental auto-vacuum switch over with --full."""
+    with app.app_context():
+        db = get_db()
+        db.execute('PRAGMA auto_vacuum = NONE')
+        db.execute('VACUUM')
+        assert db.execute('PRAGMA auto_vacuum').fetchone()[0] == 0
+        assert retention.vacuum(db, 10) == 0
+
+    result = runner.invoke(args=['vacuum-db', '--full'])
+    assert 'Rebuilt the database.' in result.output
+    with app.app_context():
+        assert get_db().execute('PRAGMA auto_vacuum').fetchone()[0] == retention.INCREMENTAL
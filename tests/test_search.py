@@ -0,0 +1,93 @@
+import pytest
+from app.db import get_db
+from app.search import build_match_query
+
+def add_entries(app, texts, user_id=1):
+    with app.app_context():
+        db = get_db()
+        db.executemany(
+            'INSERT INTO entries (user_id, text) VALUES (?, ?)',
+            [(user_id, text) for text in texts]
+        )
+        db.commit()
+
+def test_build_match_query():
+    """User input becomes quoted terms with a prefix match on the last one."""
+    assert build_match_query('walk in the park') == '"walk" "in" "the" "park"*'
+    assert build_match_query('"NEAR(a OR b') == '"NEAR" "a" "OR" "b"*'
+    assert build_match_query('  !! ') is None
+
+def test_search_requires_login(client):
+    """Searching requires login."""
+    response = client.get('/entries/search?q=walk')
+    assert response.headers['Location'] == '/auth/login'
+
+def test_search_ranks_and_highlights(client, auth, app):
+    """Matches are ranked, highlighted and HTML-escaped."""
+    auth.register()
+    auth.login()
+    add_entries(app, [
+        'Went for a walk <b>today</b>',
+        'Walking, walked, walks: a walking kind of day',
+        'Stayed inside all day',
+    ])
+
+    response = client.get('/entries/search?q=walk')
+    html = response.data.decode()
+    assert 'Stayed inside' not in html
+    assert html.index('a <mark>walking</mark> kind') < html.index('Went for a <mark>walk</mark>')
+    assert '&lt;b&gt;today&lt;/b&gt;' in html
+
+def test_search_scoped_to_user(client, auth, app):
+    """Users never see each other's entries in results."""
+    auth.register('user1', 'pass1')
+    auth.register('user2', 'pass2')
+    add_entries(app, ['User1 secret garden'], user_id=1)
+    add_entries(app, ['User2 public garden'], user_id=2)
+    auth.login('user2', 'pass2')
+
+    response = client.get('/entries/search?q=garden')
+    assert b'public' in response.data
+    assert b'secret' not in response.data
+
+def test_search_paginates(client, auth, app):
+    """Results are split into pages."""
+    app.config['ENTRIES_PAGE_SIZE'] = 2
+    auth.register()
+    auth.login()
+    add_entries(app, [f'Coffee number {i}' for i in range(5)])
+
+    first = client.get('/entries/search?q=coffee').data
+    last = client.get('/entries/search?q=coffee&page=3').data
+    assert first.count(b'<mark>Coffee</mark>') == 2
+    assert b'More results' in first
+    assert last.count(b'<mark>Coffee</mark>') == 1
+    assert b'More results' not in last
+    assert client.get('/entries/search?q=coffee&page=0').status_code == 400
+
+def test_deleted_entries_leave_index(client, auth, app):
+    """Deleting an entry removes it from search results."""
+    auth.register()
+    auth.login()
+    add_entries(app, ['Ephemeral thought'])
+
+    client.post('/entries/1/delete')
+    response = client.get('/entries/search?q=ephemeral')
+    assert b'No matching entries' in response.data
+
+def test_rebuild_search_command(runner, app):
+    """The rebuild command re-indexes entries written without the triggers."""
+    with app.app_context():
+        db = get_db()
+        db.execute('DROP TRIGGER entries_fts_insert')
+        db.execute("INSERT INTO entries (user_id, text) VALUES (1, 'Imported quietly')")
+        db.commit()
+
+    result = runner.invoke(args=['rebuild-search'])
+    assert 'Rebuilt the search index' in result.output
+
+    with app.app_context():
+        count = get_db().execute(
+            "SELECT COUNT(*) FROM entries_fts WHERE entries_fts MATCH 'quietly'"
+        ).fetchone()[0]
+    assert count == 1
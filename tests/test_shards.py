@@ -0,0 +1,154 @@
+import os
+import pytest
+from app import analysis, compaction, fragments, shards
+from app.db import (
+    get_db, get_schema_version, get_shard, list_migrations, shard_of, shard_path,
+)
+
+@pytest.fixture
+def app(app_factory, tmp_path):
+    """An app spreading users over three shard files."""
+    return app_factory(
+        DATABASE=str(tmp_path / 'main.db'), DATABASE_SHARDS=3, ANALYZER='lexicon',
+    )
+
+def sign_up(client, username):
+    client.get('/auth/logout')
+    client.post('/auth/register', data={'username': username, 'password': 'pw'})
+    client.post('/auth/login', data={'username': username, 'password': 'pw'})
+
+def count(db, table):
+    return db.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+
+def test_shard_files_named_after_database(app, tmp_path):
+    """Every shard gets its own file with the latest schema."""
+    with app.app_context():
+        latest = list_migrations()[-1][0]
+        for index in range(3):
+            assert shard_path(app.config, index) == str(tmp_path / f'main.shard{index}.db')
+            assert get_schema_version(get_shard(index)) == latest
+    assert os.path.exists(tmp_path / 'main.shard2.db')
+
+def test_users_entries_live_on_their_shard(app, client):
+    """Entries go to the author's shard and stay invisible to other users."""
+    for name in ('ann', 'bob'):
+        sign_up(client, name)
+        client.post('/entries/add', data={'text': f'Entry by {name}, feeling happy'})
+
+    with app.app_context():
+        assert shard_of(1) == 1 and shard_of(2) == 2
+        assert count(get_db(), 'entries') == 0
+        assert count(get_shard(1), 'entries') == 1
+        assert count(get_shard(2), 'entries') == 1
+
+    # Both entries have id 1 on their own shard
+    page = client.get('/entries/list').data
+    assert b'Entry by bob' in page and b'Entry by ann' not in page
+    assert client.get('/entries/search?q=happy').status_code == 200
+    assert client.post('/entries/1/delete').status_code == 302
+    with app.app_context():
+        assert count(get_shard(1), 'entries') == 1
+        assert count(get_shard(2), 'entries') == 0
+
+def test_workers_drain_every_shard(app):
+    """Queued analyses on all shards are picked up."""
+    with app.app_context():
+        for user_id in (1, 2, 3):
+            db = get_db(user_id)
+            cursor = db.execute(
+                'INSERT INTO entries (user_id, text) VALUES (?, ?)', (user_id, 'so tired')
+            )
+            analysis.enqueue(db, cursor.lastrowid)
+            db.commit()
+        assert analysis.run_pending() == 3
+        for index in range(3):
+            assert count(get_shard(index), 'analysis_jobs') == 0
+
+def test_move_user_keeps_journal(app, client):
+    """A moved user keeps their entries, queue, rollups and a fresh ETag."""
+    sign_up(client, 'ann')
+    client.post('/entries/add', data={'text': 'I feel calm and happy today'})
+    with app.app_context():
+        db = get_db(1)
+        analysis.enqueue(db, 1)
+        db.commit()
+    client.get('/entries/list')  # consume the flash
+    etag = client.get('/entries/list').headers['ETag']
+
+    with app.app_context():
+        assert shards.move_user(1, 0) == 1
+        assert count(get_shard(1), 'entries') == 0
+        assert count(get_shard(1), 'mood_daily') == count(get_shard(1), 'mood_daily WHERE count > 0') == 0
+        assert count(get_shard(0), 'entries') == 1
+        assert count(get_shard(0), 'analysis_jobs') == 1
+        assert count(get_shard(0), 'mood_daily') == 1
+
+    response = client.get('/entries/list', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert b'I feel calm and happy today' in response.data
+    assert b'calm' in client.get('/entries/search?q=calm').data
+    with app.app_context():
+        assert shard_of(1) == 0
+
+def test_move_user_keeps_compressed_entries_searchable(app, client):
+    """Compressed text is indexed on the new shard and unindexed on the old."""
+    sign_up(client, 'ann')
+    client.post('/entries/add', data={'text': 'A long walk by the river ' * 200})
+    with app.app_context():
+        compaction.compact(get_db(1), min_age_days=30, min_size=100)
+        assert shards.move_user(1, 0) == 1
+        for index in (0, 1):
+            get_shard(index).execute(
+                "INSERT INTO entries_fts (entries_fts) VALUES ('integrity-check')"
+            )
+    assert b'<mark>river</mark>' in client.get('/entries/search?q=river').data
+
+def test_moved_user_never_gets_another_entrys_card(app, client, monkeypatch):
+    """Cards a worker cached before a move miss once ids are renumbered."""
+    sign_up(client, 'bob')
+    client.post('/entries/add', data={'text': 'Bob on shard one'})
+    sign_up(client, 'ann')
+    with app.app_context():
+        db = get_db(2)
+        db.executemany(
+            "INSERT INTO entries (user_id, text, timestamp) VALUES (2, ?, '2024-01-01 09:00:00')",
+            [('First of two',), ('Second of two',)]
+        )
+        db.commit()
+    client.get('/entries/list')
+
+    # Another worker's cache is not reached by the move
+    monkeypatch.setattr(fragments, 'discard', lambda *args: None)
+    with app.app_context():
+        assert shards.move_user(2, 1) == 2
+        moved = [row['id'] for row in get_shard(1).execute(
+            'SELECT id FROM entries WHERE user_id = 2 ORDER BY id')]
+    assert moved == [2, 3]
+
+    page = client.get('/entries/list').data
+    assert b'First of two' in page and b'Second of two' in page
+
+def test_plan_moves_evens_out_shards():
+    """Big journals move off the fullest shard; dropped shards are emptied."""
+    loads = {0: {1: 50, 4: 30, 7: 5}, 1: {2: 10}, 2: {3: 8}, 3: {9: 4}}
+    moves = shards.plan_moves(loads, 3)
+    assert moves[0] == (9, 3, 2)
+    totals = {0: 85, 1: 10, 2: 12}
+    for user_id, source, target in moves[1:]:
+        size = next(journal[user_id] for journal in loads.values() if user_id in journal)
+        totals[source] -= size
+        totals[target] += size
+    assert max(totals.values()) - min(totals.values()) < 50
+    assert shards.plan_moves({0: {1: 10}, 1: {2: 9}}, 2) == []
+
+def test_rebalance_command(app, client, runner):
+    """The CLI moves a named user, or plans moves for everyone."""
+    sign_up(client, 'ann')
+    client.post('/entries/add', data={'text': 'First'})
+
+    result = runner.invoke(args=['rebalance-shards', '--user', 'ann', '--to', '2'])
+    assert 'Moved user 1 (1 entries) from shard 1 to 2.' in result.output
+    result = runner.invoke(args=['rebalance-shards', '--user', 'ann', '--to', '7'])
+    assert result.exit_code != 0
+    result = runner.invoke(args=['rebalance-shards', '--dry-run'])
+    assert 'Shards are balanced.' in result.output
@@ -0,0 +1,187 @@
+import json
+import time
+import pytest
+from app import gemini, resilience
+from app.db import get_db
+
+RESPONSE = ['MOOD: cal', 'm\nREFLECTION: You ', 'took time ', 'to rest.', '\n']
+
+class StreamingChatModel:
+    """Stand-in for ChatGoogleGenerativeAI that streams RESPONSE piece by piece."""
+    delay = 0.0
+    streams = 0
+
+    def __init__(self, model, api_key, temperature, **options):
+        self.model = model
+
+    def stream(self, prompt):
+        StreamingChatModel.streams += 1
+        for piece in RESPONSE:
+            time.sleep(StreamingChatModel.delay)
+
+            class Chunk:
+                content = piece
+            yield Chunk()
+
+@pytest.fixture
+def streaming_model(monkeypatch):
+    monkeypatch.setenv('GEMINI_API_KEY', 'test-key')
+    monkeypatch.setattr(gemini, 'ChatGoogleGenerativeAI', StreamingChatModel)
+    StreamingChatModel.delay = 0.0
+    StreamingChatModel.streams = 0
+    gemini.close_clients()
+    yield StreamingChatModel
+    gemini.close_clients()
+
+def read_events(response):
+    """Parse a text/event-stream body into (event, data) pairs."""
+    events = []
+    for block in response.get_data(as_text=True).split('\n\n'):
+        lines = dict(line.split(': ', 1) for line in block.splitlines()
+                     if not line.startswith(':'))
+        if lines:
+            events.append((lines['event'], json.loads(lines['data'])))
+    return events
+
+def add_entry(client, auth, app, text='I finally rested today.'):
+    app.config['ANALYSIS_STREAMING'] = True
+    auth.register()
+    auth.login()
+    client.post('/entries/add', data={'text': text})
+
+def test_parser_emits_events_as_lines_complete():
+    """The mood comes once its line ends; the reflection as it grows."""
+    parser = gemini.StreamParser()
+    events = [event for piece in RESPONSE for event in parser.feed(piece)]
+    assert events == [
+        ('mood', 'calm'), ('reflection', 'You '), ('reflection', 'took time '),
+        ('reflection', 'to rest.'),
+    ]
+    events, analysis, parsed = parser.finish()
+    assert events == []
+    assert analysis == {'mood': 'calm', 'reflection': 'You took time to rest.'}
+    assert parsed
+
+def test_new_entry_waits_for_the_page(client, auth, app):
+    """With streaming on, new jobs are held back and the page links the stream."""
+    add_entry(client, auth, app)
+    with app.app_context():
+        job = get_db().execute('SELECT run_after FROM analysis_jobs').fetchone()
+    assert job['run_after'] > time.time() + 5
+    assert b'data-stream-url="/entries/1/analysis/stream"' in client.get('/entries/list').data
+
+def test_only_the_new_entry_is_streamed(client, auth, app):
+    """Older pending entries and later page views open no streams."""
+    add_entry(client, auth, app, 'First')
+    client.post('/entries/add', data={'text': 'Second'})
+
+    page = client.get('/entries/list').data
+    assert page.count(b'data-stream-url=') == 1
+    assert b'data-stream-url="/entries/2/analysis/stream"' in page
+    assert b'data-stream-url=' not in client.get('/entries/list').data
+    assert b'data-stream-url=' not in client.get('/entries/list.json').data
+
+def test_stream_delivers_and_stores_analysis(client, auth, app, streaming_model):
+    """The endpoint streams mood and reflection, then stores the result."""
+    add_entry(client, auth, app)
+    response = client.get('/entries/1/analysis/stream')
+    assert response.mimetype == 'text/event-stream'
+    assert response.headers['Cache-Control'] == 'no-cache'
+
+    events = read_events(response)
+    assert events[0] == ('mood', {'mood': 'calm'})
+    assert ''.join(data['text'] for event, data in events if event == 'reflection') \
+        == 'You took time to rest.'
+    assert events[-1] == ('done', {
+        'mood': 'calm', 'reflection': 'You took time to rest.',
+        'status': 'ok', 'pending': False,
+    })
+
+    with app.app_context():
+        db = get_db()
+        assert db.execute('SELECT COUNT(*) FROM analysis_jobs').fetchone()[0] == 0
+        assert db.execute('SELECT mood FROM entries').fetchone()['mood'] == 'calm'
+
+    # A second look replays what is stored without asking Gemini again
+    assert read_events(client.get('/entries/1/analysis/stream'))[-1][1]['mood'] == 'calm'
+    assert streaming_model.streams == 1
+
+def test_first_event_before_response_finishes(client, auth, app, streaming_model):
+    """The mood reaches the browser well before the whole answer is written."""
+    add_entry(client, auth, app)
+    streaming_model.delay = 0.1
+
+    start = time.perf_counter()
+    response = client.get('/entries/1/analysis/stream', buffered=False)
+    body = iter(response.response)
+    first = b''
+    while b'event: mood' not in first:
+        first += next(body)
+    first_at = time.perf_counter() - start
+    for _ in body:
+        pass
+    total = time.perf_counter() - start
+    response.close()
+
+    assert first_at < total / 2
+
+def test_leaving_early_hands_job_back(client, auth, app, streaming_model):
+    """A viewer who closes the page mid-stream leaves the job to the workers."""
+    add_entry(client, auth, app)
+    response = client.get('/entries/1/analysis/stream', buffered=False)
+    next(iter(response.response))
+    response.close()
+
+    with app.app_context():
+        job = get_db().execute(
+            'SELECT locked_at, attempts, run_after FROM analysis_jobs'
+        ).fetchone()
+    assert job['locked_at'] is None
+    assert job['attempts'] == 0
+    assert job['run_after'] <= time.time()
+
+def test_stream_of_another_users_entry(client, auth, app):
+    """Only the author may stream an entry's analysis."""
+    add_entry(client, auth, app)
+    auth.logout()
+    auth.register('other', 'pw')
+    auth.login('other', 'pw')
+    assert client.get('/entries/1/analysis/stream').status_code == 403
+    assert client.get('/entries/99/analysis/stream').status_code == 404
+
+def test_guarded_stream_deadline():
+    """The deadline covers the whole stream, and the slot is given back."""
+    guard = resilience.CallGuard(timeout=0.2)
+
+    def slow():
+        for n in range(5):
+            time.sleep(0.1)
+            yield n
+
+    with pytest.raises(resilience.DeadlineExceeded):
+        list(guard.stream(slow))
+    time.sleep(0.2)
+    assert guard.limiter.in_flight == 0
+    assert guard.breaker.failures == 1
+    guard.shutdown()
+
+def test_closed_stream_is_neither_success_nor_failure():
+    """A client hanging up releases the slot and probe without an outcome."""
+    breaker = resilience.CircuitBreaker(threshold=1, cooldown=0.05)
+    guard = resilience.CallGuard(timeout=1.0, breaker=breaker)
+    breaker.failure()
+    time.sleep(0.06)
+
+    stream = guard.stream(lambda: iter(range(5)))
+    assert next(stream) == 0
+    assert breaker.state == 'half-open'
+    limit = guard.limiter.limit
+    stream.close()
+
+    assert guard.limiter.in_flight == 0
+    assert guard.limiter.limit == limit
+    # Still waiting on a real outcome: open, but the next call may probe
+    assert breaker.failures == 1
+    assert breaker.state == 'half-open'
+    assert breaker.allow()
+    guard.shutdown()